@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# Measures the cost of common Driver operations on each browser backend,
+# against local fake browser endpoints, so the backends can be compared
+# without Chrome or a network connection.
+#
+# Usage: python3 -m benchmarks.bench_backends [-n 200] [--latency 0] [--output results.json]
+
+import argparse
+import json
+import tempfile
+import time
+
+from tidal_chrome import preferences, tidal_chrome_driver
+
+from .fake_cdp import FakeCDPServer
+from .fake_chromedriver import ChromedriverControl, write_launcher
+from .fake_tidal import FakeTidal
+
+
+def _cdp(page: FakeTidal, latency: float, prefs):
+    from tidal_chrome.backends.cdp_backend import CDPBackend
+    server = FakeCDPServer(page, latency).start()
+    return CDPBackend(prefs, server.address), server
+
+
+def _selenium(page: FakeTidal, latency: float, prefs):
+    from tidal_chrome.backends.selenium_backend import SeleniumBackend
+    # selenium starts chromedriver itself, so the player runs in the fake chromedriver's process
+    prefs.values["chromedriver_binary_path"] = write_launcher(tempfile.mkdtemp(), latency, page.track_duration)
+    backend = SeleniumBackend(prefs)
+    return backend, ChromedriverControl("127.0.0.1:%d" % backend.webdriver.service.port)
+
+
+# name: function(page, latency, prefs) returning (backend, server)
+BACKENDS = {
+    "cdp": _cdp,
+    "selenium": _selenium,
+}
+
+OPERATIONS = {
+    "snapshot": lambda d: d.snapshot(),
+    "is_shuffle": lambda d: d.is_shuffle(),
+    "current_track_title": lambda d: d.current_track_title(),
+    "next": lambda d: d.next(),
+    "set_position": lambda d: d.set_position(30000000, 180000000),
+}
+
+
+def _errorhandler(err: str):
+    print("Element not found: " + err)
+
+
+def run(n: int, latency: float, backends=None) -> dict:
+    """
+    Run every operation n times on each backend.
+    :param n: Number of calls per operation.
+    :param latency: Simulated browser latency per command in seconds.
+    :param backends: Names of the backends to run, or None for all of them.
+    :return: {backend: {operation: {"mean_ms", "min_ms", "max_ms", "commands_per_call"}}}
+    """
+    prefs = preferences.Preferences(True)
+    results = {}
+    for name in backends or BACKENDS:
+        backend, server = BACKENDS[name](FakeTidal(), latency, prefs)
+        driver = tidal_chrome_driver.Driver(prefs, _errorhandler, backend)
+        results[name] = {}
+        for op, fn in OPERATIONS.items():
+            fn(driver)
+            commands = server.commands
+            times = []
+            for _ in range(n):
+                start = time.perf_counter()
+                fn(driver)
+                times.append(time.perf_counter() - start)
+            results[name][op] = {"mean_ms": sum(times) / n * 1000,
+                                 "min_ms": min(times) * 1000,
+                                 "max_ms": max(times) * 1000,
+                                 "commands_per_call": (server.commands - commands) / n}
+        driver.quit()
+        server.shutdown()
+    return results
+
+
+if __name__ == '__main__':
+    par = argparse.ArgumentParser(description="Compare Driver backends against fake browser endpoints")
+    par.add_argument('-n', type=int, default=200, help='Calls per operation.')
+    par.add_argument('--latency', type=float, default=0.0, help='Simulated browser latency per command in seconds.')
+    par.add_argument('--backend', action='append', choices=list(BACKENDS), help='Backend to run (default: all).')
+    par.add_argument('--output', metavar='FILE', help='Write the results as JSON to FILE.')
+    args = par.parse_args()
+    res = run(args.n, args.latency, args.backend)
+    for b, ops in res.items():
+        for op, r in ops.items():
+            print("%-8s %-22s %8.3f ms  %5.1f commands" % (b, op, r["mean_ms"], r["commands_per_call"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(res, f, indent=2)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# Measures the import time of the tidal-chrome launcher, which is paid on
+# every launch from the .desktop file or tidal:// handler, and checks that it
+# does not pull in the modules only needed by the server. If dbus-python and
+# dbus-daemon are installed, also times the whole forward path of
+# launcher.main(), including import dbus, against a private session bus on
+# which a stub owns the bridge's name. Exits with status 1 if the budget is
+# exceeded or a heavy module is imported.
+#
+# Usage: python3 -m benchmarks.bench_imports [-n 10] [--budget 50] [--output results.json]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+MODULE = "tidal_chrome.launcher"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules which must only be imported once the process becomes the server
+HEAVY = ("selenium", "gi", "IPython", "tidal_chrome.mpris", "tidal_chrome.cli", "tidal_chrome.tidal_chrome_driver")
+
+
+def _importtime(args: list, env: dict = None) -> dict:
+    """
+    Run a fresh interpreter with -X importtime.
+    :param args: Arguments to the interpreter, e.g. ["-c", "import os"].
+    :param env: Environment of the interpreter, or None for this one's.
+    :return: {module name: cumulative import time in microseconds}
+    """
+    r = subprocess.run([sys.executable, "-X", "importtime"] + args,
+                       cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True,
+                       check=True)
+    times = {}
+    for line in r.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        times[parts[2].strip()] = int(parts[1])
+    return times
+
+
+def _summary(values: list) -> dict:
+    return {"mean": sum(values) / len(values), "min": min(values), "max": max(values)}
+
+
+def _heavy(times: dict) -> list:
+    return sorted(m for m in times if m.split(".")[0] in HEAVY or m in HEAVY)
+
+
+def _forward(n: int) -> dict:
+    """
+    Run launcher.main() with a URI n times, each in a new interpreter, while a
+    stub owns the bridge's name on a private session bus, so that every run
+    takes the forward path and exits.
+    :return: {"total_ms": {"mean", "min", "max"}, "dbus_import_ms": {...}, "heavy": [modules]},
+    or None if dbus-python or dbus-daemon is not installed.
+    """
+    try:
+        import dbus
+        from .bench_mpris import start_bus
+        daemon, address = start_bus()
+    except (ImportError, RuntimeError) as e:
+        print("Not timing the forward path: %s" % e)
+        return None
+    from tidal_chrome import BUS_NAME
+
+    totals = []
+    dbus_imports = []
+    heavy = set()
+    try:
+        stub = dbus.bus.BusConnection(address)
+        stub.request_name(BUS_NAME)
+        env = dict(os.environ, DBUS_SESSION_BUS_ADDRESS=address)
+        for _ in range(n):
+            start = time.perf_counter()
+            times = _importtime(["-m", MODULE, "tidal://track/1"], env)
+            totals.append((time.perf_counter() - start) * 1000)
+            dbus_imports.append(times.get("dbus", 0) / 1000)
+            heavy.update(_heavy(times))
+        stub.close()
+    finally:
+        daemon.kill()
+    return {"total_ms": _summary(totals), "dbus_import_ms": _summary(dbus_imports), "heavy": sorted(heavy)}
+
+
+def run(n: int) -> dict:
+    """
+    Import the launcher n times, each in a new interpreter, then time the forward path.
+    :param n: Number of runs.
+    :return: {"import_ms": {"mean", "min", "max"}, "startup_ms": {...}, "slowest": [[module, ms], ...],
+    "heavy": [modules], "forward": results of _forward}
+    """
+    imports = []
+    startups = []
+    times = {}
+    for _ in range(n):
+        start = time.perf_counter()
+        times = _importtime(["-c", "import " + MODULE])
+        startups.append((time.perf_counter() - start) * 1000)
+        imports.append(times[MODULE] / 1000)
+    own = {m: t for m, t in times.items() if not m.startswith(MODULE)}
+    return {"import_ms": _summary(imports),
+            "startup_ms": _summary(startups),
+            "slowest": [[m, t / 1000] for m, t in sorted(own.items(), key=lambda x: -x[1])[:10]],
+            "heavy": _heavy(times),
+            "forward": _forward(n)}
+
+
+if __name__ == '__main__':
+    par = argparse.ArgumentParser(description="Measure the import time of the tidal-chrome launcher")
+    par.add_argument('-n', type=int, default=10, help='Number of runs.')
+    par.add_argument('--budget', type=float, default=50, help='Maximum mean import time in ms.')
+    par.add_argument('--output', metavar='FILE', help='Write the results as JSON to FILE.')
+    args = par.parse_args()
+    res = run(args.n)
+    print("import %s: %.1f ms (min %.1f, max %.1f); interpreter start-up and import: %.1f ms" % (
+        MODULE, res["import_ms"]["mean"], res["import_ms"]["min"], res["import_ms"]["max"],
+        res["startup_ms"]["mean"]))
+    for m, t in res["slowest"]:
+        print("  %-40s %7.2f ms" % (m, t))
+    fwd = res["forward"]
+    if fwd is not None:
+        print("forward a URI to a running bridge: %.1f ms (min %.1f, max %.1f), of which import dbus: %.1f ms" % (
+            fwd["total_ms"]["mean"], fwd["total_ms"]["min"], fwd["total_ms"]["max"], fwd["dbus_import_ms"]["mean"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(res, f, indent=2)
+    failed = False
+    heavy = sorted(set(res["heavy"]) | set(fwd["heavy"] if fwd is not None else ()))
+    if heavy:
+        print("Heavy modules imported: " + ", ".join(heavy))
+        failed = True
+    if res["import_ms"]["mean"] > args.budget:
+        print("Import time exceeds the budget of %.1f ms" % args.budget)
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# Measures the MPRIS object end to end over D-Bus, against a fake Driver, on
+# a private dbus-daemon session bus. The bridge runs in a child process, as it
+# would in use, and is measured with:
+# - tick cost, from the bridge's own metrics (org.tidalchrome.Debug);
+# - media key latency: the time from a PlayPause or Next call to its reply;
+# - Get/GetAll throughput and latency with many concurrent clients;
+# - the number of signals sent per hour of playback with no user input.
+# Every measurement is run once with a driver which can wait for changes
+# beside other calls, as the cdp backend, and once with one which cannot, as
+# selenium, so that the bridge falls back to polling.
+# Needs dbus-python, PyGObject and dbus-daemon, but no browser or network.
+#
+# Usage: python3 -m benchmarks.bench_mpris [--latency 0.005] [--clients 20] [--tracks tracks.json]
+#                                          [--wait concurrent|serial] [--output results.json]
+#
+# The play queue is 50 generated tracks, or the JSON list of
+# [track id, title, [artists]] given with --tracks, e.g.
+#   [["1001", "First", ["Artist A"]], ["1002", "Second", ["Artist A", "Artist B"]]]
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Maximum time in seconds for the bus and the bridge to start
+START_TIMEOUT = 10
+# name: whether the fake Driver can wait for changes beside other calls
+WAITS = {"concurrent": True, "serial": False}
+
+
+def _percentiles(times: list) -> dict:
+    """
+    :param times: Durations in seconds.
+    :return: {"mean", "p50", "p95", "max"} in milliseconds.
+    """
+    if not times:
+        return {}
+    s = sorted(times)
+    return {"mean": sum(s) / len(s) * 1000,
+            "p50": s[len(s) // 2] * 1000,
+            "p95": s[min(len(s) - 1, int(len(s) * 0.95))] * 1000,
+            "max": s[-1] * 1000}
+
+
+def start_bus():
+    """
+    Start a private session bus.
+    :return: The dbus-daemon process and the bus address.
+    """
+    daemon = os.environ.get("DBUS_DAEMON") or shutil.which("dbus-daemon")
+    if daemon is None:
+        raise RuntimeError("dbus-daemon was not found. Set DBUS_DAEMON to its path")
+    p = subprocess.Popen([daemon, "--session", "--nofork", "--print-address=1"],
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    address = p.stdout.readline().strip()
+    if not address:
+        p.kill()
+        raise RuntimeError("dbus-daemon did not start")
+    return p, address
+
+
+def load_tracks(path: str) -> list:
+    """
+    Read a play queue for the fake player.
+    :param path: JSON file holding a list of [track id, title, [artists]].
+    :return: A list of (track id, title, artists) tuples.
+    """
+    with open(path) as f:
+        tracks = json.load(f)
+    if not isinstance(tracks, list) or not tracks:
+        raise ValueError(path + " must hold a non-empty list of tracks")
+    return [(str(t[0]), str(t[1]), [str(a) for a in t[2]]) for t in tracks]
+
+
+def serve(latency: float, track_duration: float, update_mode: str, tracks: list = None,
+          concurrent_wait: bool = True) -> None:
+    """
+    Run the bridge with a fake Driver on the session bus until it is quit.
+    :param tracks: The play queue as (track id, title, artists) tuples, or None for the default one.
+    :param concurrent_wait: Whether the fake Driver can wait for changes beside other calls.
+    """
+    import dbus
+    from dbus.mainloop.glib import DBusGMainLoop
+    from gi.repository import GLib
+
+    from tidal_chrome import mpris, preferences
+
+    from .fake_driver import FakeDriver
+    from .fake_tidal import FakeTidal
+
+    DBusGMainLoop(set_as_default=True)
+    prefs = preferences.Preferences(True)
+    prefs.values["art_cache_max_bytes"] = 0
+    prefs.values["update_mode"] = update_mode
+    page = FakeTidal(tracks, track_duration)
+    loop = GLib.MainLoop()
+    mpris.MPRIS(False, dbus.SessionBus(), loop, prefs,
+                lambda p, errorhandler, metrics: FakeDriver(page, latency, metrics, concurrent_wait))
+    loop.run()
+
+
+class _Bridge:
+
+    def __init__(self, address: str, args, wait: str):
+        env = dict(os.environ, DBUS_SESSION_BUS_ADDRESS=address)
+        command = [sys.executable, "-m", "benchmarks.bench_mpris", "--serve",
+                   "--latency", str(args.latency),
+                   "--track-duration", str(args.track_duration),
+                   "--update-mode", args.update_mode,
+                   "--wait", wait]
+        if args.tracks:
+            command += ["--tracks", os.path.abspath(args.tracks)]
+        self.process = subprocess.Popen(command, cwd=ROOT, env=env)
+
+    def stop(self, bus) -> None:
+        from tidal_chrome import BUS_NAME, OPATH, BASE_IFACE
+        try:
+            bus.call_blocking(BUS_NAME, OPATH, BASE_IFACE, "Quit", "", [], timeout=5)
+        except Exception:
+            # Quit exits before replying
+            pass
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def _wait_for_name(bus, name: str) -> None:
+    deadline = time.monotonic() + START_TIMEOUT
+    while not bus.name_has_owner(name):
+        if time.monotonic() > deadline:
+            raise RuntimeError("The bridge did not start")
+        time.sleep(0.05)
+
+
+def _media_keys(bus, n: int) -> dict:
+    from tidal_chrome import BUS_NAME, OPATH, PLAYER_IFACE
+    results = {}
+    for method in ("PlayPause", "Next"):
+        times = []
+        for _ in range(n):
+            start = time.perf_counter()
+            bus.call_blocking(BUS_NAME, OPATH, PLAYER_IFACE, method, "", [])
+            times.append(time.perf_counter() - start)
+            # Leave room for the command coalescer, so every call is measured on its own
+            time.sleep(0.2)
+        results[method] = _percentiles(times)
+    return results
+
+
+def _throughput(address: str, clients: int, seconds: float) -> dict:
+    import dbus
+    from tidal_chrome import BUS_NAME, OPATH, PLAYER_IFACE
+
+    times = {"Get": [], "GetAll": []}
+    errors = Counter()
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients)
+
+    def client():
+        bus = dbus.bus.BusConnection(address)
+        local = {"Get": [], "GetAll": []}
+        start_barrier.wait()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            for method, sig, args in (("Get", "ss", [PLAYER_IFACE, "PlaybackStatus"]),
+                                      ("GetAll", "s", [PLAYER_IFACE])):
+                start = time.perf_counter()
+                try:
+                    bus.call_blocking(BUS_NAME, OPATH, dbus.PROPERTIES_IFACE, method, sig, args, timeout=10)
+                except dbus.exceptions.DBusException as e:
+                    with lock:
+                        errors[e.get_dbus_name()] += 1
+                    continue
+                local[method].append(time.perf_counter() - start)
+        bus.close()
+        with lock:
+            for k, v in local.items():
+                times[k].extend(v)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return {"clients": clients,
+            "calls_per_second": sum(len(v) for v in times.values()) / seconds,
+            "Get_ms": _percentiles(times["Get"]),
+            "GetAll_ms": _percentiles(times["GetAll"]),
+            "errors": dict(errors)}
+
+
+def run_wait(args, wait: str) -> dict:
+    """
+    Start a private bus and the bridge, and run every measurement.
+    :param wait: A WAITS key, selecting the kind of fake Driver.
+    :return: {"signals", "media_keys_ms", "properties", "bridge"}
+    """
+    import dbus
+    from dbus.mainloop.glib import DBusGMainLoop
+    from gi.repository import GLib
+
+    from tidal_chrome import BUS_NAME, OPATH, DEBUG_IFACE
+
+    DBusGMainLoop(set_as_default=True)
+    daemon, address = start_bus()
+    bridge = None
+    loop = GLib.MainLoop()
+    try:
+        bus = dbus.bus.BusConnection(address)
+        signals = Counter()
+        # Also keeps the bridge polling, as a client is listening
+        bus.add_signal_receiver(lambda *a, **kw: signals.update([kw["member"]]), bus_name=BUS_NAME, path=OPATH,
+                                member_keyword="member")
+        threading.Thread(target=loop.run, daemon=True).start()
+
+        bridge = _Bridge(address, args, wait)
+        _wait_for_name(bus, BUS_NAME)
+
+        # Playback with no user input
+        time.sleep(args.duration)
+        counts = dict(signals)
+        results = {"signals": {"seconds": args.duration,
+                               "counts": counts,
+                               "per_hour": sum(counts.values()) * 3600 / args.duration},
+                   "media_keys_ms": _media_keys(bus, args.n),
+                   "properties": _throughput(address, args.clients, args.throughput_duration)}
+
+        stats = bus.call_blocking(BUS_NAME, OPATH, DEBUG_IFACE, "GetStats", "", [])
+        stats = {str(k): float(v) for k, v in stats.items()}
+        ticks = stats.get("tidal_chrome_tick_seconds_count", 0)
+        results["bridge"] = {"ticks": ticks,
+                             "tick_mean_ms": stats.get("tidal_chrome_tick_seconds_sum", 0) / ticks * 1000
+                             if ticks else None,
+                             "stats": stats}
+        bridge.stop(bus)
+        bridge = None
+    finally:
+        if bridge is not None:
+            bridge.process.kill()
+        loop.quit()
+        daemon.kill()
+    return results
+
+
+def run(args) -> dict:
+    """
+    Run every measurement with each kind of fake Driver selected by args.wait.
+    :return: {"config", "runs": {wait: results of run_wait}}
+    """
+    results = {"runs": {wait: run_wait(args, wait) for wait in args.wait or WAITS}}
+    results["config"] = {"latency": args.latency,
+                         "track_duration": args.track_duration,
+                         "update_mode": args.update_mode,
+                         "tracks": args.tracks,
+                         "clients": args.clients,
+                         "python": sys.version.split()[0],
+                         "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    try:
+        results["config"]["commit"] = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, check=True,
+                                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                                     universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return results
+
+
+if __name__ == '__main__':
+    par = argparse.ArgumentParser(description="Benchmark the MPRIS bridge over a private D-Bus session")
+    par.add_argument('-n', type=int, default=20, help='Media key presses per method.')
+    par.add_argument('--latency', type=float, default=0.005, help='Delay in seconds of every fake Driver call.')
+    par.add_argument('--track-duration', type=float, default=20, help='Duration of every track in seconds.')
+    par.add_argument('--update-mode', choices=("observer", "poll"), default="observer")
+    par.add_argument('--wait', action='append', choices=list(WAITS),
+                     help='Kind of fake Driver to run against (default: all). "serial" cannot wait for changes '
+                          'beside other calls, so the bridge polls.')
+    par.add_argument('--tracks', metavar='FILE',
+                     help='JSON list of [track id, title, [artists]] to use as the play queue.')
+    par.add_argument('--duration', type=float, default=60, help='Seconds of playback to count signals over.')
+    par.add_argument('--clients', type=int, default=20, help='Concurrent Get/GetAll clients.')
+    par.add_argument('--throughput-duration', type=float, default=10, help='Seconds to run the clients for.')
+    par.add_argument('--output', metavar='FILE', help='Write the results as JSON to FILE.')
+    par.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = par.parse_args()
+    if args.serve:
+        serve(args.latency, args.track_duration, args.update_mode,
+              load_tracks(args.tracks) if args.tracks else None,
+              WAITS[args.wait[0]] if args.wait else True)
+        sys.exit(0)
+    if args.tracks:
+        # Fail before starting the bus if the file is invalid
+        load_tracks(args.tracks)
+    res = run(args)
+    for wait, r in res["runs"].items():
+        print("%s wait:" % wait)
+        print("  Signals: %.0f per hour of playback %s" % (r["signals"]["per_hour"], r["signals"]["counts"]))
+        if r["bridge"]["tick_mean_ms"] is not None:
+            print("  Tick: %.3f ms mean over %d ticks" % (r["bridge"]["tick_mean_ms"], r["bridge"]["ticks"]))
+        for method, k in r["media_keys_ms"].items():
+            print("  %-10s %8.3f ms mean  %8.3f ms p95" % (method, k["mean"], k["p95"]))
+        p = r["properties"]
+        print("  Get/GetAll: %.0f calls/s with %d clients; Get p95 %.3f ms, GetAll p95 %.3f ms" % (
+            p["calls_per_second"], p["clients"], p["Get_ms"].get("p95", 0), p["GetAll_ms"].get("p95", 0)))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(res, f, indent=2)
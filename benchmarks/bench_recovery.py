@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# Measures how the bridge recovers from a lost browser, running its tick loop
+# with the selenium backend against the fake chromedriver, on a private
+# dbus-daemon session bus:
+# - "chrome not reachable" must make the supervisor start a new browser, after
+#   which the bridge carries on ticking. The recovery time is from the fault
+#   to the end of the restart, as counted by the bridge's own metrics;
+# - "window already closed" must make the bridge quit;
+# - the HTTP round-trip time to the fake chromedriver, without any browser
+#   work, and the mean time it spends on each of the bridge's commands.
+# Needs dbus-python, PyGObject, selenium and dbus-daemon, but no browser or network.
+#
+# Usage: python3 -m benchmarks.bench_recovery [-n 3] [--latency 0.002] [--output results.json]
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from .bench_mpris import START_TIMEOUT, _percentiles, _wait_for_name, start_bus
+from .fake_chromedriver import ChromedriverControl, write_launcher
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Maximum time in seconds for the bridge to restart the browser or quit
+RECOVERY_TIMEOUT = 60
+RESTARTS = 'tidal_chrome_browser_restarts_total{result="ok"}'
+# Maximum time in seconds between two ticks, with the player paused or playing
+TICK_TIMEOUT = 20
+
+
+def serve(latency: float, track_duration: float, address_file: str) -> None:
+    """
+    Run the bridge with the selenium backend and the fake chromedriver on the
+    session bus until it quits.
+    :param address_file: File the fake chromedriver writes its address to.
+    """
+    import dbus
+    from dbus.mainloop.glib import DBusGMainLoop
+    from gi.repository import GLib
+
+    from tidal_chrome import mpris, preferences
+
+    DBusGMainLoop(set_as_default=True)
+    prefs = preferences.Preferences(True)
+    prefs.values["backend"] = "selenium"
+    prefs.values["persistent_browser"] = False
+    prefs.values["restart_browser"] = True
+    prefs.values["art_cache_max_bytes"] = 0
+    prefs.values["chromedriver_binary_path"] = write_launcher(os.path.dirname(address_file), latency,
+                                                              track_duration, address_file)
+    loop = GLib.MainLoop()
+    mpris.MPRIS(False, dbus.SessionBus(), loop, prefs)
+    loop.run()
+
+
+def _address(path: str, old: str = None, timeout: float = START_TIMEOUT) -> str:
+    """
+    Wait for a fake chromedriver to start.
+    :param old: The address of the previous one, to wait for its replacement.
+    :return: The host:port of the server.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with open(path) as f:
+                address = f.read().strip()
+        except OSError:
+            address = ""
+        if address and address != old:
+            return address
+        if time.monotonic() > deadline:
+            raise RuntimeError("The fake chromedriver did not start")
+        time.sleep(0.05)
+
+
+def _stats(bus) -> dict:
+    from tidal_chrome import BUS_NAME, OPATH, DEBUG_IFACE
+    stats = bus.call_blocking(BUS_NAME, OPATH, DEBUG_IFACE, "GetStats", "", [])
+    return {str(k): float(v) for k, v in stats.items()}
+
+
+def _wait_for_ticks(control: ChromedriverControl, seconds: float = TICK_TIMEOUT) -> bool:
+    """
+    :return: Whether the bridge sent commands to the chromedriver within the given time.
+    """
+    commands = control.commands
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        time.sleep(0.1)
+        if control.commands > commands:
+            return True
+    return False
+
+
+def _round_trip(address: str, n: int) -> dict:
+    """
+    Time requests to the fake chromedriver which do no browser work, on one
+    keep-alive connection as selenium uses.
+    :return: Percentiles in milliseconds.
+    """
+    host, port = address.rsplit(":", 1)
+    conn = http.client.HTTPConnection(host, int(port), timeout=5)
+    times = []
+    try:
+        for _ in range(n):
+            start = time.perf_counter()
+            conn.request("GET", "/status")
+            conn.getresponse().read()
+            times.append(time.perf_counter() - start)
+    finally:
+        conn.close()
+    return _percentiles(times)
+
+
+def _restart(bus, address_file: str, address: str) -> dict:
+    """
+    Make the browser unreachable and wait for the supervisor to replace it.
+    :return: {"recovered", "recovery_ms", "ticking", "address"}
+    """
+    restarts = _stats(bus).get(RESTARTS, 0)
+    start = time.perf_counter()
+    ChromedriverControl(address).fault("unreachable")
+    result = {"recovered": False, "recovery_ms": None, "ticking": False, "address": address}
+    try:
+        result["address"] = _address(address_file, address, RECOVERY_TIMEOUT)
+    except RuntimeError:
+        return result
+    deadline = time.monotonic() + RECOVERY_TIMEOUT
+    while time.monotonic() < deadline:
+        if _stats(bus).get(RESTARTS, 0) > restarts:
+            result["recovered"] = True
+            result["recovery_ms"] = (time.perf_counter() - start) * 1000
+            break
+        time.sleep(0.05)
+    result["ticking"] = _wait_for_ticks(ChromedriverControl(result["address"]))
+    return result
+
+
+def _close_window(process, address: str) -> dict:
+    """
+    Close the browser window and wait for the bridge to quit.
+    :return: {"quit", "quit_ms"}
+    """
+    start = time.perf_counter()
+    ChromedriverControl(address).fault("closed", -1)
+    try:
+        process.wait(RECOVERY_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        return {"quit": False, "quit_ms": None}
+    return {"quit": True, "quit_ms": (time.perf_counter() - start) * 1000}
+
+
+def run(args) -> dict:
+    """
+    Start a private bus and the bridge, restart the browser args.n times, then
+    close its window.
+    :return: {"config", "round_trip_ms", "command_ms", "restarts", "window_closed"}
+    """
+    import dbus
+    from dbus.mainloop.glib import DBusGMainLoop
+    from gi.repository import GLib
+
+    from tidal_chrome import BUS_NAME, OPATH
+
+    DBusGMainLoop(set_as_default=True)
+    daemon, address = start_bus()
+    directory = tempfile.mkdtemp()
+    address_file = os.path.join(directory, "address")
+    bridge = None
+    chromedriver = None
+    loop = GLib.MainLoop()
+    try:
+        bus = dbus.bus.BusConnection(address)
+        # Keeps the bridge polling, as a client is listening
+        bus.add_signal_receiver(lambda *a: None, bus_name=BUS_NAME, path=OPATH)
+        threading.Thread(target=loop.run, daemon=True).start()
+        bridge = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_recovery", "--serve",
+                                   "--latency", str(args.latency),
+                                   "--track-duration", str(args.track_duration),
+                                   "--address-file", address_file],
+                                  cwd=ROOT, env=dict(os.environ, DBUS_SESSION_BUS_ADDRESS=address))
+        _wait_for_name(bus, BUS_NAME)
+        chromedriver = _address(address_file)
+        if not _wait_for_ticks(ChromedriverControl(chromedriver)):
+            raise RuntimeError("The bridge did not start ticking")
+
+        results = {"round_trip_ms": _round_trip(chromedriver, args.round_trips)}
+        stats = ChromedriverControl(chromedriver).stats()
+        results["command_ms"] = stats["busy_seconds"] / stats["commands"] * 1000 if stats["commands"] else None
+
+        results["restarts"] = []
+        for _ in range(args.n):
+            r = _restart(bus, address_file, chromedriver)
+            chromedriver = r.pop("address")
+            results["restarts"].append(r)
+            if not r["recovered"]:
+                break
+        results["window_closed"] = _close_window(bridge, chromedriver)
+        if results["window_closed"]["quit"]:
+            bridge = None
+    finally:
+        if bridge is not None:
+            bridge.kill()
+        if chromedriver is not None:
+            # Stopped by selenium unless the bridge was killed
+            ChromedriverControl(chromedriver).shutdown()
+        loop.quit()
+        daemon.kill()
+
+    results["config"] = {"latency": args.latency,
+                         "track_duration": args.track_duration,
+                         "python": sys.version.split()[0],
+                         "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    return results
+
+
+if __name__ == '__main__':
+    par = argparse.ArgumentParser(description="Benchmark browser recovery of the MPRIS bridge")
+    par.add_argument('-n', type=int, default=3, help='Number of browser restarts.')
+    par.add_argument('--latency', type=float, default=0.002, help='Delay in seconds before each chromedriver reply.')
+    par.add_argument('--track-duration', type=float, default=180, help='Duration of every track in seconds.')
+    par.add_argument('--round-trips', type=int, default=500, help='Requests to time the HTTP round trip with.')
+    par.add_argument('--output', metavar='FILE', help='Write the results as JSON to FILE.')
+    par.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    par.add_argument('--address-file', help=argparse.SUPPRESS)
+    args = par.parse_args()
+    if args.serve:
+        serve(args.latency, args.track_duration, args.address_file)
+        sys.exit(0)
+    res = run(args)
+    print("HTTP round trip: %.3f ms mean  %.3f ms p95" % (res["round_trip_ms"]["mean"], res["round_trip_ms"]["p95"]))
+    if res["command_ms"] is not None:
+        print("Chromedriver time per command: %.3f ms" % res["command_ms"])
+    for i, r in enumerate(res["restarts"], 1):
+        if r["recovered"]:
+            print("Restart %d: recovered in %.0f ms, %s" % (i, r["recovery_ms"],
+                                                           "ticking" if r["ticking"] else "NOT ticking"))
+        else:
+            print("Restart %d: NOT recovered" % i)
+    w = res["window_closed"]
+    print("Window closed: " + ("quit in %.0f ms" % w["quit_ms"] if w["quit"] else "did NOT quit"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(res, f, indent=2)
+    if not all(r["recovered"] and r["ticking"] for r in res["restarts"]) or not w["quit"]:
+        sys.exit(1)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# A local stand-in for Chrome's remote debugging endpoint: it serves
+# /json/list and a DevTools websocket which answers the commands sent by
+# tidal_chrome.backends.cdp_backend from a simulated TIDAL player.
+#
+# Usage: python3 -m benchmarks.fake_cdp [--port 9222] [--latency 0.002]
+
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+from tidal_chrome.backends import TIDAL_URL
+
+from .fake_tidal import FakeTidal
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class FakeCDPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, page: FakeTidal = None, latency: float = 0.0, port: int = 0):
+        """
+        :param page: The simulated player to serve.
+        :param latency: Delay in seconds before each reply, simulating the browser's processing time.
+        :param port: Port to listen on, or 0 to choose a free one.
+        """
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.page = page or FakeTidal()
+        self.latency = latency
+        self.commands = 0
+        # While set, commands are read but never answered, as from a hung browser
+        self.stalled = False
+        self._sessions = set()
+
+    @property
+    def address(self) -> str:
+        return "%s:%d" % self.server_address
+
+    def start(self) -> "FakeCDPServer":
+        """
+        Serve on a background thread.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def close_pages(self) -> None:
+        """
+        Close every DevTools connection, as Chrome does when the user closes the window.
+        """
+        for handler in list(self._sessions):
+            handler.close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline().decode("latin-1").split()
+        if len(line) < 2:
+            return
+        headers = {}
+        while True:
+            h = self.rfile.readline().decode("latin-1").strip()
+            if not h:
+                break
+            k, _, v = h.partition(":")
+            headers[k.strip().lower()] = v.strip()
+
+        if headers.get("upgrade", "").lower() == "websocket":
+            self.__websocket(headers["sec-websocket-key"])
+        elif line[1].startswith("/json"):
+            body = json.dumps([{"type": "page", "url": TIDAL_URL, "id": "1",
+                                "webSocketDebuggerUrl": "ws://%s/devtools/page/1" % self.server.address}])
+            self.__http(body.encode("UTF-8"))
+        else:
+            self.wfile.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+
+    def __http(self, body: bytes):
+        self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: %d\r\n"
+                         b"Connection: close\r\n\r\n" % len(body) + body)
+
+    def __websocket(self, key: str):
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("latin-1")).digest()).decode("latin-1")
+        self.wfile.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          "Sec-WebSocket-Accept: %s\r\n\r\n" % accept).encode("latin-1"))
+        session = _Session(self.server.page)
+        self._send_lock = threading.Lock()
+        self.server._sessions.add(self)
+        try:
+            self.__serve(session)
+        finally:
+            self.server._sessions.discard(self)
+
+    def close(self) -> None:
+        try:
+            self.__send_frame(8, b"")
+        except OSError:
+            pass
+        self.request.shutdown(socket.SHUT_RDWR)
+
+    def __serve(self, session):
+        while True:
+            try:
+                frame = self.__read_frame()
+            except OSError:
+                return
+            if frame is None:
+                return
+            opcode, payload = frame
+            if opcode == 8:
+                self.__send_frame(8, b"")
+                return
+            if opcode == 9:
+                self.__send_frame(10, payload)
+                continue
+            msg = json.loads(payload.decode("UTF-8"))
+            if self.server.stalled:
+                continue
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            self.server.commands += 1
+            try:
+                reply = {"id": msg["id"], "result": session.dispatch(msg["method"], msg.get("params", {}))}
+            except KeyError as e:
+                reply = {"id": msg["id"], "error": {"code": -32000, "message": "Could not find object " + str(e)}}
+            self.__send_frame(1, json.dumps(reply).encode("UTF-8"))
+
+    def __read_frame(self):
+        head = self.rfile.read(2)
+        if len(head) < 2:
+            return None
+        opcode = head[0] & 0x0f
+        length = head[1] & 0x7f
+        if length == 126:
+            length = struct.unpack(">H", self.rfile.read(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", self.rfile.read(8))[0]
+        mask = self.rfile.read(4) if head[1] & 0x80 else None
+        payload = self.rfile.read(length)
+        if mask:
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return opcode, payload
+
+    def __send_frame(self, opcode: int, payload: bytes):
+        n = len(payload)
+        if n < 126:
+            head = struct.pack(">BB", 0x80 | opcode, n)
+        elif n < 65536:
+            head = struct.pack(">BBH", 0x80 | opcode, 126, n)
+        else:
+            head = struct.pack(">BBQ", 0x80 | opcode, 127, n)
+        with self._send_lock:
+            self.wfile.write(head + payload)
+
+
+class _Session:
+
+    def __init__(self, page: FakeTidal):
+        self.page = page
+        self.objects = {"window": "window"}
+        self.ids = itertools.count(1)
+        self.mouse_target = None
+
+    def __new_object(self, value) -> str:
+        oid = "obj:%d" % next(self.ids)
+        self.objects[oid] = value
+        return oid
+
+    def dispatch(self, method: str, params: dict):
+        if method == "Runtime.evaluate":
+            return {"result": {"type": "object", "objectId": "window"}}
+        if method == "Runtime.getProperties":
+            return {"result": [{"name": str(i), "value": {"type": "object", "objectId": self.__new_object(name)}}
+                               for i, name in enumerate(self.objects[params["objectId"]])]}
+        if method == "Runtime.callFunctionOn":
+            target = self.objects[params["objectId"]]
+            args = [self.objects[a["objectId"]] if "objectId" in a else a.get("value")
+                    for a in params.get("arguments", [])]
+            value = self.__call(params["functionDeclaration"], target, args, params.get("awaitPromise", False))
+            if not params.get("returnByValue"):
+                return {"result": {"type": "object", "objectId": self.__new_object(value)}}
+            return {"result": {"type": "object", "value": value}}
+        if method == "Runtime.releaseObject":
+            self.objects.pop(params["objectId"], None)
+        elif method == "Runtime.releaseObjectGroup":
+            self.objects = {"window": "window"}
+        elif method == "Input.dispatchMouseEvent" and params["type"] == "mouseReleased" and self.mouse_target:
+            self.page.click(self.mouse_target, params["x"])
+        return {}
+
+    def __call(self, fd: str, target, args: list, is_async: bool):
+        page = self.page
+        if "XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null), a = []" in fd:
+            return page.elements(args[0])
+        if "getBoundingClientRect" in fd:
+            self.mouse_target = target
+            return [0, 0, 100, 10]
+        if "return this[arguments[0]];" in fd:
+            return page.get_property(target, args[0])
+        if "return this.getAttribute(arguments[0]);" in fd:
+            return page.get_attribute(target, args[0])
+        # Asynchronous scripts get their timeout in ms as the first argument
+        return page.run_script(fd, args[1:] if is_async else args)
+
+if __name__ == '__main__':
+    par = argparse.ArgumentParser(description="Fake Chrome DevTools endpoint serving a simulated TIDAL player")
+    par.add_argument('--port', type=int, default=9222)
+    par.add_argument('--latency', type=float, default=0.0, help='Delay in seconds before each reply.')
+    args = par.parse_args()
+    server = FakeCDPServer(latency=args.latency, port=args.port)
+    print("Listening on " + server.address)
+    server.serve_forever()
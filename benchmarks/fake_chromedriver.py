@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# A local stand-in for chromedriver: it speaks the W3C WebDriver protocol
+# used by selenium.webdriver.Chrome and answers from a simulated TIDAL player,
+# so that the selenium backend can be driven end to end without a browser.
+# Latency and faults (stale elements, "chrome not reachable", "invalid
+# session id", a closed window) are injected through the /fake/ endpoints,
+# e.g. with ChromedriverControl.
+#
+# chromedriver_binary_path must be an executable, so write_launcher() creates
+# one which runs this module:
+# Usage: python3 -m benchmarks.fake_chromedriver --port=9515 [--latency 0.002] [--track-duration 180]
+#                                                [--address-file FILE]
+
+import argparse
+import json
+import os
+import stat
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .fake_tidal import FakeTidal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ELEMENT_KEY = "element-6066-11e4-a52e-4f735466cecf"
+# Fault modes: (HTTP status, W3C error code, message)
+FAULTS = {
+    "stale": (404, "stale element reference", "stale element reference: element is not attached to the page document"),
+    "unreachable": (500, "unknown error", "unknown error: chrome not reachable"),
+    "invalid_session": (404, "invalid session id", "invalid session id"),
+    "closed": (404, "no such window", "no such window: target window already closed"),
+}
+# Size of every element, for pointer actions
+RECT = {"x": 0, "y": 0, "width": 100, "height": 10}
+
+
+class WebDriverError(Exception):
+
+    def __init__(self, status: int, error: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.error = error
+        self.message = message
+
+
+class FakeChromedriverServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, page: FakeTidal = None, latency: float = 0.0, port: int = 0):
+        """
+        :param page: The simulated player to serve.
+        :param latency: Delay in seconds before each reply, simulating the browser's processing time.
+        :param port: Port to listen on, or 0 to choose a free one.
+        """
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.page = page or FakeTidal()
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.session_id = None
+        # element id: element name. Ids from before a stale fault are forgotten.
+        self.elements = {}
+        # mode: number of commands left to fail, or -1 for all of them
+        self.faults = {}
+        self.commands = 0
+        self.by_command = Counter()
+        self.failed = Counter()
+        # Time spent answering commands, including the simulated latency
+        self.busy = 0.0
+
+    @property
+    def address(self) -> str:
+        return "%s:%d" % self.server_address
+
+    def start(self) -> "FakeChromedriverServer":
+        """
+        Serve on a background thread.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"commands": self.commands,
+                    "by_command": dict(self.by_command),
+                    "failed": dict(self.failed),
+                    "busy_seconds": self.busy}
+
+    def element_id(self, name: str) -> dict:
+        eid = uuid.uuid4().hex
+        self.elements[eid] = name
+        return {ELEMENT_KEY: eid}
+
+    def element(self, eid: str) -> str:
+        name = self.elements.get(eid)
+        if name is None:
+            raise WebDriverError(*FAULTS["stale"])
+        return name
+
+    def take_fault(self, mode: str) -> None:
+        """
+        Fail the command if a fault of the given mode is pending.
+        """
+        n = self.faults.get(mode, 0)
+        if n == 0:
+            return
+        if n > 0:
+            self.faults[mode] = n - 1
+        self.failed[mode] += 1
+        if mode == "stale":
+            self.elements = {}
+        elif mode == "invalid_session":
+            self.session_id = None
+        raise WebDriverError(*FAULTS[mode])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Send each reply in one segment, without waiting for delayed ACKs on the keep-alive connection
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.__handle("GET")
+
+    def do_POST(self):
+        self.__handle("POST")
+
+    def do_DELETE(self):
+        self.__handle("DELETE")
+
+    def __reply(self, status: int, value) -> None:
+        body = json.dumps({"value": value}).encode("UTF-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def __handle(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length).decode("UTF-8")) if length else {}
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        server = self.server
+        start = time.perf_counter()
+        try:
+            if parts[:1] == ["fake"]:
+                value = self.__control(method, parts[1:], body)
+            elif parts == ["shutdown"]:
+                self.__reply(200, None)
+                threading.Thread(target=server.shutdown, daemon=True).start()
+                return
+            elif parts == ["status"]:
+                value = {"ready": True, "message": "fake chromedriver"}
+            elif parts == ["session"] and method == "POST":
+                with server.lock:
+                    server.session_id = uuid.uuid4().hex
+                    server.faults.pop("invalid_session", None)
+                value = {"sessionId": server.session_id,
+                         "capabilities": {"browserName": "chrome", "browserVersion": "0",
+                                          "platformName": "linux", "timeouts": {"implicit": 0}}}
+            elif parts[:1] == ["session"] and len(parts) > 1:
+                if server.latency:
+                    time.sleep(server.latency)
+                with server.lock:
+                    server.commands += 1
+                    server.by_command[" ".join([method] + [p for p in parts[2:3]])] += 1
+                    value = self.__command(method, parts[1], parts[2:], body)
+            else:
+                raise WebDriverError(404, "unknown command", "unknown command: " + self.path)
+        except WebDriverError as e:
+            self.__reply(e.status, {"error": e.error, "message": e.message, "stacktrace": ""})
+            return
+        finally:
+            server.busy += time.perf_counter() - start
+        self.__reply(200, value)
+
+    def __control(self, method: str, parts: list, body: dict):
+        server = self.server
+        if parts == ["stats"]:
+            return server.stats()
+        with server.lock:
+            if parts == ["fault"] and method == "POST":
+                mode = body["mode"]
+                if mode == "none":
+                    server.faults = {}
+                elif mode in FAULTS:
+                    server.faults[mode] = body.get("count", 1)
+                else:
+                    raise WebDriverError(400, "invalid argument", "unknown fault mode: " + mode)
+                return None
+            if parts == ["latency"] and method == "POST":
+                server.latency = body["latency"]
+                return None
+        raise WebDriverError(404, "unknown command", "unknown command: " + self.path)
+
+    def __args(self, args: list) -> list:
+        return [self.server.element(a[ELEMENT_KEY]) if isinstance(a, dict) and ELEMENT_KEY in a else a
+                for a in args]
+
+    def __command(self, method: str, session_id: str, parts: list, body: dict):
+        server = self.server
+        page = server.page
+        if session_id != server.session_id:
+            raise WebDriverError(*FAULTS["invalid_session"])
+        server.take_fault("invalid_session")
+        server.take_fault("unreachable")
+
+        if not parts:
+            if method == "DELETE":
+                server.session_id = None
+            return None
+        # The session can still be deleted once the window is closed
+        server.take_fault("closed")
+        command = parts[0]
+        if command == "element" and len(parts) > 2:
+            server.take_fault("stale")
+            name = server.element(parts[1])
+            if parts[2] == "property":
+                return page.get_property(name, parts[3])
+            if parts[2] == "attribute":
+                return page.get_attribute(name, parts[3])
+            if parts[2] == "rect":
+                return RECT
+            if parts[2] == "click":
+                page.click(name)
+                return None
+        elif command in ("elements", "element"):
+            found = [server.element_id(n) for n in page.elements(body["value"])]
+            if command == "elements":
+                return found
+            if not found:
+                raise WebDriverError(404, "no such element", "no such element: " + body["value"])
+            return found[0]
+        elif command == "execute":
+            args = body.get("args", [])
+            if any(isinstance(a, dict) and ELEMENT_KEY in a for a in args):
+                server.take_fault("stale")
+            args = self.__args(args)
+            script = body["script"]
+            if "apply(null, arguments)" in script and len(args) == 2:
+                # Selenium's getAttribute atom
+                return page.get_attribute(args[0], args[1])
+            if "getBoundingClientRect" in script:
+                return RECT
+            if script == "return arguments[0][arguments[1]]":
+                # Selenium's fallback for element properties
+                return page.get_property(args[0], args[1])
+            return page.run_script(script, args)
+        elif command == "actions":
+            if method == "POST":
+                self.__actions(body.get("actions", []))
+            return None
+        elif command == "window":
+            if len(parts) > 1 and parts[1] == "handles":
+                return ["window-1"]
+            return "window-1" if method == "GET" else None
+        elif command in ("timeouts", "url"):
+            return None
+        raise WebDriverError(404, "unknown command", "unknown command: " + self.path)
+
+    def __actions(self, sources: list) -> None:
+        for source in sources:
+            if source.get("type") != "pointer":
+                continue
+            target = x = None
+            for action in source.get("actions", []):
+                if action["type"] == "pointerMove" and isinstance(action.get("origin"), dict):
+                    self.server.take_fault("stale")
+                    target = self.server.element(action["origin"][ELEMENT_KEY])
+                    # Offsets are from the centre of the element
+                    x = action.get("x", 0) + RECT["width"] / 2
+                elif action["type"] == "pointerUp" and target is not None:
+                    self.server.page.click(target, x, RECT["width"])
+
+
+class ChromedriverControl:
+
+    def __init__(self, address: str):
+        """
+        Injects faults and latency into a fake chromedriver, e.g. one started
+        by selenium from write_launcher(), and reads its statistics.
+        :param address: host:port of the server.
+        """
+        self.address = address
+
+    def __request(self, path: str, body: dict = None):
+        data = json.dumps(body).encode("UTF-8") if body is not None else None
+        req = urllib.request.Request("http://%s/fake/%s" % (self.address, path), data=data,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=5) as r:
+            return json.loads(r.read().decode("UTF-8"))["value"]
+
+    def fault(self, mode: str, count: int = 1) -> None:
+        """
+        :param mode: "stale", "unreachable", "invalid_session", "closed", or "none" to clear pending faults.
+        :param count: Number of commands to fail, or -1 for all of them.
+        """
+        self.__request("fault", {"mode": mode, "count": count})
+
+    def set_latency(self, latency: float) -> None:
+        self.__request("latency", {"latency": latency})
+
+    def stats(self) -> dict:
+        """
+        :return: {"commands", "by_command", "failed", "busy_seconds"}
+        """
+        return self.__request("stats")
+
+    @property
+    def commands(self) -> int:
+        return self.stats()["commands"]
+
+    def shutdown(self) -> None:
+        try:
+            urllib.request.urlopen("http://%s/shutdown" % self.address, timeout=1).close()
+        except (urllib.error.URLError, OSError):
+            # Already stopped by selenium
+            pass
+
+
+def write_launcher(directory: str, latency: float = 0.0, track_duration: float = 180,
+                   address_file: str = None) -> str:
+    """
+    Write an executable which starts the fake chromedriver, for use as chromedriver_binary_path.
+    :param directory: Folder to write it to.
+    :param address_file: File to write the address of each server started to, so that
+    faults can be injected into a chromedriver started by another process.
+    :return: The path of the executable.
+    """
+    path = os.path.join(directory, "fake-chromedriver")
+    extra = "--address-file '%s' " % address_file if address_file else ""
+    with open(path, "w") as f:
+        f.write('#!/bin/sh\ncd "%s" && exec "%s" -m benchmarks.fake_chromedriver --latency %r --track-duration %r '
+                '%s"$@"\n' % (ROOT, sys.executable, latency, track_duration, extra))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+    return path
+
+
+if __name__ == '__main__':
+    par = argparse.ArgumentParser(description="Fake chromedriver serving a simulated TIDAL player")
+    par.add_argument('--port', type=int, default=9515)
+    par.add_argument('--latency', type=float, default=0.0, help='Delay in seconds before each reply.')
+    par.add_argument('--track-duration', type=float, default=180, help='Duration of every track in seconds.')
+    par.add_argument('--address-file', metavar='FILE', help='Write the address of the server to FILE.')
+    # Options passed by selenium to chromedriver
+    args, _ = par.parse_known_args()
+    server = FakeChromedriverServer(FakeTidal(track_duration=args.track_duration), args.latency, args.port)
+    print("Listening on " + server.address)
+    if args.address_file:
+        # Replaced in one step, so that a reader never sees a partial address
+        with open(args.address_file + ".tmp", "w") as f:
+            f.write(server.address)
+        os.replace(args.address_file + ".tmp", args.address_file)
+    server.serve_forever()
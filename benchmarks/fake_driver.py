@@ -0,0 +1,216 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# A stand-in for tidal_chrome_driver.Driver which answers from a simulated
+# TIDAL player with a configurable delay per call, so that the MPRIS object
+# can be benchmarked without a browser or a browser protocol in between.
+
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Union
+
+from tidal_chrome.metrics import Metrics
+from tidal_chrome.playlists import Playlist, PlaylistIndex
+from tidal_chrome.tidal_chrome_driver import PlayerState
+
+from .fake_tidal import FakeTidal
+
+
+class FakeDriver:
+
+    def __init__(self, page: FakeTidal = None, latency: Union[float, dict] = 0.0, metrics: Optional[Metrics] = None,
+                 concurrent_wait: bool = True):
+        """
+        :param page: The simulated player.
+        :param latency: Delay in seconds of every call, or {method name: delay}, with "default" for the others.
+        :param metrics: Metrics registry, as passed to Driver.
+        :param concurrent_wait: Whether to report that wait_for_changes can run beside other calls, as
+        with the cdp backend, or not, as with selenium, in which case the bridge polls instead.
+        """
+        self.page = page or FakeTidal()
+        self._concurrent_wait = concurrent_wait
+        self.latency = latency if isinstance(latency, dict) else {"default": latency}
+        self.metrics = metrics or Metrics()
+        self.calls = Counter()
+        self.useShuffleAsCurFavourite = False
+        self.playlists = PlaylistIndex()
+        self._changed = threading.Event()
+        self._last = None
+
+    def _call(self, name: str) -> None:
+        self.calls[name] += 1
+        delay = self.latency.get(name, self.latency.get("default", 0))
+        if delay:
+            time.sleep(delay)
+
+    def _touch(self) -> None:
+        self._changed.set()
+
+    def snapshot(self) -> PlayerState:
+        self._call("snapshot")
+        r = self.page.snapshot()
+        track_id = r["href"].rsplit("/", 1)[-1]
+        self._last = (track_id, r["playing"], r["shuffle"])
+        return PlayerState(can_play=r["can_play"],
+                           is_playing=r["playing"],
+                           title=r["title"],
+                           artists=tuple(r["artists"]),
+                           image=r["image"].split()[0],
+                           progress=int(r["media"]["time"] * 1000000),
+                           duration=int(r["media"]["duration"] * 1000000),
+                           shuffle=r["shuffle"],
+                           next_image=r["next_image"].split()[0],
+                           track_id=track_id,
+                           precise=True,
+                           volume=r["media"]["volume"],
+                           rate=r["media"]["rate"],
+                           href=r["href"])
+
+    def wait_until_ready(self, timeout: float = 30) -> bool:
+        self._call("wait_until_ready")
+        return True
+
+    def install_observer(self) -> bool:
+        self._call("install_observer")
+        return True
+
+    def wait_for_changes(self, timeout: float) -> Optional[list]:
+        """
+        Returns when a command changed the player, or the track ended, as the page observer would.
+        """
+        self._call("wait_for_changes")
+        page = self.page
+        remaining = (page.track_duration - page.position()) / page.rate if page.playing else timeout
+        if self._changed.wait(min(timeout, max(remaining, 0))):
+            self._changed.clear()
+            return ["command"]
+        if self._last is not None and page.track()[0] != self._last[0]:
+            return ["track"]
+        return []
+
+    @property
+    def concurrent_wait(self) -> bool:
+        return self._concurrent_wait
+
+    def wake_observer(self) -> None:
+        self._call("wake_observer")
+        self._touch()
+
+    def fetch_resource(self, url: str) -> Optional[bytes]:
+        self._call("fetch_resource")
+        return b"fake image"
+
+    def queue(self) -> Optional[List[str]]:
+        self._call("queue")
+        n = len(self.page.tracks)
+        return [self.page.tracks[(self.page.index + i) % n][0] for i in range(min(n, 20))]
+
+    def queue_metadata(self, track_ids: List[str]) -> List[PlayerState]:
+        self._call("queue_metadata")
+        ids = set(track_ids)
+        return [PlayerState(track_id=t[0], title=t[1], artists=tuple(t[2]),
+                            duration=int(self.page.track_duration * 1000000))
+                for t in self.page.tracks if t[0] in ids]
+
+    def go_to(self, track_id: str, occurrence: int = 0) -> bool:
+        self._call("go_to")
+        for i, t in enumerate(self.page.tracks):
+            if t[0] == track_id:
+                self.page.skip(i - self.page.index)
+                self._touch()
+                return True
+        return False
+
+    def add_track(self, track_id: str, play_next: bool = False) -> bool:
+        self._call("add_track")
+        return False
+
+    def play(self) -> None:
+        self._call("play")
+        self.page.click("play")
+        self._touch()
+
+    def pause(self) -> None:
+        self._call("pause")
+        self.page.click("pause")
+        self._touch()
+
+    def play_pause(self) -> Optional[bool]:
+        self._call("play_pause")
+        self.page.click("play_button")
+        self._touch()
+        return self.page.playing
+
+    def next(self, count: int = 1) -> None:
+        self._call("next")
+        self.page.skip(count)
+        self._touch()
+
+    def previous(self, count: int = 1) -> None:
+        self._call("previous")
+        self.page.skip(-count)
+        self._touch()
+
+    def toggle_shuffle(self) -> None:
+        self._call("toggle_shuffle")
+        self.page.click("shuffle")
+        self._touch()
+
+    def set_position(self, position, duration: Optional[int] = None) -> None:
+        self._call("set_position")
+        self.page.seek(position / 1000000)
+        self._touch()
+
+    def set_volume(self, volume: float) -> bool:
+        self._call("set_volume")
+        self.page.set_media_property("volume", volume)
+        self._touch()
+        return True
+
+    def set_rate(self, rate: float) -> bool:
+        self._call("set_rate")
+        self.page.set_media_property("playbackRate", rate)
+        self._touch()
+        return True
+
+    def update_playlists(self) -> Optional[List[Playlist]]:
+        self._call("update_playlists")
+        playlists = [Playlist("p%d" % i, "Playlist %d" % i) for i in range(10)]
+        self.playlists.update(playlists)
+        return playlists
+
+    def add_cur_to_playlist(self, playlist, duplicateactionadd: Optional[bool] = None) -> None:
+        self._call("add_cur_to_playlist")
+
+    def play_playlist(self, playlist: Playlist) -> None:
+        self._call("play_playlist")
+        self.page.skip(-self.page.index)
+        self._touch()
+
+    def play_page(self, path: str, track_id: Optional[str] = None) -> bool:
+        self._call("play_page")
+        index = next((i for i, t in enumerate(self.page.tracks) if t[0] == track_id), 0)
+        self.page.skip(index - self.page.index)
+        self.page.click("play")
+        self._touch()
+        return True
+
+    def raise_window(self) -> None:
+        self._call("raise_window")
+
+    def set_fullscreen(self, value) -> None:
+        self._call("set_fullscreen")
+
+    def open_uri(self, uri) -> None:
+        self._call("open_uri")
+
+    def get(self, url: str) -> None:
+        self._call("get")
+
+    def quit(self) -> None:
+        self._call("quit")
+
+    def detach(self) -> None:
+        self._call("detach")
@@ -0,0 +1,202 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# A simulated TIDAL player, shared by the fake browser endpoints used for
+# benchmarking. It knows the elements named in tidal_chrome.locators and keeps
+# a playback clock, so that results look like a real page without a browser.
+
+import base64
+import threading
+import time
+
+from tidal_chrome.locators import LOCATORS
+
+XPATHS = {loc.xpath: name for name, loc in LOCATORS.items()}
+
+
+class FakeTidal:
+
+    def __init__(self, tracks=None, track_duration: float = 180):
+        """
+        :param tracks: List of (track id, title, artists) tuples forming the play queue.
+        :param track_duration: Duration of every track in seconds.
+        """
+        self.tracks = tracks or [(str(1000 + i), "Track %d" % i, ["Artist %d" % (i % 7)]) for i in range(50)]
+        self.track_duration = track_duration
+        self.index = 0
+        self.playing = True
+        self.shuffle = False
+        self.volume = 1.0
+        self.rate = 1.0
+        self.route = "/"
+        self._position = 0.0
+        self._anchor = time.monotonic()
+        self._lock = threading.Lock()
+
+    def position(self) -> float:
+        """
+        Advance the playback clock, moving to the next track at the end of the current one.
+        :return: The position in the current track in seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.playing:
+                self._position += (now - self._anchor) * self.rate
+                while self._position >= self.track_duration:
+                    self._position -= self.track_duration
+                    self.index = (self.index + 1) % len(self.tracks)
+            self._anchor = now
+            return self._position
+
+    def seek(self, position: float) -> None:
+        self.position()
+        with self._lock:
+            self._position = max(0.0, min(position, self.track_duration))
+
+    def set_media_property(self, prop: str, value) -> None:
+        self.position()
+        if prop == "volume":
+            self.volume = value
+        elif prop == "playbackRate":
+            self.rate = value
+
+    def skip(self, count: int) -> None:
+        self.position()
+        with self._lock:
+            self.index = (self.index + count) % len(self.tracks)
+            self._position = 0.0
+
+    @staticmethod
+    def _time(t: float) -> str:
+        t = int(t)
+        return "%d:%02d" % (t // 60, t % 60)
+
+    def track(self):
+        self.position()
+        return self.tracks[self.index]
+
+    def snapshot(self) -> dict:
+        """
+        :return: The value returned by tidal_chrome_driver.SNAPSHOT_SCRIPT.
+        """
+        pos = self.position()
+        track_id, title, artists = self.tracks[self.index]
+        nxt = self.tracks[(self.index + 1) % len(self.tracks)]
+        return {"can_play": True,
+                "playing": self.playing,
+                "shuffle": self.shuffle,
+                "title": title,
+                "href": "/album/1/track/" + track_id,
+                "artists": list(artists),
+                "image": "https://resources.tidal.com/images/%s/640x640.jpg 640w" % track_id,
+                "progress": self._time(pos),
+                "duration": self._time(self.track_duration),
+                "next_image": "https://resources.tidal.com/images/%s/640x640.jpg 640w" % nxt[0],
+                "route": self.route,
+                "media": {"time": pos,
+                          "duration": self.track_duration,
+                          "paused": not self.playing,
+                          "volume": self.volume,
+                          "rate": self.rate}}
+
+    def elements(self, xpath: str) -> list:
+        """
+        :param xpath: A locator XPath.
+        :return: A list of element names matching the XPath.
+        """
+        name = XPATHS.get(xpath)
+        if name is None:
+            return []
+        if name == "play" and self.playing or name == "pause" and not self.playing:
+            return []
+        if name in ("now_playing", "queue_next_image", "duplicate_modal_buttons"):
+            return []
+        if name == "track_artists":
+            return ["track_artists:%d" % i for i in range(len(self.track()[2]))]
+        return [name]
+
+    def get_property(self, element: str, prop: str):
+        name = element.split(":")[0]
+        if prop == "title":
+            if name == "play_button":
+                return "Pause" if self.playing else "Play"
+            if name == "track_artists":
+                return self.track()[2][int(element.split(":")[1])]
+        if prop == "innerHTML":
+            if name == "track_title":
+                return self.track()[1]
+            if name == "current_time":
+                return self._time(self.position())
+            if name == "duration_time":
+                return self._time(self.track_duration)
+        if prop == "srcset" and name == "track_image":
+            return self.snapshot()["image"]
+        return None
+
+    def get_attribute(self, element: str, attr: str):
+        name = element.split(":")[0]
+        if attr == "class" and name == "player":
+            return "player hasPlayer"
+        if attr == "aria-checked" and name in ("shuffle", "favourite"):
+            return "true" if self.shuffle else "false"
+        return None
+
+    def run_script(self, script: str, args: list):
+        """
+        Apply the effect of a script run by tidal_chrome_driver.Driver.
+        :param script: The script, as passed to the backend.
+        :param args: The script arguments, with elements given by name.
+        :return: The value the script would return.
+        """
+        if "can_play:" in script:
+            return self.snapshot()
+        if "m.currentTime = arguments[0];" in script:
+            self.seek(args[0])
+            return True
+        if "m[arguments[0]] = arguments[1];" in script:
+            self.set_media_property(args[0], args[1])
+            return True
+        if "document.readyState === 'complete'" in script:
+            return True
+        if "if (window.__tidalChrome) return true;" in script:
+            return True
+        if "o.wake = done;" in script:
+            # The timeout is in ms
+            time.sleep(min(args[0] / 1000, 0.05))
+            return []
+        if "cache: 'force-cache'" in script:
+            return base64.b64encode(b"fake image").decode("latin-1")
+        if script == "return location.pathname;":
+            return self.route
+        if "arguments[0].href=arguments[1];" in script:
+            self.route = args[1]
+            return None
+        if "var playing = arguments[0].title === 'Pause';" in script:
+            self.click(args[0])
+            return self.playing
+        if "for (var i = 0; i < arguments[1]; i++) arguments[0].click();" in script:
+            self.skip(args[1] if args[0] == "next" else -args[1])
+            return None
+        if "arguments[0].click();" in script:
+            self.click(args[0])
+        return None
+
+    def click(self, element: str, x=None, width: float = 100) -> None:
+        """
+        Apply the effect of clicking an element.
+        :param x: Horizontal click offset, for the progress bar.
+        :param width: Width of the element.
+        """
+        name = element.split(":")[0]
+        if name in ("play_button", "play", "pause"):
+            self.position()
+            self.playing = name == "play" or (name == "play_button" and not self.playing)
+        elif name == "next":
+            self.skip(1)
+        elif name == "previous":
+            self.skip(-1)
+        elif name in ("shuffle", "favourite"):
+            self.shuffle = not self.shuffle
+        elif name == "progress_bar" and x is not None:
+            self.seek(x / width * self.track_duration)
@@ -10,7 +10,7 @@ with open(path.join(path.dirname(__file__), 'README.md')) as f:
 setup(
     name='tidal-chrome',
     version=version,
-    packages=['tidal_chrome'],
+    packages=['tidal_chrome', 'tidal_chrome.backends'],
     url='https://github.com/SERVCUBED/tidal-chrome',
     license='AGPL',
     author='SERVCUBED',
@@ -21,7 +21,7 @@ setup(
     python_requires='>=3.5',
     entry_points={
         'console_scripts': [
-            'tidal-chrome=tidal_chrome.cli:run',
+            'tidal-chrome=tidal_chrome.launcher:main',
         ],
     },
     data_files=[
@@ -0,0 +1,44 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import pytest
+
+from tidal_chrome.executor import DriverExecutor
+
+
+class Clock:
+    """
+    Stands in for the time module of the modules under test, and only moves
+    when a test advances it.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    """
+    :return: A function which replaces the time module of the given modules
+    with one Clock, and returns the Clock.
+    """
+    def patch(*modules) -> Clock:
+        c = Clock()
+        for m in modules:
+            monkeypatch.setattr(m, "time", c)
+        return c
+    return patch
+
+
+@pytest.fixture
+def executor():
+    e = DriverExecutor("test")
+    yield e
+    e.stop()
@@ -0,0 +1,89 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import os
+
+from tidal_chrome.artcache import ArtCache
+
+
+class _Fetcher:
+    """
+    Serves 10 bytes for every URL and counts the downloads.
+    """
+
+    def __init__(self):
+        self.fetched = []
+
+    def __call__(self, url):
+        self.fetched.append(url)
+        return b"0123456789"
+
+
+def _url(n: int) -> str:
+    return "https://resources.tidal.com/images/%d/320x320.jpg" % n
+
+
+def test_fetches_once_and_serves_local_files(tmp_path):
+    fetcher = _Fetcher()
+    cache = ArtCache(str(tmp_path), 100, fetcher)
+    local = cache.fetch(_url(1))
+    assert local == "file://" + cache.path_for(_url(1))
+    assert local.endswith(".jpg")
+    assert cache.fetch(_url(1)) == local
+    assert fetcher.fetched == [_url(1)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_failed_fetch_returns_the_remote_url(tmp_path):
+    cache = ArtCache(str(tmp_path), 100, lambda url: None)
+    assert cache.fetch(_url(1)) == _url(1)
+    assert cache.get(_url(1)) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ArtCache(str(tmp_path), 30, _Fetcher())
+    for n in (1, 2, 3):
+        cache.fetch(_url(n))
+    # Reading 1 makes 2 the least recently used
+    assert cache.get(_url(1)) is not None
+    cache.fetch(_url(4))
+    assert cache.get(_url(2)) is None
+    assert not os.path.exists(cache.path_for(_url(2)))
+    for n in (1, 3, 4):
+        assert cache.get(_url(n)) is not None
+
+
+def test_keeps_the_newest_image_even_if_too_large(tmp_path):
+    cache = ArtCache(str(tmp_path), 5, _Fetcher())
+    cache.fetch(_url(1))
+    cache.fetch(_url(2))
+    assert cache.get(_url(1)) is None
+    assert cache.get(_url(2)) is not None
+
+
+def test_reloads_the_cache_from_disk_in_age_order(tmp_path):
+    first = ArtCache(str(tmp_path), 30, _Fetcher())
+    for n in (1, 2, 3):
+        first.fetch(_url(n))
+        p = first.path_for(_url(n))
+        os.utime(p, (n, n))
+    # Leftover from an interrupted download
+    open(os.path.join(str(tmp_path), "partial.tmp"), "wb").close()
+
+    cache = ArtCache(str(tmp_path), 30, _Fetcher())
+    assert not os.path.exists(os.path.join(str(tmp_path), "partial.tmp"))
+    cache.fetch(_url(4))
+    assert cache.get(_url(1)) is None
+    assert cache.get(_url(2)) is not None
+
+
+def test_failed_write_leaves_no_partial_file(tmp_path, monkeypatch):
+    cache = ArtCache(str(tmp_path), 100, _Fetcher())
+
+    def fail(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "replace", fail)
+    assert cache.fetch(_url(1)) == _url(1)
+    assert os.listdir(str(tmp_path)) == []
+    assert cache.get(_url(1)) is None
@@ -0,0 +1,74 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("websocket")
+
+from selenium.common.exceptions import WebDriverException
+
+from benchmarks.fake_cdp import FakeCDPServer
+from tidal_chrome import preferences
+from tidal_chrome.backends.cdp_backend import MAX_TIMEOUTS, CDPBackend
+from tidal_chrome.supervisor import SESSION_LOST, WINDOW_CLOSED
+
+
+@pytest.fixture
+def server():
+    s = FakeCDPServer().start()
+    yield s
+    s.shutdown()
+    s.server_close()
+
+
+@pytest.fixture
+def backend(server):
+    b = CDPBackend(preferences.Preferences(True), server.address)
+    yield b
+    b.detach()
+
+
+def _error(backend, timeout: float = 30) -> str:
+    with pytest.raises(WebDriverException) as e:
+        backend.send("Runtime.evaluate", {"expression": "1"}, timeout)
+    return e.value.msg
+
+
+def _session_lost(message: str) -> bool:
+    return any(m in message for m in SESSION_LOST)
+
+
+def test_closed_window_quits(server, backend):
+    assert backend.execute("return 1;") is None
+    server.close_pages()
+    message = _error(backend)
+    assert WINDOW_CLOSED in message
+    assert not _session_lost(message)
+
+
+def test_crashed_browser_is_lost(server, backend):
+    backend._process = subprocess.Popen([sys.executable, "-c", "raise SystemExit(3)"])
+    server.close_pages()
+    message = _error(backend)
+    assert _session_lost(message)
+    assert "status 3" in message
+
+
+def test_single_timeout_is_not_a_lost_session(server, backend):
+    server.stalled = True
+    message = _error(backend, 0.05)
+    assert message.startswith("timeout")
+    assert not _session_lost(message)
+    server.stalled = False
+    assert backend.send("Runtime.evaluate", {"expression": "1"}, 5)
+
+
+def test_repeated_timeouts_are_a_lost_session(server, backend):
+    server.stalled = True
+    messages = [_error(backend, 0.05) for _ in range(MAX_TIMEOUTS)]
+    assert not any(_session_lost(m) for m in messages[:-1])
+    assert _session_lost(messages[-1])
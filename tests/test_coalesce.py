@@ -0,0 +1,146 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import threading
+
+from tidal_chrome.coalesce import Coalescer, SignalCoalescer
+from tidal_chrome.executor import DriverExecutor
+
+
+def _dispatch(fn, *args):
+    fn(*args)
+
+
+class _Replies:
+
+    def __init__(self, n: int):
+        self.replied = 0
+        self.errors = []
+        self._lock = threading.Lock()
+        self._n = n
+        self.done = threading.Event()
+
+    def __count(self):
+        if self.replied + len(self.errors) == self._n:
+            self.done.set()
+
+    def reply(self):
+        with self._lock:
+            self.replied += 1
+            self.__count()
+
+    def error(self, e):
+        with self._lock:
+            self.errors.append(e)
+            self.__count()
+
+
+def test_merges_a_burst_into_one_call(executor):
+    calls = []
+    c = Coalescer(executor, calls.append, 0.05, _dispatch)
+    replies = _Replies(3)
+    for value in (1, 1, -3):
+        c.add(value, replies.reply, replies.error)
+    assert replies.done.wait(5)
+    assert calls == [-1]
+    assert replies.replied == 3
+
+
+def test_separate_bursts_run_separately(executor):
+    calls = []
+    c = Coalescer(executor, calls.append, 0.01, _dispatch)
+    for value in (2, 5):
+        replies = _Replies(1)
+        c.add(value, replies.reply, replies.error)
+        assert replies.done.wait(5)
+    assert calls == [2, 5]
+
+
+def test_errors_are_sent_to_every_caller(executor):
+    def fail(value):
+        raise ValueError(value)
+
+    c = Coalescer(executor, fail, 0.05, _dispatch)
+    replies = _Replies(2)
+    c.add(1, replies.reply, replies.error)
+    c.add(2, replies.reply, replies.error)
+    assert replies.done.wait(5)
+    assert replies.replied == 0
+    assert [e.args for e in replies.errors] == [(3,), (3,)]
+
+
+def test_cancelled_burst_reports_an_error():
+    e = DriverExecutor("test")
+    e.stop()
+    c = Coalescer(e, lambda value: None, 0.01, _dispatch)
+    replies = _Replies(1)
+    c.add(1, replies.reply, replies.error)
+    assert replies.done.wait(5)
+    assert isinstance(replies.errors[0], RuntimeError)
+
+
+class _Signals:
+
+    def __init__(self):
+        self.sent = []
+
+    def emit(self, interface, changed):
+        self.sent.append((interface, dict(changed)))
+
+
+def _signal_coalescer(window: float = 60):
+    # With a long window, signals are only sent by flush()
+    signals = _Signals()
+    s = SignalCoalescer(signals.emit, window, _dispatch)
+    s.seed("player", {"PlaybackStatus": "Playing", "Volume": 1.0})
+    return s, signals
+
+
+def test_signals_merge_changes_within_the_window():
+    s, signals = _signal_coalescer()
+    s.update("player", {"PlaybackStatus": "Paused"})
+    s.update("player", {"Volume": 0.5})
+    s.update("player", {"Volume": 0.25})
+    s.flush()
+    assert signals.sent == [("player", {"PlaybackStatus": "Paused", "Volume": 0.25})]
+    assert (s.emitted, s.merged) == (1, 1)
+
+
+def test_signals_leave_out_unchanged_values():
+    s, signals = _signal_coalescer()
+    s.update("player", {"PlaybackStatus": "Playing", "Volume": 1.0})
+    s.flush()
+    assert signals.sent == []
+    assert s.suppressed == 2
+
+
+def test_signals_leave_out_values_changed_back():
+    s, signals = _signal_coalescer()
+    s.update("player", {"PlaybackStatus": "Paused", "Volume": 0.5})
+    s.update("player", {"PlaybackStatus": "Playing"})
+    s.flush()
+    assert signals.sent == [("player", {"Volume": 0.5})]
+
+
+def test_signals_never_include_position():
+    s, signals = _signal_coalescer()
+    s.update("player", {"Position": 1000000})
+    s.flush()
+    assert signals.sent == []
+
+
+def test_signals_are_sent_per_interface_after_the_window():
+    signals = _Signals()
+    sent = threading.Semaphore(0)
+
+    def dispatch(fn, *args):
+        fn(*args)
+        sent.release()
+
+    s = SignalCoalescer(signals.emit, 0.01, dispatch)
+    s.update("player", {"PlaybackStatus": "Stopped"})
+    s.update("tracklist", {"CanEditTracks": False})
+    assert sent.acquire(timeout=5) and sent.acquire(timeout=5)
+    assert sorted(signals.sent) == [("player", {"PlaybackStatus": "Stopped"}),
+                                    ("tracklist", {"CanEditTracks": False})]
@@ -0,0 +1,101 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import pytest
+
+from tidal_chrome import preferences
+from tidal_chrome.tidal_chrome_driver import Driver, PlayerState, _parse_srcset, _parse_time, _parse_track_id
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("0:00", 0),
+    ("3:05", 185000000),
+    ("03:05", 185000000),
+    ("1:02:03", 3723000000),
+    (" 3:05\n", 185000000),
+    ("45", 45000000),
+    # Placeholders shown while a track loads
+    ("", 0),
+    ("--:--", 0),
+    ("-:--", 0),
+    # Remaining time and other text
+    ("-0:42", 0),
+    ("+1:00", 0),
+    ("1:30.5", 0),
+    ("1::30", 0),
+    ("1:2:3:4", 0),
+])
+def test_parse_time(text, expected):
+    assert _parse_time(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("https://resources.tidal.com/images/a/80x80.jpg 80w, https://resources.tidal.com/images/a/160x160.jpg 160w",
+     "https://resources.tidal.com/images/a/160x160.jpg"),
+    ("https://resources.tidal.com/images/a/80x80.jpg", "https://resources.tidal.com/images/a/80x80.jpg"),
+    ("", ""),
+])
+def test_parse_srcset(text, expected):
+    assert _parse_srcset(text) == expected
+
+
+def test_parse_track_id_from_the_footer_link():
+    assert _parse_track_id("/album/1/track/2345", "Title", ["Artist"]) == "2345"
+    assert _parse_track_id("/track/77", "Title", ["Artist"]) == "77"
+
+
+def test_parse_track_id_without_a_link_hashes_the_track():
+    a = _parse_track_id("", "Title", ["Artist A", "Artist B"])
+    assert a.startswith("h") and a.isalnum()
+    assert a == _parse_track_id("/video/9", "Title", ["Artist A", "Artist B"])
+    assert a != _parse_track_id("", "Title", ["Artist A"])
+    assert a != _parse_track_id("", "Title", ["Artist B", "Artist A"])
+
+
+class _Backend:
+    """
+    Answers every script with the given snapshot result.
+    """
+
+    def __init__(self, result):
+        self.result = result
+
+    def execute(self, script, *args):
+        return self.result
+
+    def release_elements(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+def _snapshot(result) -> PlayerState:
+    return Driver(preferences.Preferences(True), backend=_Backend(result)).snapshot()
+
+
+def _result(**changes) -> dict:
+    r = {"route": "/album/1", "can_play": True, "playing": True, "title": "Title", "artists": ["Artist"],
+         "image": "a.jpg 80w, b.jpg 160w", "progress": "0:42", "duration": "3:05", "shuffle": False,
+         "next_image": "", "href": "/album/1/track/2"}
+    r.update(changes)
+    return r
+
+
+def test_snapshot_from_the_footer():
+    s = _snapshot(_result())
+    assert s == PlayerState(can_play=True, is_playing=True, title="Title", artists=("Artist",), image="b.jpg",
+                            progress=42000000, duration=185000000, shuffle=False, track_id="2",
+                            href="/album/1/track/2")
+    assert not s.precise
+
+
+def test_snapshot_prefers_the_media_element():
+    s = _snapshot(_result(media={"time": 42.25, "duration": 185.5, "paused": True, "volume": 0.5, "rate": 1.5}))
+    assert (s.progress, s.duration, s.is_playing, s.volume, s.rate, s.precise) == \
+           (42250000, 185500000, False, 0.5, 1.5, True)
+
+
+def test_snapshot_of_a_page_without_a_player():
+    assert _snapshot(None) == PlayerState()
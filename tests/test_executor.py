@@ -0,0 +1,98 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+from tidal_chrome.executor import PRIORITY_BACKGROUND, PRIORITY_POLL, PRIORITY_USER
+
+
+def _block(executor) -> threading.Event:
+    # Hold the worker until the returned event is set, so that jobs queue up
+    release, started = threading.Event(), threading.Event()
+
+    def wait():
+        started.set()
+        release.wait(5)
+
+    executor.submit(wait)
+    assert started.wait(5)
+    return release
+
+
+def test_runs_in_priority_order(executor):
+    order = []
+    release = _block(executor)
+    futures = [executor.submit(order.append, "background", priority=PRIORITY_BACKGROUND),
+               executor.submit(order.append, "poll", priority=PRIORITY_POLL),
+               executor.submit(order.append, "user 1", priority=PRIORITY_USER),
+               executor.submit(order.append, "user 2", priority=PRIORITY_USER)]
+    release.set()
+    for f in futures:
+        f.result(5)
+    assert order == ["user 1", "user 2", "poll", "background"]
+
+
+def test_key_supersedes_queued_job(executor):
+    release = _block(executor)
+    first = executor.submit(lambda: 1, priority=PRIORITY_POLL, key="snapshot")
+    second = executor.submit(lambda: 2, priority=PRIORITY_POLL, key="snapshot")
+    other = executor.submit(lambda: 3, priority=PRIORITY_POLL, key="queue")
+    release.set()
+    assert second.result(5) == 2
+    assert other.result(5) == 3
+    assert first.cancelled()
+
+
+def test_tuple_keys_only_supersede_the_same_arguments(executor):
+    release = _block(executor)
+    first = executor.submit(lambda: 1, priority=PRIORITY_BACKGROUND, key=("fetch_resource", "a.jpg"))
+    second = executor.submit(lambda: 2, priority=PRIORITY_BACKGROUND, key=("fetch_resource", "b.jpg"))
+    third = executor.submit(lambda: 3, priority=PRIORITY_BACKGROUND, key=("fetch_resource", "a.jpg"))
+    release.set()
+    assert second.result(5) == 2
+    assert third.result(5) == 3
+    assert first.cancelled()
+
+
+def test_key_is_free_once_job_started(executor):
+    assert executor.call(lambda: 1, key="snapshot") == 1
+    assert executor.call(lambda: 2, key="snapshot") == 2
+
+
+def test_drops_jobs_older_than_max_age(executor):
+    release = _block(executor)
+    old = executor.submit(lambda: 1, priority=PRIORITY_POLL, max_age=0.01)
+    fresh = executor.submit(lambda: 2, priority=PRIORITY_POLL, max_age=60)
+    time.sleep(0.05)
+    release.set()
+    assert fresh.result(5) == 2
+    with pytest.raises(CancelledError):
+        old.result(5)
+
+
+def test_call_propagates_exceptions(executor):
+    def fail():
+        raise ValueError("failed")
+
+    with pytest.raises(ValueError):
+        executor.call(fail)
+
+
+def test_call_from_worker_runs_inline(executor):
+    # Would deadlock if the nested call were queued behind the running job
+    assert executor.call(lambda: executor.call(lambda: threading.current_thread().name)) == "test"
+
+
+def test_stop_cancels_queued_jobs(executor):
+    release = _block(executor)
+    queued = executor.submit(lambda: 1)
+    executor.stop()
+    release.set()
+    with pytest.raises(CancelledError):
+        queued.result(5)
+    assert executor.submit(lambda: 2).cancelled()
@@ -0,0 +1,45 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+from tidal_chrome.locators import ElementCache
+
+
+def _cache():
+    released = []
+    return ElementCache(lambda: released.append(True)), released
+
+
+def test_serves_cached_elements():
+    cache, _ = _cache()
+    assert cache.get(("play_button",)) is None
+    cache.put(("play_button",), ["el-1"])
+    assert cache.get(("play_button",)) == ["el-1"]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_does_not_cache_missing_elements():
+    cache, _ = _cache()
+    cache.put(("queue_row", "3"), [])
+    assert cache.get(("queue_row", "3")) is None
+
+
+def test_route_change_drops_the_cache():
+    cache, released = _cache()
+    cache.set_route("/album/1")
+    cache.put(("play_button",), ["el-1"])
+    cache.set_route("/album/1")
+    assert cache.get(("play_button",)) == ["el-1"]
+    cache.set_route("/playlist/2")
+    assert cache.route == "/playlist/2"
+    assert cache.get(("play_button",)) is None
+    assert cache.invalidations == 1
+    # Called for the first route and for the change, but not for the same route
+    assert len(released) == 2
+
+
+def test_invalidate_releases_handles_even_if_empty():
+    cache, released = _cache()
+    cache.invalidate()
+    assert cache.invalidations == 0
+    assert released == [True]
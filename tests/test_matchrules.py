@@ -0,0 +1,67 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import pytest
+
+from tidal_chrome import BUS_NAME
+from tidal_chrome.matchrules import matches_bridge, parse
+
+OWN = {BUS_NAME, ":1.42"}
+
+
+@pytest.mark.parametrize("rule, expected", [
+    ("type='signal'", {"type": "signal"}),
+    ("type='signal',sender='org.mpris.MediaPlayer2.tidal-chrome',path='/org/mpris/MediaPlayer2'",
+     {"type": "signal", "sender": "org.mpris.MediaPlayer2.tidal-chrome", "path": "/org/mpris/MediaPlayer2"}),
+    # Spaces around pairs, and unquoted values
+    (" type = signal , member='Seeked' ", {"type": "signal", "member": "Seeked"}),
+    # Commas and backslashes are literal within quotes
+    ("arg0='a,b',arg1='c\\d'", {"arg0": "a,b", "arg1": "c\\d"}),
+    # An escaped apostrophe between quoted parts
+    ("arg0='it'\\''s',type='signal'", {"arg0": "it's", "type": "signal"}),
+    ("arg0=\\'", {"arg0": "'"}),
+    ("arg0=''", {"arg0": ""}),
+    ("", {}),
+])
+def test_parse(rule, expected):
+    assert parse(rule) == expected
+
+
+@pytest.mark.parametrize("rule", ["type", "type='signal',member", "='signal'", "arg0='unterminated"])
+def test_parse_rejects_malformed_rules(rule):
+    with pytest.raises(ValueError):
+        parse(rule)
+
+
+@pytest.mark.parametrize("rule, expected", [
+    ("type='signal',sender='org.mpris.MediaPlayer2.tidal-chrome'", True),
+    ("type='signal',sender=':1.42',interface='org.freedesktop.DBus.Properties'", True),
+    ("type='signal',sender='org.mpris.MediaPlayer2.vlc'", False),
+    ("type='method_call',sender='org.mpris.MediaPlayer2.tidal-chrome'", False),
+    # A client watching every player
+    ("type='signal',path='/org/mpris/MediaPlayer2',interface='org.freedesktop.DBus.Properties',"
+     "member='PropertiesChanged'", True),
+    ("type='signal',path_namespace='/org/mpris'", True),
+    ("type='signal',path_namespace='/org/mpris/MediaPlayer2/Other'", False),
+    ("type='signal',path='/org/freedesktop/DBus'", False),
+    ("type='signal',interface='org.mpris.MediaPlayer2.Player',member='Seeked'", True),
+    ("type='signal',interface='org.mpris.MediaPlayer2.Player',member='PropertiesChanged'", False),
+    ("type='signal',interface='org.freedesktop.DBus',member='NameOwnerChanged'", False),
+    # PropertiesChanged filtered by interface
+    ("type='signal',member='PropertiesChanged',arg0='org.mpris.MediaPlayer2.Player'", True),
+    ("type='signal',member='PropertiesChanged',arg0='org.freedesktop.NetworkManager'", False),
+    ("type='signal',arg0namespace='org.mpris.MediaPlayer2'", True),
+    ("type='signal',arg0namespace='org.mpris'", True),
+    ("type='signal',arg0namespace='org.mpris.MediaPlayer'", False),
+    # Only PropertiesChanged has a string first argument
+    ("type='signal',member='Seeked',arg0namespace='org.mpris'", False),
+    # NameOwnerChanged watchers for MPRIS players are not the bridge's signals
+    ("type='signal',sender='org.freedesktop.DBus',member='NameOwnerChanged',"
+     "arg0namespace='org.mpris.MediaPlayer2'", False),
+    # Commas within a quoted value do not start a new pair
+    ("type='signal',arg0='org.mpris.MediaPlayer2.Player,sender=other'", False),
+    ("type='signal',sender='org.mpris.MediaPlayer2.tidal-chrome',arg0='it'\\''s'", False),
+])
+def test_matches_bridge(rule, expected):
+    assert matches_bridge(rule, OWN) is expected
@@ -0,0 +1,81 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import pytest
+
+from tidal_chrome.metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_are_inclusive_upper_bounds():
+    h = Histogram((0.1, 1))
+    for value in (0.05, 0.1, 0.5, 1, 2):
+        h.observe(value)
+    assert h.counts == [2, 2, 1]
+    assert h.count == 5
+    assert h.sum == pytest.approx(3.65)
+
+
+def test_prometheus_text():
+    m = Metrics()
+    m.inc("ticks_total")
+    m.inc("ticks_total", n=2)
+    m.inc("errors_total", {"method": "next", "exception": "Stale"})
+    m.observe("tick_seconds", 0.003)
+    m.observe("tick_seconds", 20)
+    lines = m.prometheus().splitlines()
+    assert lines[:2] == ['tidal_chrome_errors_total{exception="Stale",method="next"} 1.0',
+                         'tidal_chrome_ticks_total 3.0']
+    # Cumulative counts, ending with +Inf
+    assert 'tidal_chrome_tick_seconds_bucket{le="0.0025"} 0' in lines
+    assert 'tidal_chrome_tick_seconds_bucket{le="0.005"} 1' in lines
+    assert 'tidal_chrome_tick_seconds_bucket{le="10.0"} 1' in lines
+    assert lines[-3:] == ['tidal_chrome_tick_seconds_bucket{le="+Inf"} 2',
+                          'tidal_chrome_tick_seconds_count 2',
+                          'tidal_chrome_tick_seconds_sum 20.003']
+
+
+def test_label_values_are_escaped():
+    m = Metrics()
+    m.inc("calls_total", {"call": 'say "hi" \\ bye'})
+    assert m.prometheus() == 'tidal_chrome_calls_total{call="say \\"hi\\" \\\\ bye"} 1.0\n'
+
+
+def test_stats_reports_the_highest_used_bucket():
+    m = Metrics()
+    m.observe("call_seconds", 0.02, {"method": "next"})
+    m.observe("call_seconds", 0.3, {"method": "next"})
+    m.observe("slow_seconds", 60)
+    stats = m.stats()
+    assert stats['tidal_chrome_call_seconds_count{method="next"}'] == 2
+    assert stats['tidal_chrome_call_seconds_max_bucket{method="next"}'] == 0.5
+    assert stats["tidal_chrome_slow_seconds_max_bucket"] == float("inf")
+
+
+def test_collectors_are_read_with_the_metrics():
+    m = Metrics()
+    hits = [0]
+
+    def collect():
+        hits[0] += 1
+        return [("cache_hits_total", {"cache": "art"}, hits[0])]
+
+    def broken():
+        raise RuntimeError("collector failed")
+
+    m.add_collector(collect)
+    m.add_collector(broken)
+    assert m.stats() == {'tidal_chrome_cache_hits_total{cache="art"}': 1.0}
+    assert m.prometheus() == 'tidal_chrome_cache_hits_total{cache="art"} 2.0\n'
+    m.remove_collector(collect)
+    m.remove_collector(collect)
+    assert m.stats() == {}
+
+
+def test_write_textfile(tmp_path):
+    m = Metrics()
+    m.inc("ticks_total")
+    path = tmp_path / "bridge.prom"
+    m.write_textfile(str(path))
+    assert path.read_text() == "tidal_chrome_ticks_total 1.0\n"
+    assert [p.name for p in tmp_path.iterdir()] == ["bridge.prom"]
@@ -0,0 +1,61 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+from tidal_chrome.playlists import PLAYLIST_PATH, Playlist, PlaylistIndex
+
+
+def _index(*playlists) -> PlaylistIndex:
+    index = PlaylistIndex()
+    index.update(list(playlists))
+    return index
+
+
+def test_path_is_a_valid_object_path():
+    assert Playlist("0a1b-2c3d", "Mix").path == PLAYLIST_PATH + "0a1b_2c3d"
+
+
+def test_resolves_names_exactly_before_ignoring_case():
+    index = _index(Playlist("1", "rock"), Playlist("2", "Rock"), Playlist("3", "Jazz"))
+    assert index.resolve("Rock").id == "2"
+    assert index.resolve("rock").id == "1"
+    assert index.resolve("JAZZ").id == "3"
+    assert index.resolve("Pop") is None
+
+
+def test_first_playlist_with_a_name_wins():
+    index = _index(Playlist("1", "Mix"), Playlist("2", "Mix"))
+    assert index.resolve("Mix").id == "1"
+
+
+def test_rename_updates_the_index_and_is_reported():
+    index = _index(Playlist("1", "Old name"), Playlist("2", "Other"))
+    changed = index.update([Playlist("1", "New name"), Playlist("2", "Other")])
+    assert changed == [Playlist("1", "New name")]
+    assert index.resolve("Old name") is None
+    assert index.resolve("new name").id == "1"
+    assert index.find(Playlist("1", "").path).name == "New name"
+
+
+def test_added_and_removed_playlists_are_not_reported_as_changed():
+    index = _index(Playlist("1", "A"), Playlist("2", "B"))
+    assert index.update([Playlist("2", "B"), Playlist("3", "C")]) == []
+    assert index.find(Playlist("1", "").path) is None
+    assert index.resolve("A") is None
+    assert index.resolve("C").id == "3"
+
+
+def test_unchanged_list_reports_nothing():
+    playlists = [Playlist("1", "A", "icon.png")]
+    index = _index(*playlists)
+    assert index.update(list(playlists)) == []
+    assert index.update([Playlist("1", "A", "other.png")]) == [Playlist("1", "A", "other.png")]
+
+
+def test_pages_in_either_order():
+    index = _index(*(Playlist(str(n), "P%d" % n) for n in range(5)))
+    assert len(index) == 5
+    assert [p.id for p in index.get(1, 2)] == ["1", "2"]
+    assert [p.id for p in index.get(0, 2, reverse=True)] == ["4", "3"]
+    assert index.get(4, 10) == [Playlist("4", "P4")]
+    assert index.get(5, 10) == []
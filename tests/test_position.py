@@ -0,0 +1,85 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import pytest
+
+from tidal_chrome import position
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(position)
+
+
+def test_extrapolates_while_playing(clock):
+    m = position.PositionModel()
+    m.set(5000000, playing=True, rate=1.0)
+    clock.now += 2.5
+    assert m.position() == 7500000
+
+
+def test_holds_while_paused(clock):
+    m = position.PositionModel()
+    m.set(5000000, playing=False)
+    clock.now += 10
+    assert m.position() == 5000000
+
+
+def test_extrapolates_at_the_playback_rate(clock):
+    m = position.PositionModel()
+    m.set(0, playing=True, rate=2.0)
+    clock.now += 3
+    assert m.position() == 6000000
+
+
+def test_rate_change_keeps_the_position(clock):
+    m = position.PositionModel()
+    m.set(0, playing=True, rate=1.0)
+    clock.now += 4
+    m.set_playing(True, 0.5)
+    assert m.position() == 4000000
+    clock.now += 2
+    assert m.position() == 5000000
+
+
+def test_pause_freezes_the_extrapolated_position(clock):
+    m = position.PositionModel()
+    m.set(1000000, playing=True)
+    clock.now += 1
+    m.set_playing(False)
+    clock.now += 30
+    assert m.position() == 2000000
+
+
+def test_never_negative(clock):
+    m = position.PositionModel()
+    m.set(0, playing=True, rate=-1.0)
+    clock.now += 1
+    assert m.position() == 0
+
+
+def test_resample_within_tolerance_is_not_a_seek(clock):
+    m = position.PositionModel()
+    m.set(0, playing=True)
+    clock.now += 10
+    # The page shows whole seconds, so 9 s covers [9 s, 10 s)
+    assert not m.resample(9000000)
+    # The model ran ahead of the interval, so it is pulled back to its end
+    assert m.position() == 9999999
+
+
+def test_resample_moves_forward_to_the_sample(clock):
+    m = position.PositionModel()
+    m.set(0, playing=True)
+    clock.now += 10
+    assert not m.resample(11000000)
+    assert m.position() == 11000000
+
+
+def test_resample_beyond_tolerance_is_a_seek(clock):
+    m = position.PositionModel(tolerance=2000000)
+    m.set(0, playing=True)
+    clock.now += 10
+    assert m.resample(60000000)
+    assert m.position() == 60000000
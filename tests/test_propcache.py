@@ -0,0 +1,85 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import pytest
+
+from tidal_chrome import propcache
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(propcache)
+
+
+class _Owner:
+    """
+    Stands in for the tick thread: counts refreshes and records replies.
+    """
+
+    def __init__(self):
+        self.refreshes = 0
+        self.replies = []
+        self.cache = propcache.PropertyCache({"PlaybackStatus": 5, "Volume": 30}, self.refresh,
+                                             lambda fn: fn())
+
+    def refresh(self):
+        self.refreshes += 1
+
+    def reply(self, name):
+        return lambda: self.replies.append(name)
+
+
+def test_fresh_values_are_answered_at_once(clock):
+    o = _Owner()
+    o.cache.mark(["PlaybackStatus"])
+    clock.now += 5
+    o.cache.read(["PlaybackStatus"], o.reply("a"))
+    assert o.replies == ["a"]
+    assert (o.refreshes, o.cache.hits) == (0, 1)
+
+
+def test_stale_values_wait_for_a_refresh(clock):
+    o = _Owner()
+    o.cache.mark(["PlaybackStatus"])
+    clock.now += 5.1
+    o.cache.read(["PlaybackStatus"], o.reply("a"))
+    assert o.replies == []
+    assert o.cache.pending
+    assert o.refreshes == 1
+    o.cache.mark(["PlaybackStatus"])
+    o.cache.refreshed()
+    assert o.replies == ["a"]
+    assert not o.cache.pending
+
+
+def test_reads_share_a_pending_refresh(clock):
+    o = _Owner()
+    o.cache.read(["PlaybackStatus"], o.reply("a"))
+    o.cache.read(["Volume"], o.reply("b"))
+    assert o.refreshes == 1
+    assert (o.cache.refreshes, o.cache.joined) == (1, 1)
+    o.cache.refreshed()
+    assert o.replies == ["a", "b"]
+
+
+def test_each_property_has_its_own_bound(clock):
+    o = _Owner()
+    o.cache.mark(["PlaybackStatus", "Volume"])
+    clock.now += 10
+    assert o.cache.stale(["PlaybackStatus"])
+    assert not o.cache.stale(["Volume"])
+    assert o.cache.stale(["Volume", "PlaybackStatus"])
+
+
+def test_unlisted_properties_never_go_stale(clock):
+    o = _Owner()
+    assert not o.cache.stale(["Position"])
+    o.cache.read(["Position"], o.reply("a"))
+    assert o.replies == ["a"]
+    assert o.refreshes == 0
+
+
+def test_never_read_properties_are_stale(clock):
+    o = _Owner()
+    assert o.cache.stale(["PlaybackStatus"])
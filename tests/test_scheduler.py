@@ -0,0 +1,53 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import pytest
+
+from tidal_chrome import preferences
+from tidal_chrome.scheduler import TickScheduler
+
+
+@pytest.fixture
+def scheduler():
+    prefs = preferences.Preferences(True)
+    prefs.values.update({"tick_interval_playing": 5, "tick_interval_paused": 15, "tick_interval_stopped": 30,
+                         "tick_track_end_margin": 0.3, "tick_error_backoff_max": 60})
+    return TickScheduler(prefs)
+
+
+def test_interval_follows_the_playback_status(scheduler):
+    assert scheduler.next_delay("Playing") == 5
+    assert scheduler.next_delay("Paused") == 15
+    assert scheduler.next_delay("Stopped") == 30
+
+
+def test_wakes_just_after_the_track_ends(scheduler):
+    assert scheduler.next_delay("Playing", 2000000) == pytest.approx(2.3)
+    # At double speed the track ends in half the time
+    assert scheduler.next_delay("Playing", 2000000, 2.0) == pytest.approx(1.3)
+    # A track end further away than the interval does not delay the tick
+    assert scheduler.next_delay("Playing", 60000000) == 5
+
+
+def test_ignores_an_unknown_track_end(scheduler):
+    assert scheduler.next_delay("Playing", -1) == 5
+    assert scheduler.next_delay("Playing", 2000000, 0) == 5
+
+
+def test_error_delay_doubles_up_to_the_maximum(scheduler):
+    assert [scheduler.error_delay() for _ in range(6)] == [5, 10, 20, 40, 60, 60]
+
+
+def test_success_resets_the_backoff(scheduler):
+    for _ in range(5):
+        scheduler.error_delay()
+    scheduler.succeeded()
+    assert scheduler.error_delay() == 5
+
+
+def test_next_delay_resets_the_backoff(scheduler):
+    scheduler.error_delay()
+    scheduler.error_delay()
+    scheduler.next_delay("Paused")
+    assert scheduler.error_delay() == 5
@@ -0,0 +1,136 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+from types import SimpleNamespace
+
+import pytest
+
+from tidal_chrome import supervisor
+from tidal_chrome.metrics import Metrics
+
+
+class _Driver:
+    """
+    Records the calls made to restore playback on a new browser.
+    """
+
+    def __init__(self, shuffle: bool = False, ready: bool = True, plays: bool = True, track_id: str = "2"):
+        self.shuffle = shuffle
+        self.ready = ready
+        self.plays = plays
+        # The track the page starts
+        self.track_id = track_id
+        self.calls = []
+
+    def wait_until_ready(self, timeout: float) -> bool:
+        return self.ready
+
+    def play_page(self, path: str, track_id: str) -> bool:
+        self.calls.append(("play_page", path, track_id))
+        return self.plays
+
+    def snapshot(self):
+        return SimpleNamespace(shuffle=self.shuffle, track_id=self.track_id, duration=180000000)
+
+    def set_position(self, position: int, duration: int) -> None:
+        self.calls.append(("set_position", position))
+
+    def pause(self) -> None:
+        self.calls.append("pause")
+
+    def toggle_shuffle(self) -> None:
+        self.calls.append("toggle_shuffle")
+        self.shuffle = not self.shuffle
+
+    def quit(self) -> None:
+        self.calls.append("quit")
+
+
+def _state(href: str = "/album/100/track/2", shuffle=True, playing=True):
+    return SimpleNamespace(can_play=True, href=href, track_id="2", progress=30000000, shuffle=shuffle,
+                           is_playing=playing)
+
+
+@pytest.fixture
+def clock(fake_clock):
+    return fake_clock(supervisor)
+
+
+def _restart(executor, drivers: list, state=None):
+    metrics = Metrics()
+    s = supervisor.Supervisor(executor, lambda: drivers.pop(0), metrics, max_attempts=2)
+    if state is not None:
+        s.update(state)
+    old = _Driver()
+    installed = []
+    new = s.restart(old, installed.append)
+    return new, old, installed, metrics.stats()
+
+
+def test_restores_the_track_and_shuffle(executor, clock):
+    driver = _Driver(shuffle=False)
+    new, old, installed, stats = _restart(executor, [driver], _state(shuffle=True))
+    assert new is driver and installed == [driver]
+    assert old.calls == ["quit"]
+    assert driver.calls == [("play_page", "/album/100", "2"), "toggle_shuffle", ("set_position", 30000000)]
+    assert stats['tidal_chrome_browser_restarts_total{result="ok"}'] == 1
+
+
+def test_leaves_shuffle_if_it_matches(executor, clock):
+    driver = _Driver(shuffle=True)
+    _restart(executor, [driver], _state("/playlist/0a1b-2c/track/2", shuffle=True))
+    assert driver.calls == [("play_page", "/playlist/0a1b-2c", "2"), ("set_position", 30000000)]
+
+
+def test_leaves_shuffle_if_it_was_unknown(executor, clock):
+    driver = _Driver(shuffle=True)
+    _restart(executor, [driver], _state(shuffle=None))
+    assert driver.calls == [("play_page", "/album/100", "2"), ("set_position", 30000000)]
+
+
+def test_restores_a_paused_player(executor, clock):
+    driver = _Driver(shuffle=True)
+    _restart(executor, [driver], _state(playing=False))
+    assert driver.calls == [("play_page", "/album/100", "2"), ("set_position", 30000000), "pause"]
+
+
+def test_does_not_seek_another_track(executor, clock):
+    driver = _Driver(shuffle=True, track_id="7")
+    _restart(executor, [driver], _state())
+    assert driver.calls == [("play_page", "/album/100", "2")]
+
+
+def test_does_not_toggle_shuffle_if_the_track_did_not_play(executor, clock):
+    driver = _Driver(shuffle=False, plays=False)
+    _restart(executor, [driver], _state(shuffle=True))
+    assert driver.calls == [("play_page", "/album/100", "2")]
+
+
+def test_skips_tracks_not_played_from_a_page(executor, clock):
+    driver = _Driver()
+    new, _, _, _ = _restart(executor, [driver], _state("/track/2"))
+    assert new is driver
+    assert driver.calls == []
+
+
+def test_no_checkpoint_only_starts_the_browser(executor, clock):
+    driver = _Driver()
+    new, _, installed, _ = _restart(executor, [driver])
+    assert new is driver and installed == [driver]
+    assert driver.calls == []
+
+
+def test_retries_a_browser_which_does_not_load(executor, clock):
+    first, second = _Driver(ready=False), _Driver()
+    new, _, _, stats = _restart(executor, [first, second], _state())
+    assert new is second
+    assert first.calls == ["quit"]
+    assert stats['tidal_chrome_browser_restarts_total{result="failed"}'] == 1
+    assert stats['tidal_chrome_browser_restarts_total{result="ok"}'] == 1
+
+
+def test_gives_up_after_max_attempts(executor, clock):
+    new, _, installed, stats = _restart(executor, [_Driver(ready=False), _Driver(ready=False)], _state())
+    assert new is None and installed == []
+    assert stats['tidal_chrome_browser_restarts_total{result="failed"}'] == 2
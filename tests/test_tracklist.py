@@ -0,0 +1,64 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+from tidal_chrome.tracklist import NO_TRACK, TRACK_PATH, TrackIndex, track_path
+
+
+def _p(name: str) -> str:
+    return TRACK_PATH + name
+
+
+def test_first_occurrence_matches_the_metadata_path():
+    assert track_path("1") == _p("1")
+    assert track_path("1", 2) == _p("1_2")
+
+
+def test_duplicates_get_their_own_paths():
+    t = TrackIndex()
+    t.update(["1", "2", "1", "1"])
+    assert t.paths == [_p("1"), _p("2"), _p("1_1"), _p("1_2")]
+    assert t.find(_p("1_2")) == ("1", 2)
+    assert t.find(_p("3")) is None
+
+
+def test_appended_and_inserted_tracks_are_added_after_their_neighbour():
+    t = TrackIndex()
+    t.update(["1", "2"])
+    assert t.update(["0", "1", "3", "2", "4"]) == [("added", _p("0"), NO_TRACK),
+                                                   ("added", _p("3"), _p("1")),
+                                                   ("added", _p("4"), _p("2"))]
+
+
+def test_removed_tracks_come_first():
+    t = TrackIndex()
+    t.update(["1", "2", "3"])
+    assert t.update(["2", "4"]) == [("removed", _p("1")),
+                                    ("removed", _p("3")),
+                                    ("added", _p("4"), _p("2"))]
+
+
+def test_removing_a_duplicate_removes_its_last_occurrence():
+    t = TrackIndex()
+    t.update(["1", "2", "1"])
+    assert t.update(["1", "2"]) == [("removed", _p("1_1"))]
+
+
+def test_unchanged_queue_has_no_changes():
+    t = TrackIndex()
+    t.update(["1", "2"])
+    assert t.update(["1", "2"]) == []
+
+
+def test_reorder_replaces_the_list():
+    t = TrackIndex()
+    t.update(["1", "2", "3"])
+    assert t.update(["1", "3", "2"]) is None
+    assert t.paths == [_p("1"), _p("3"), _p("2")]
+
+
+def test_large_changes_replace_the_list():
+    t = TrackIndex(max_changes=2)
+    t.update(["1"])
+    assert t.update(["1", "2", "3", "4"]) is None
+    assert len(t) == 4
@@ -5,6 +5,9 @@ requires = ['selenium', 'gobject', 'dbus-python']
 OPATH = "/org/mpris/MediaPlayer2"
 BASE_IFACE = "org.mpris.MediaPlayer2"
 PLAYER_IFACE = "org.mpris.MediaPlayer2.Player"
+TRACKLIST_IFACE = "org.mpris.MediaPlayer2.TrackList"
+PLAYLISTS_IFACE = "org.mpris.MediaPlayer2.Playlists"
+DEBUG_IFACE = "org.tidalchrome.Debug"
 BUS_NAME = "org.mpris.MediaPlayer2.tidal-chrome"
 DEFAULT_CONF_PATH = "~/.config/tidal-chrome-prefs.json"
 
@@ -0,0 +1,140 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import hashlib
+import os
+import tempfile
+import threading
+import urllib.request
+from collections import OrderedDict
+from typing import Optional
+
+
+def urllib_fetcher(url: str) -> Optional[bytes]:
+    """
+    Download a URL directly.
+    :param url: The URL to download.
+    :return: The response body, or None on failure.
+    """
+    try:
+        with urllib.request.urlopen(url, timeout=10) as r:
+            return r.read()
+    except (OSError, ValueError) as e:
+        print("Error downloading album art " + url, e)
+        return None
+
+
+class ArtCache:
+
+    def __init__(self, directory: str, max_bytes: int, fetcher: callable = urllib_fetcher):
+        """
+        An on-disk cache of album art, so that each image is downloaded once
+        and served to every MPRIS client as a local file:// URL. The least
+        recently used images are removed once the cache exceeds max_bytes.
+        :param directory: The directory to store images in. It is created if it does not exist.
+        :param max_bytes: The maximum total size of the cached images.
+        :param fetcher: Function taking a URL and returning its contents as bytes, or None on failure.
+        """
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.fetcher = fetcher
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # path: size, least recently used first
+        self._files = OrderedDict()
+        self._size = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            p = os.path.join(self.directory, name)
+            if name.endswith(".tmp"):
+                os.remove(p)
+            elif os.path.isfile(p):
+                st = os.stat(p)
+                entries.append((st.st_mtime, p, st.st_size))
+        for _, p, size in sorted(entries):
+            self._files[p] = size
+            self._size += size
+
+    def path_for(self, url: str) -> str:
+        """
+        :param url: The remote image URL.
+        :return: The path of the cache file for the URL.
+        """
+        ext = os.path.splitext(url.split("?")[0])[1]
+        if len(ext) > 5:
+            ext = ""
+        return os.path.join(self.directory, hashlib.sha1(url.encode("UTF-8")).hexdigest() + ext)
+
+    def get(self, url: str) -> Optional[str]:
+        """
+        Get the local URL of a cached image without fetching it.
+        :param url: The remote image URL.
+        :return: The file:// URL, or None if the image is not cached.
+        """
+        p = self.path_for(url)
+        with self._lock:
+            if p not in self._files:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._files.move_to_end(p)
+        try:
+            os.utime(p)
+        except OSError:
+            with self._lock:
+                self._size -= self._files.pop(p, 0)
+            return None
+        return "file://" + p
+
+    def fetch(self, url: str, fetcher: Optional[callable] = None) -> str:
+        """
+        Get the local URL of an image, fetching it into the cache if needed.
+        :param url: The remote image URL.
+        :param fetcher: Fetcher to use instead of the default one.
+        :return: The file:// URL, or the remote URL if the image could not be fetched.
+        """
+        if not url:
+            return url
+        local = self.get(url)
+        if local is not None:
+            return local
+
+        data = (fetcher or self.fetcher)(url)
+        if not data:
+            return url
+        p = self.path_for(url)
+        tmp = None
+        try:
+            # A unique name, so that concurrent fetches of the same image do not
+            # write into each other's file
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, p)
+        except OSError as e:
+            print("Error writing album art cache file " + p, e)
+            if tmp is not None:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    pass
+            return url
+
+        with self._lock:
+            self._size += len(data) - self._files.pop(p, 0)
+            self._files[p] = len(data)
+            self.__evict()
+        return "file://" + p
+
+    def __evict(self):
+        while self._size > self.max_bytes and len(self._files) > 1:
+            p, size = self._files.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(p)
+            except OSError:
+                pass
@@ -0,0 +1,196 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import os
+import subprocess
+import time
+import urllib.request
+from typing import Optional
+
+TIDAL_URL = "https://listen.tidal.com/"
+
+
+def chrome_arguments(prefs) -> list:
+    """
+    Gets the command line arguments for the TIDAL Chrome app window.
+    :param prefs: The Preferences to use.
+    :return: A list of arguments.
+    """
+    args = ["--disable-sync",
+            "--no-first-run",
+            "--disable-default-apps",
+            "--user-data-dir=" + os.path.expanduser(prefs.values["profile_path"]),
+            "--disable-features=MediaSessionService",
+            "--app=" + TIDAL_URL]
+    if prefs.values["enable_kiosk_mode"]:
+        args.append("--kiosk")
+    return args
+
+
+def debugger_address(prefs) -> str:
+    """
+    :param prefs: The Preferences to use.
+    :return: The "host:port" of Chrome's remote debugging endpoint.
+    """
+    return "127.0.0.1:%d" % prefs.values["remote_debugging_port"]
+
+
+def debugger_reachable(address: str, timeout: float = 0.5) -> bool:
+    """
+    Check whether a browser is already listening on a remote debugging endpoint.
+    :param address: The "host:port" of the endpoint.
+    :param timeout: Maximum time to wait for a response in seconds.
+    :return: True if the endpoint responded.
+    """
+    try:
+        with urllib.request.urlopen("http://%s/json/version" % address, timeout=timeout) as r:
+            r.read()
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def launch_chrome(prefs, detached: bool = False) -> subprocess.Popen:
+    """
+    Start the TIDAL Chrome app window with remote debugging enabled on the
+    "remote_debugging_port" preference, and wait for the endpoint to respond.
+    :param prefs: The Preferences to use.
+    :param detached: Start Chrome in its own session, so that it keeps running
+    when the bridge exits or is killed.
+    :return: The Chrome process.
+    """
+    address = debugger_address(prefs)
+    binary = prefs.values["chrome_binary_path"] or "google-chrome"
+    print("Starting Chrome")
+    process = subprocess.Popen([binary, "--remote-debugging-port=%d" % prefs.values["remote_debugging_port"]] +
+                               chrome_arguments(prefs),
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=detached)
+    deadline = time.monotonic() + 30
+    while not debugger_reachable(address):
+        if process.poll() is not None or time.monotonic() > deadline:
+            break
+        time.sleep(0.1)
+    return process
+
+
+class Backend:
+    """
+    The browser operations used by tidal_chrome_driver.Driver. Scripts are
+    function bodies in the WebDriver style, receiving their arguments in
+    "arguments" and returning with "return"; asynchronous scripts are passed a
+    callback as their last argument. Elements are opaque handles returned by
+    find_elements() which may be passed to scripts.
+
+    Errors are raised as selenium.common.exceptions.WebDriverException (or
+    StaleElementReferenceException for detached elements) by every backend,
+    so that callers handle them in one way.
+
+    attached is True if the backend connected to a browser which was already
+    running, e.g. one left open by a previous bridge, rather than starting it.
+
+    concurrent is True if commands may be sent from other threads while an
+    asynchronous script is running, e.g. the page observer's wait.
+    """
+    attached = False
+    concurrent = False
+
+    def find_elements(self, xpath: str) -> list:
+        """
+        :param xpath: The XPath to evaluate from the document root.
+        :return: A list of element handles, which may be empty.
+        """
+        raise NotImplementedError
+
+    def execute(self, script: str, *args):
+        """
+        Run a synchronous script in the page.
+        :return: The value returned by the script.
+        """
+        raise NotImplementedError
+
+    def execute_async(self, script: str, *args, timeout: float = 10):
+        """
+        Run an asynchronous script in the page and wait for it to call its callback.
+        :param timeout: Maximum time to wait in seconds.
+        :return: The value passed to the callback.
+        """
+        raise NotImplementedError
+
+    def get_property(self, element, name: str):
+        raise NotImplementedError
+
+    def get_attribute(self, element, name: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def get_size(self, element) -> dict:
+        """
+        :return: A dictionary with the "width" and "height" of the element.
+        """
+        raise NotImplementedError
+
+    def click(self, element, x: Optional[float] = None, y: Optional[float] = None) -> None:
+        """
+        Click an element with a real pointer event.
+        :param x: Horizontal offset from the left of the element, or None for the centre.
+        :param y: Vertical offset from the top of the element, or None for the centre.
+        :return: Nothing
+        """
+        raise NotImplementedError
+
+    def hover(self, element, x: float, y: float) -> None:
+        """
+        Move the pointer over an element.
+        :param x: Horizontal offset from the left of the element.
+        :param y: Vertical offset from the top of the element.
+        :return: Nothing
+        """
+        raise NotImplementedError
+
+    def press_escape(self) -> None:
+        raise NotImplementedError
+
+    def release_elements(self) -> None:
+        """
+        Let the browser free every element handle returned so far, which
+        must not be used afterwards. Does nothing by default.
+        :return: Nothing
+        """
+
+    def raise_window(self) -> None:
+        raise NotImplementedError
+
+    def get(self, url: str) -> None:
+        """
+        Navigate the page to a URL, reloading it.
+        :return: Nothing
+        """
+        raise NotImplementedError
+
+    def quit(self) -> None:
+        """
+        Close the browser and release the connection.
+        :return: Nothing
+        """
+        raise NotImplementedError
+
+    def detach(self) -> None:
+        """
+        Release the connection, leaving the browser running so that a later
+        bridge can attach to it.
+        :return: Nothing
+        """
+        raise NotImplementedError
+
+
+def create_backend(prefs) -> Backend:
+    """
+    Start the browser with the backend selected by the "backend" preference.
+    :param prefs: The Preferences to use.
+    :return: The connected Backend.
+    """
+    if prefs.values["backend"] == "cdp":
+        from .cdp_backend import CDPBackend
+        return CDPBackend(prefs)
+    from .selenium_backend import SeleniumBackend
+    return SeleniumBackend(prefs)
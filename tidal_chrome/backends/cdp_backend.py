@@ -0,0 +1,324 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# Chrome DevTools Protocol:
+#   https://chromedevtools.github.io/devtools-protocol/
+
+import itertools
+import json
+import subprocess
+import threading
+import time
+import urllib.request
+from typing import Optional
+
+from selenium.common.exceptions import StaleElementReferenceException, WebDriverException
+
+from . import TIDAL_URL, Backend, debugger_address, debugger_reachable, launch_chrome
+
+OBJECT_GROUP = "tidal-chrome"
+# Number of commands in a row left without a reply before the browser is
+# taken to be hung. A single slow reply is only reported as a timeout.
+MAX_TIMEOUTS = 3
+
+# Wraps a WebDriver style script body. Element arguments (or targets) which
+# have been removed from the document are reported as stale, as chromedriver
+# does.
+SCRIPT_WRAPPER = """function () {
+    if (this instanceof Node && !this.isConnected) throw new Error('stale element reference');
+    for (var i = 0; i < arguments.length; i++) {
+        if (arguments[i] instanceof Node && !arguments[i].isConnected) throw new Error('stale element reference');
+    }
+    return (function () {%s
+}).apply(this, arguments);
+}"""
+
+ASYNC_SCRIPT_WRAPPER = """function () {
+    var a = Array.prototype.slice.call(arguments, 1), t = arguments[0], self = this;
+    return new Promise(function (resolve, reject) {
+        setTimeout(function () { reject(new Error('script timeout')); }, t);
+        a.push(resolve);
+        (function () {%s
+}).apply(self, a);
+    });
+}"""
+
+FIND_SCRIPT = """
+var r = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null), a = [];
+for (var i = 0; i < r.snapshotLength; i++) a.push(r.snapshotItem(i));
+return a;"""
+
+BOX_SCRIPT = """
+if (this.scrollIntoViewIfNeeded) this.scrollIntoViewIfNeeded();
+var r = this.getBoundingClientRect();
+return [r.left, r.top, r.width, r.height];"""
+
+
+class CDPElement:
+    __slots__ = ("object_id",)
+
+    def __init__(self, object_id: str):
+        self.object_id = object_id
+
+
+class CDPBackend(Backend):
+    concurrent = True
+
+    def __init__(self, prefs, address: Optional[str] = None):
+        """
+        Talks to Chrome directly over its remote debugging websocket, without
+        chromedriver.
+        :param prefs: The Preferences to use.
+        :param address: "host:port" of an existing DevTools endpoint to attach
+        to. If None, Chrome is launched with remote debugging enabled on the
+        "remote_debugging_port" preference, unless "persistent_browser" is set
+        and a browser is already listening there.
+        """
+        try:
+            import websocket
+        except ImportError:
+            raise WebDriverException("The websocket-client package must be installed to use the cdp backend.")
+
+        self._process = None
+        if address is not None:
+            self.attached = True
+        else:
+            address = debugger_address(prefs)
+            persistent = prefs.values["persistent_browser"]
+            if persistent and debugger_reachable(address):
+                print("Attaching to Chrome at " + address)
+                self.attached = True
+            else:
+                self._process = launch_chrome(prefs, persistent)
+        self.address = address
+
+        url = self.__find_page(30)
+        self._ws = websocket.create_connection(url, timeout=30, suppress_origin=True, enable_multithread=True)
+        self._ws.settimeout(None)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        # id: [Event set when the reply arrives, reply]
+        self._pending = {}
+        # Why the connection was lost, once it is
+        self._error = None
+        # The WebDriver style message for the lost connection, once it is known
+        self._lost = None
+        self._timeouts = 0
+        self._window = None
+        threading.Thread(target=self.__read, name="cdp-reader", daemon=True).start()
+
+    def __find_page(self, timeout: float) -> str:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                with urllib.request.urlopen("http://%s/json/list" % self.address, timeout=2) as r:
+                    targets = [t for t in json.loads(r.read().decode("UTF-8")) if t.get("type") == "page"]
+                for t in sorted(targets, key=lambda t: not t.get("url", "").startswith(TIDAL_URL)):
+                    if "webSocketDebuggerUrl" in t:
+                        return t["webSocketDebuggerUrl"]
+            except (OSError, ValueError):
+                pass
+            if time.monotonic() > deadline:
+                raise WebDriverException("chrome not reachable: no page target at " + self.address)
+            time.sleep(0.1)
+
+    def __read(self):
+        # Hands each reply to the thread waiting for it
+        try:
+            while True:
+                data = self._ws.recv()
+                if not data:
+                    raise ConnectionError("connection closed")
+                msg = json.loads(data)
+                slot = self._pending.get(msg.get("id"))
+                self._timeouts = 0
+                if slot is not None:
+                    slot[1] = msg
+                    slot[0].set()
+        except Exception as e:
+            # websocket-client exceptions do not share a common base with OSError
+            with self._lock:
+                self._error = repr(e)
+                for slot in self._pending.values():
+                    slot[0].set()
+
+    def send(self, method: str, params: Optional[dict] = None, timeout: float = 30) -> dict:
+        """
+        Send a DevTools command and wait for its result. Commands may be sent
+        from several threads at once, e.g. while an asynchronous script is
+        running. Events are discarded.
+        :param method: The command, e.g. "Runtime.evaluate".
+        :param params: The command parameters.
+        :param timeout: Maximum time to wait for the result in seconds.
+        :return: The result object.
+        """
+        i = next(self._ids)
+        slot = [threading.Event(), None]
+        with self._lock:
+            lost = self._error is not None
+            if not lost:
+                self._pending[i] = slot
+        if lost:
+            raise WebDriverException(self.__lost_message())
+        try:
+            try:
+                self._ws.send(json.dumps({"id": i, "method": method, "params": params or {}}))
+            except Exception as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = repr(e)
+                raise WebDriverException(self.__lost_message())
+            if not slot[0].wait(timeout):
+                self._timeouts += 1
+                if self._timeouts >= MAX_TIMEOUTS:
+                    raise WebDriverException("chrome not reachable: no reply to %d commands in a row, the last "
+                                             "%s after %gs" % (self._timeouts, method, timeout))
+                raise WebDriverException("timeout: no reply to %s within %gs" % (method, timeout))
+        finally:
+            with self._lock:
+                self._pending.pop(i, None)
+        msg = slot[1]
+        if msg is None:
+            raise WebDriverException(self.__lost_message())
+        if "error" in msg:
+            m = msg["error"].get("message", "")
+            if "Could not find object" in m or "Cannot find context" in m:
+                raise StaleElementReferenceException(m)
+            raise WebDriverException(m)
+        return msg["result"]
+
+    def __lost_message(self) -> str:
+        """
+        Describe a closed DevTools connection in the terms of chromedriver's
+        errors: "window already closed" if the page or browser was closed
+        normally, e.g. by the user, so that the bridge quits; "chrome not
+        reachable" if the browser crashed, so that it may be restarted.
+        """
+        if self._lost is None:
+            closed = "window already closed: " + str(self._error)
+            if self._process is not None:
+                try:
+                    code = self._process.wait(2)
+                except subprocess.TimeoutExpired:
+                    # Still running, so only the page was closed
+                    code = 0
+                if code != 0:
+                    closed = "chrome not reachable: Chrome exited with status %d" % code
+            # A browser which was attached to may have been closed or have crashed, which cannot be told apart;
+            # it is not restarted behind the user's back
+            self._lost = closed
+        return self._lost
+
+    def __window(self) -> str:
+        if self._window is None:
+            self._window = self.send("Runtime.evaluate", {"expression": "window",
+                                                          "objectGroup": OBJECT_GROUP})["result"]["objectId"]
+        return self._window
+
+    def __call(self, function: str, target: Optional[str], args, by_value: bool = True, await_promise: bool = False,
+               timeout: float = 30):
+        params = {"functionDeclaration": function,
+                  "objectId": target or self.__window(),
+                  "arguments": [{"objectId": a.object_id} if isinstance(a, CDPElement) else {"value": a}
+                                for a in args],
+                  "returnByValue": by_value,
+                  "awaitPromise": await_promise,
+                  "objectGroup": OBJECT_GROUP}
+        try:
+            r = self.send("Runtime.callFunctionOn", params, timeout)
+        except StaleElementReferenceException:
+            if target is not None or any(isinstance(a, CDPElement) for a in args):
+                raise
+            # The page was reloaded, so the window object must be found again
+            self._window = None
+            params["objectId"] = self.__window()
+            r = self.send("Runtime.callFunctionOn", params, timeout)
+        if "exceptionDetails" in r:
+            d = r["exceptionDetails"]
+            m = d.get("exception", {}).get("description") or d.get("text", "")
+            if "stale element reference" in m:
+                raise StaleElementReferenceException(m)
+            if "script timeout" in m:
+                raise WebDriverException("script timeout")
+            raise WebDriverException("javascript error: " + m)
+        return r["result"]
+
+    def find_elements(self, xpath: str) -> list:
+        r = self.__call(SCRIPT_WRAPPER % FIND_SCRIPT, None, [xpath], by_value=False)
+        props = self.send("Runtime.getProperties", {"objectId": r["objectId"], "ownProperties": True})["result"]
+        el = [(int(p["name"]), CDPElement(p["value"]["objectId"])) for p in props
+              if p["name"].isdigit() and "objectId" in p.get("value", {})]
+        self.send("Runtime.releaseObject", {"objectId": r["objectId"]})
+        return [e for _, e in sorted(el, key=lambda x: x[0])]
+
+    def execute(self, script: str, *args):
+        return self.__call(SCRIPT_WRAPPER % script, None, args).get("value")
+
+    def execute_async(self, script: str, *args, timeout: float = 10):
+        return self.__call(ASYNC_SCRIPT_WRAPPER % script, None, (int(timeout * 1000),) + args, await_promise=True,
+                           timeout=timeout + 5).get("value")
+
+    def get_property(self, element, name: str):
+        return self.__call(SCRIPT_WRAPPER % "return this[arguments[0]];", element.object_id, [name]).get("value")
+
+    def get_attribute(self, element, name: str) -> Optional[str]:
+        return self.__call(SCRIPT_WRAPPER % "return this.getAttribute(arguments[0]);",
+                           element.object_id, [name]).get("value")
+
+    def __box(self, element) -> list:
+        return self.__call(SCRIPT_WRAPPER % BOX_SCRIPT, element.object_id, []).get("value")
+
+    def get_size(self, element) -> dict:
+        box = self.__box(element)
+        return {"width": box[2], "height": box[3]}
+
+    def __mouse(self, element, x: Optional[float], y: Optional[float], click: bool) -> None:
+        box = self.__box(element)
+        px = box[0] + (box[2] / 2 if x is None else x)
+        py = box[1] + (box[3] / 2 if y is None else y)
+        self.send("Input.dispatchMouseEvent", {"type": "mouseMoved", "x": px, "y": py})
+        if click:
+            for t in ("mousePressed", "mouseReleased"):
+                self.send("Input.dispatchMouseEvent", {"type": t, "x": px, "y": py, "button": "left",
+                                                       "clickCount": 1})
+
+    def click(self, element, x: Optional[float] = None, y: Optional[float] = None) -> None:
+        self.__mouse(element, x, y, True)
+
+    def hover(self, element, x: float, y: float) -> None:
+        self.__mouse(element, x, y, False)
+
+    def press_escape(self) -> None:
+        for t in ("keyDown", "keyUp"):
+            self.send("Input.dispatchKeyEvent", {"type": t, "key": "Escape", "code": "Escape",
+                                                 "windowsVirtualKeyCode": 27})
+
+    def raise_window(self) -> None:
+        self.send("Page.bringToFront")
+
+    def release_elements(self) -> None:
+        self.send("Runtime.releaseObjectGroup", {"objectGroup": OBJECT_GROUP})
+        self._window = None
+
+    def get(self, url: str) -> None:
+        self.release_elements()
+        self.send("Page.navigate", {"url": url})
+
+    def quit(self) -> None:
+        try:
+            self.send("Browser.close", timeout=5)
+        except WebDriverException:
+            pass
+        self.detach()
+        if self._process is not None:
+            try:
+                self._process.wait(10)
+            except subprocess.TimeoutExpired:
+                self._process.terminate()
+
+    def detach(self) -> None:
+        try:
+            self._ws.close()
+        except Exception:
+            pass
@@ -0,0 +1,103 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+from typing import Optional
+
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver import Chrome, ChromeOptions, ActionChains
+from selenium.webdriver.common.keys import Keys
+
+from . import Backend, chrome_arguments, debugger_address, debugger_reachable, launch_chrome
+
+
+class SeleniumBackend(Backend):
+
+    def __init__(self, prefs):
+        """
+        Launches Chrome through chromedriver. If "persistent_browser" is set,
+        Chrome is instead started on its own (or left running from a previous
+        run) and chromedriver attaches to its remote debugging port, so that
+        the browser outlives the bridge.
+        """
+        chrome_options = ChromeOptions()
+        # chromedriver does not close a browser it connected to over its debugging port
+        self._debugger = prefs.values["persistent_browser"]
+        if self._debugger:
+            address = debugger_address(prefs)
+            if debugger_reachable(address):
+                print("Attaching to Chrome at " + address)
+                self.attached = True
+            else:
+                launch_chrome(prefs, True)
+            chrome_options.debugger_address = address
+        else:
+            for arg in chrome_arguments(prefs):
+                chrome_options.add_argument(arg)
+
+            if prefs.values["chrome_binary_path"] is not None:
+                chrome_options.binary_location = prefs.values["chrome_binary_path"]
+
+        print("Starting webdriver")
+        self.webdriver = Chrome(prefs.values["chromedriver_binary_path"], options=chrome_options)
+        # Driver applies its own wait policy per locator
+        self.webdriver.implicitly_wait(0)
+        self._script_timeout = None
+
+    def find_elements(self, xpath: str) -> list:
+        return self.webdriver.find_elements_by_xpath(xpath)
+
+    def execute(self, script: str, *args):
+        return self.webdriver.execute_script(script, *args)
+
+    def execute_async(self, script: str, *args, timeout: float = 10):
+        if timeout != self._script_timeout:
+            self._script_timeout = timeout
+            self.webdriver.set_script_timeout(timeout)
+        return self.webdriver.execute_async_script(script, *args)
+
+    def get_property(self, element, name: str):
+        return element.get_property(name)
+
+    def get_attribute(self, element, name: str) -> Optional[str]:
+        return element.get_attribute(name)
+
+    def get_size(self, element) -> dict:
+        return element.size
+
+    def click(self, element, x: Optional[float] = None, y: Optional[float] = None) -> None:
+        action = ActionChains(self.webdriver)
+        if x is None:
+            action.click(element)
+        else:
+            action.move_to_element_with_offset(element, x, y)
+            action.click()
+        action.perform()
+
+    def hover(self, element, x: float, y: float) -> None:
+        ActionChains(self.webdriver).move_to_element_with_offset(element, x, y).perform()
+
+    def press_escape(self) -> None:
+        ActionChains(self.webdriver).send_keys(Keys.ESCAPE).perform()
+
+    def raise_window(self) -> None:
+        self.webdriver.switch_to.window(self.webdriver.current_window_handle)
+
+    def get(self, url: str) -> None:
+        self.webdriver.get(url)
+
+    def quit(self) -> None:
+        if not self._debugger:
+            self.webdriver.quit()
+            return
+        try:
+            self.webdriver.execute_cdp_cmd("Browser.close", {})
+        except WebDriverException as e:
+            # The browser is already closed
+            print("Could not close the browser: ", e.msg)
+        # Ending the session would fail, as the browser is gone
+        self.webdriver.service.stop()
+
+    def detach(self) -> None:
+        # Stopping chromedriver without ending the session leaves an attached browser open
+        self.webdriver.service.stop()
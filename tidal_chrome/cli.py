@@ -11,17 +11,18 @@
 #   https://dbus.freedesktop.org/doc/dbus-specification.html
 
 import sys
-import dbus
-from dbus.mainloop.glib import DBusGMainLoop
 from typing import Optional
 
 from .__init__ import *
+from .launcher import normalise_uri, forward
 
 
-def run(isdebug: Optional[bool] = None):
-    DBusGMainLoop(set_as_default=True)
-    bus = dbus.SessionBus()
-
+def run(isdebug: Optional[bool] = None, probed: bool = False):
+    """
+    :param isdebug: Enable debugging mode, or None to decide from the arguments and preferences.
+    :param probed: Whether the launcher has already tried to forward the URIs and found no
+    bridge running, so that the bus is not asked again.
+    """
     # Parse URI
     import argparse
     par = argparse.ArgumentParser(description=description)
@@ -35,30 +36,23 @@ def run(isdebug: Optional[bool] = None):
                      default=None, metavar="FILE")
     par.add_argument('-i', '--interactive', dest="interactive", action='store_true',
                      help='Enable interactive prompt for debugging.')
-    par.add_argument('URI', nargs='?', help='TIDAL URI to open.', metavar="tidal://...|https://listen.tidal.com/...")
+    par.add_argument('URI', nargs='*', help='TIDAL URIs to open.', metavar="tidal://...|https://listen.tidal.com/...")
     args = par.parse_args()
 
     if args.isdebug:
         isdebug = True
 
-    l = None
-    if args.URI is not None:
-        if args.URI.startswith("tidal:/"):
-            l = args.URI
-        else:
-            for pfx in ["https://listen.tidal.com", "https://tidal.com/browse"]:
-                if args.URI.startswith(pfx):
-                    l = args.URI.replace(pfx, "tidal:/")
-                    break
+    uris = [u for u in map(normalise_uri, args.URI) if u is not None]
 
     # Check if already running
-    if bus.name_has_owner(BUS_NAME):
-        if l is not None:
-            bus.call_async(BUS_NAME, OPATH, PLAYER_IFACE, "OpenUri", 's', [l], None, None)
-        bus.call_async(BUS_NAME, OPATH, BASE_IFACE, "Raise", '', [], None, None)
+    if not probed and forward(uris):
         sys.exit(0)
 
     print("TIDAL-Chrome by SERVCUBED")
+    import dbus
+    from dbus.mainloop.glib import DBusGMainLoop
+    DBusGMainLoop(set_as_default=True)
+    bus = dbus.SessionBus()
     import gi
     gi.require_version("Gtk", "3.0")
     from gi.repository import GLib
@@ -73,8 +67,11 @@ def run(isdebug: Optional[bool] = None):
     print("isdebug=" + str(isdebug))
     try:
         t_c = mpris.MPRIS(isdebug, bus, loop, prefs)
-        if l is not None:
-            t_c.driver._driver.get(l.replace("tidal:/", "https://listen.tidal.com"))
+        if uris:
+            # Runs once the browser has started
+            t_c.executor.submit(lambda: t_c.driver.get(uris[0].replace("tidal:/", "https://listen.tidal.com")))
+            for uri in uris[1:]:
+                t_c.executor.submit(lambda u=uri: t_c.driver.open_uri(u))
         if (prefs.values["force_interactive_prompt_if_stdin_isatty"] or args.interactive) and sys.stdin.isatty():
             import threading
             try:
@@ -100,7 +97,8 @@ def run(isdebug: Optional[bool] = None):
 Starting interactive mode. The MPRIS interface can be accessed with \"t_c\";
 Hints:\tloop.quit() to quit;
 \tt_c.driver to access tidal_chrome_driver.Driver;
-\tt_c.driver._driver to access Selenium WebDriver;
+\tt_c.executor.call(fn, *args) to run driver calls on the thread which owns the browser session;
+\tt_c.driver._backend to access the browser backend (t_c.driver._backend.webdriver for Selenium WebDriver);
 \tprefs.values to access preferences dictionary. Note that some changes only take affect after a restart;
 \tprefs.save(path=None) to save preferences to <path>[=None: current set path].""")
                 IPython.embed()
@@ -110,6 +108,12 @@ Hints:\tloop.quit() to quit;
         print("Keyboard interrupt")
         if t_c is not None:
             t_c.quit = True
+            # The driver is only used on the executor, and is None until the browser has started
+            if prefs.values["persistent_browser"] and t_c.driver is not None:
+                try:
+                    t_c.executor.call(t_c.driver.detach, timeout=5)
+                except Exception as e:
+                    print("Error detaching from the browser: ", e)
         loop.quit()
     except Exception as e:
         raise e
@@ -0,0 +1,169 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import operator
+import threading
+
+from . import executor as _executor
+
+
+class Coalescer:
+
+    def __init__(self, executor, fn: callable, window: float, dispatch: callable, merge: callable = operator.add):
+        """
+        Merges bursts of D-Bus commands into a single driver call. Values added
+        within the window after the first one are merged, then fn is run once
+        on the executor with the merged value and every waiting caller is
+        replied to.
+        :param executor: The DriverExecutor to run fn on.
+        :param fn: Function taking the merged value.
+        :param window: Time in seconds to wait for more commands after the first.
+        :param dispatch: Function used to run the reply callbacks on the main loop, e.g. GLib.idle_add.
+        :param merge: Function merging two values.
+        """
+        self._executor = executor
+        self._fn = fn
+        self._window = window
+        self._dispatch = dispatch
+        self._merge = merge
+        self._lock = threading.Lock()
+        self._value = None
+        self._waiters = []
+
+    def add(self, value, reply_handler: callable, error_handler: callable) -> None:
+        """
+        Add a command to the current burst.
+        :param value: Value to merge into the pending one.
+        :param reply_handler: Called with no arguments once the merged command has run.
+        :param error_handler: Called with the exception if the merged command failed.
+        :return: Nothing
+        """
+        with self._lock:
+            first = not self._waiters
+            self._value = value if first else self._merge(self._value, value)
+            self._waiters.append((reply_handler, error_handler))
+        if first:
+            t = threading.Timer(self._window, self.__submit)
+            t.daemon = True
+            t.start()
+
+    def __submit(self):
+        self._executor.submit(self.__run, priority=_executor.PRIORITY_USER).add_done_callback(self.__done)
+
+    def __run(self):
+        with self._lock:
+            value, waiters = self._value, self._waiters
+            self._value, self._waiters = None, []
+        try:
+            self._fn(value)
+        except Exception as e:
+            for _, error_handler in waiters:
+                self._dispatch(error_handler, e)
+        else:
+            for reply_handler, _ in waiters:
+                self._dispatch(reply_handler)
+
+    def __done(self, future):
+        if not future.cancelled():
+            return
+        # The executor was stopped before the burst ran
+        with self._lock:
+            waiters = self._waiters
+            self._value, self._waiters = None, []
+        for _, error_handler in waiters:
+            self._dispatch(error_handler, RuntimeError("Command cancelled"))
+
+
+class SignalCoalescer:
+
+    # Per the MPRIS specification, Position changes are not signalled;
+    # clients extrapolate it and are sent Seeked on discontinuities.
+    NEVER_EMITTED = ("Position",)
+
+    def __init__(self, emit: callable, window: float, dispatch: callable):
+        """
+        Merges PropertiesChanged deltas made within the window after the first
+        one into a single signal per interface. Values equal to the last
+        emitted ones, and values which changed back within the window, are
+        suppressed.
+        :param emit: Function taking the interface name and the changed properties, e.g. the PropertiesChanged signal.
+        :param window: Time in seconds to wait for more changes after the first.
+        :param dispatch: Function used to run emit on the main loop, e.g. GLib.idle_add.
+        """
+        self._emit = emit
+        self._window = window
+        self._dispatch = dispatch
+        self._lock = threading.Lock()
+        # interface: {name: value}
+        self._published = {}
+        self._pending = {}
+        self._timer = None
+        # Signals sent, deltas merged into a pending signal and values dropped
+        self.emitted = 0
+        self.merged = 0
+        self.suppressed = 0
+
+    def seed(self, interface: str, properties: dict) -> None:
+        """
+        Record the values clients already know, e.g. the initial properties.
+        :return: Nothing
+        """
+        with self._lock:
+            self._published.setdefault(interface, {}).update(properties)
+
+    def update(self, interface: str, changed: dict) -> None:
+        """
+        Queue changed properties to be signalled.
+        :param interface: The interface name.
+        :param changed: The changed properties.
+        :return: Nothing
+        """
+        with self._lock:
+            published = self._published.get(interface, {})
+            pending = self._pending.setdefault(interface, {})
+            for name, value in changed.items():
+                if name in self.NEVER_EMITTED:
+                    self.suppressed += 1
+                elif name in pending:
+                    if pending[name] == value:
+                        self.suppressed += 1
+                    else:
+                        pending[name] = value
+                        self.merged += 1
+                elif name in published and published[name] == value:
+                    self.suppressed += 1
+                else:
+                    pending[name] = value
+            if not pending:
+                del self._pending[interface]
+            elif self._timer is None:
+                self._timer = threading.Timer(self._window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self) -> None:
+        """
+        Signal the pending changes now.
+        :return: Nothing
+        """
+        signals = []
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            for interface, pending in self._pending.items():
+                published = self._published.setdefault(interface, {})
+                changed = {}
+                for name, value in pending.items():
+                    if name in published and published[name] == value:
+                        # Changed back within the window
+                        self.suppressed += 1
+                    else:
+                        changed[name] = published[name] = value
+                if changed:
+                    self.emitted += 1
+                    signals.append((interface, changed))
+            self._pending = {}
+        for interface, changed in signals:
+            self._dispatch(self._emit, interface, changed)
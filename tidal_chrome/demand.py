@@ -0,0 +1,139 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import threading
+import time
+from typing import Optional
+
+import dbus
+
+from .__init__ import *
+from .matchrules import matches_bridge
+
+DBUS_NAME = "org.freedesktop.DBus"
+DBUS_PATH = "/org/freedesktop/DBus"
+STATS_IFACE = "org.freedesktop.DBus.Debug.Stats"
+
+
+class DemandTracker:
+
+    def __init__(self, bus, caller_ttl: float, wake: Optional[callable] = None, recheck_interval: float = 30):
+        """
+        Tracks whether any D-Bus client is interested in the player, so that
+        the browser need not be polled when nobody is listening.
+
+        A client is interested if it has called Get or GetAll within the last
+        caller_ttl seconds, or if it holds a match rule for the bridge's
+        signals. Match rules are read with the bus' Debug.Stats interface;
+        if that is not available (e.g. with dbus-broker or a restrictive bus
+        policy), interest is unknown and treated as present, unless a recent
+        caller is enough to decide. Clients are forgotten as soon as their
+        connection closes, from NameOwnerChanged, and the match rules are
+        re-read every recheck_interval seconds, as a client can remove its
+        rule without disconnecting.
+        :param bus: The bus connection the bridge is exported on.
+        :param caller_ttl: Time in seconds a Get/GetAll caller stays interested.
+        :param wake: Called when a new client may be interested, e.g. to resume polling.
+        :param recheck_interval: Maximum age in seconds of the match rules read.
+        """
+        self._bus = bus
+        self._caller_ttl = caller_ttl
+        self._wake = wake
+        self._recheck_interval = recheck_interval
+        self._lock = threading.Lock()
+        self._own = {BUS_NAME, bus.get_unique_name()}
+        # unique name: monotonic time of the last call
+        self._callers = {}
+        # Unique names holding a match rule for the bridge, or None if unknown
+        self._watchers = None
+        self._stats = True
+        self._dirty = True
+        # Monotonic time the match rules were last read
+        self._checked = None
+        bus.add_signal_receiver(self.__name_owner_changed, signal_name="NameOwnerChanged",
+                                dbus_interface=DBUS_NAME, bus_name=DBUS_NAME, path=DBUS_PATH)
+
+    def note_caller(self, sender: Optional[str]) -> None:
+        """
+        Record a Get or GetAll call.
+        :param sender: The unique bus name of the caller.
+        :return: Nothing
+        """
+        if not sender:
+            return
+        with self._lock:
+            new = sender not in self._callers
+            self._callers[sender] = time.monotonic()
+        if new and self._wake is not None:
+            self._wake()
+
+    def interested(self) -> bool:
+        """
+        May make a blocking D-Bus call, so must not be called from the main loop.
+        :return: False only if no client is known to be interested.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for name, t in list(self._callers.items()):
+                if now - t > self._caller_ttl:
+                    del self._callers[name]
+            if self._callers:
+                return True
+            dirty, self._dirty = self._dirty, False
+        if dirty or self._checked is None or now - self._checked >= self._recheck_interval:
+            self.__check_match_rules()
+        with self._lock:
+            return self._watchers is None or len(self._watchers) > 0
+
+    def invalidate(self) -> None:
+        """
+        Re-read the match rules at the next interested() call.
+        :return: Nothing
+        """
+        with self._lock:
+            self._dirty = True
+
+    def __check_match_rules(self):
+        if not self._stats:
+            return
+        try:
+            rules = self._bus.call_blocking(DBUS_NAME, DBUS_PATH, STATS_IFACE, "GetAllMatchRules", "", [],
+                                            timeout=2)
+        except dbus.exceptions.DBusException as e:
+            print("Cannot read D-Bus match rules, so polling continuously: " + e.get_dbus_message())
+            self._stats = False
+            return
+        watchers = set()
+        for name, rs in rules.items():
+            if name in self._own:
+                continue
+            for r in rs:
+                if self.__matches(r):
+                    watchers.add(str(name))
+                    break
+        with self._lock:
+            self._watchers = watchers
+            self._checked = time.monotonic()
+
+    def __matches(self, rule: str) -> bool:
+        try:
+            return matches_bridge(str(rule), self._own)
+        except ValueError as e:
+            print("Ignoring D-Bus match rule: ", e)
+            return False
+
+    def __name_owner_changed(self, name, old_owner, new_owner):
+        # Runs on the main loop
+        if not name.startswith(":"):
+            return
+        if not new_owner:
+            with self._lock:
+                self._callers.pop(name, None)
+                if self._watchers is not None:
+                    self._watchers.discard(name)
+        else:
+            # A new client, which may add match rules for the bridge
+            self.invalidate()
+            if self._wake is not None:
+                self._wake()
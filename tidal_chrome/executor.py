@@ -0,0 +1,111 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import itertools
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Hashable, Optional
+
+# Lower values run first
+PRIORITY_USER = 0
+PRIORITY_POLL = 10
+PRIORITY_BACKGROUND = 20
+
+
+class _Job:
+    __slots__ = ("future", "fn", "args", "key", "submitted", "max_age")
+
+    def __init__(self, fn, args, key, max_age):
+        self.future = Future()
+        self.fn = fn
+        self.args = args
+        self.key = key
+        self.submitted = time.monotonic()
+        self.max_age = max_age
+
+
+class DriverExecutor:
+
+    def __init__(self, name: str = "driver"):
+        """
+        Runs all calls to the browser session on a single worker thread which
+        owns it, in priority order. User commands are run before queued polls,
+        and polls which have been superseded or waited too long are dropped.
+        """
+        self._queue = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._keys = {}
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn: callable, *args, priority: int = PRIORITY_USER, key: Optional[Hashable] = None,
+               max_age: Optional[float] = None) -> Future:
+        """
+        Queue a call to run on the worker thread.
+        :param fn: The function to call.
+        :param args: Arguments to pass to fn.
+        :param priority: One of the PRIORITY_* values. Lower values run first.
+        :param key: If set, a queued job with the same key is cancelled, as this one supersedes it.
+        :param max_age: If set, the job is cancelled if it has not started within this many seconds.
+        :return: A Future for the result of the call.
+        """
+        job = _Job(fn, args, key, max_age)
+        if self._stopped:
+            job.future.cancel()
+            return job.future
+        with self._lock:
+            if key is not None:
+                old = self._keys.get(key)
+                if old is not None:
+                    old.future.cancel()
+                self._keys[key] = job
+            self._queue.put((priority, next(self._seq), job))
+        return job.future
+
+    def call(self, fn: callable, *args, priority: int = PRIORITY_USER, key: Optional[Hashable] = None,
+             max_age: Optional[float] = None, timeout: Optional[float] = None):
+        """
+        Run a call on the worker thread and wait for its result. Calls made from
+        the worker thread itself are run immediately.
+        :return: The result of fn. Raises concurrent.futures.CancelledError if the
+        job was dropped, or the exception raised by fn.
+        """
+        if threading.current_thread() is self._thread:
+            return fn(*args)
+        return self.submit(fn, *args, priority=priority, key=key, max_age=max_age).result(timeout)
+
+    def stop(self) -> None:
+        """
+        Stop the worker thread once the jobs already running have finished.
+        Queued jobs are cancelled.
+        :return: Nothing
+        """
+        self._stopped = True
+        self._queue.put((-1, next(self._seq), None))
+
+    def __run(self):
+        while True:
+            job = self._queue.get()[2]
+            if job is None:
+                break
+            with self._lock:
+                if job.key is not None and self._keys.get(job.key) is job:
+                    del self._keys[job.key]
+            if job.max_age is not None and time.monotonic() - job.submitted > job.max_age:
+                job.future.cancel()
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                job.future.set_result(job.fn(*job.args))
+            except BaseException as e:
+                job.future.set_exception(e)
+
+        while not self._queue.empty():
+            job = self._queue.get_nowait()[2]
+            if job is not None:
+                job.future.cancel()
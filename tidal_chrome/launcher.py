@@ -0,0 +1,73 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# Entry point of the tidal-chrome executable. Launches from the .desktop file
+# and the tidal:// handler usually find the bridge already running, so URIs
+# are forwarded to it with as few imports as possible. The server (selenium,
+# gi, mpris) is only imported when this process has to become it.
+#
+# Keep the imports of this module and tidal_chrome/__init__.py to the
+# standard library and dbus; benchmarks/bench_imports.py checks the budget.
+
+import sys
+
+from .__init__ import BUS_NAME, OPATH, BASE_IFACE, PLAYER_IFACE
+
+URI_PREFIXES = ("https://listen.tidal.com", "https://tidal.com/browse")
+
+
+# typing is not imported, as it alone costs more than the rest of the launcher
+def normalise_uri(uri: str) -> "Optional[str]":
+    """
+    Convert a TIDAL web URL to a tidal:/ URI.
+    :param uri: A tidal:/ URI or TIDAL web URL.
+    :return: The tidal:/ URI, or None if it is not a TIDAL URI.
+    """
+    if uri.startswith("tidal:/"):
+        return uri
+    for pfx in URI_PREFIXES:
+        if uri.startswith(pfx):
+            return uri.replace(pfx, "tidal:/", 1)
+    return None
+
+
+def forward(uris: list) -> bool:
+    """
+    Open URIs in an already running bridge and raise its window.
+    :param uris: tidal:/ URIs to open, in order.
+    :return: True if a bridge was running, False if this process should start one.
+    """
+    try:
+        import dbus
+    except ImportError:
+        return False
+    # A private connection, so that the shared one can later be created with the main loop
+    bus = dbus.SessionBus(private=True)
+    try:
+        if not bus.name_has_owner(BUS_NAME):
+            return False
+        for uri in uris:
+            bus.call_async(BUS_NAME, OPATH, PLAYER_IFACE, "OpenUri", 's', [uri], None, None)
+        bus.call_async(BUS_NAME, OPATH, BASE_IFACE, "Raise", '', [], None, None)
+        bus.flush()
+        return True
+    finally:
+        bus.close()
+
+
+def main():
+    args = sys.argv[1:]
+    # Anything with options is left to the full argument parser
+    probed = not any(a.startswith("-") for a in args)
+    if probed:
+        uris = [u for u in map(normalise_uri, args) if u is not None]
+        if forward(uris):
+            sys.exit(0)
+
+    from .cli import run
+    run(probed=probed)
+
+
+if __name__ == '__main__':
+    main()
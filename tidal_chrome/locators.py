@@ -0,0 +1,125 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+from typing import NamedTuple, Optional
+
+
+class Locator(NamedTuple):
+    """
+    An XPath to an element of the TIDAL web client, with the time to wait for
+    it to appear. State probes use a wait of 0 so that a missing element
+    returns immediately; interactive flows wait for the page to respond.
+
+    Only locators whose match does not depend on mutable attributes (e.g. the
+    play button's title) may be cached, as a cached element is reused until
+    it goes stale.
+    """
+    xpath: str
+    wait: float = 0
+    cache: bool = False
+
+    def format(self, *args) -> "Locator":
+        """
+        Substitute arguments into a parameterised XPath.
+        :return: A new Locator with the same wait policy.
+        """
+        return self._replace(xpath=self.xpath.format(*args))
+
+
+LOCATORS = {
+    # Player state probes
+    "player": Locator('//div[@id="wimp"]/div/div/div/div[2]', cache=True),
+    "play_button": Locator('//div[@data-test="play-controls"]/div/button', cache=True),
+    "play": Locator('//div[@data-test="play-controls"]/div/button[@title="Play"]'),
+    "pause": Locator('//div[@data-test="play-controls"]/div/button[@title="Pause"]'),
+    "next": Locator('//div[@data-test="play-controls"]/button[@title="Next"]', cache=True),
+    "previous": Locator('//div[@data-test="play-controls"]/button[@title="Previous"]', cache=True),
+    "shuffle": Locator('//div[@data-test="play-controls"]/button[@title="Shuffle"]', cache=True),
+    "favourite": Locator('//button[@data-test="footer-favorite-button"]', cache=True),
+    "track_title": Locator('//div[@data-test="footer-track-title"]/a/span'),
+    "track_artists": Locator('//span[contains(@class,"artist-link")]/a'),
+    "track_image": Locator('//figure[@data-test="current-media-imagery"]/div/div/div/img'),
+    "current_time": Locator('//time[@data-test="current-time"]'),
+    "duration_time": Locator('//time[@data-test="duration-time"]'),
+    "now_playing": Locator('//section[@id="nowPlaying"]/div/div'),
+    "progress_bar": Locator('//div[contains(@class,"progressBarWrapper")]/div/div[contains(@class,'
+                            '"interactionLayer")]', cache=True),
+    "main_link": Locator('//*[@id="main"]//a[1]'),
+    # Only present while the play queue panel has been rendered
+    "queue_next_image": Locator('//div[@data-test="play-queue"]//div[@data-test="tracklist-row"][2]//img'),
+    "play_queue": Locator('//div[@data-test="play-queue"]'),
+    "queue_rows": Locator('//div[@data-test="play-queue"]//div[@data-test="tracklist-row"]'),
+
+    # Interactive flows
+    "fullscreen": Locator('//button[@data-test="fullscreen"]', 2),
+    "toggle_now_playing": Locator('//button[@data-test="toggle-now-playing"]', 2, True),
+    "context_menu_button": Locator('//button[@data-test="footer-context-menu"]', 2, True),
+    "context_menu_add": Locator('//div[@data-test="contextmenu"]/ul/li[1]', 2),
+    "recent_playlist": Locator('//div[@data-type="contextmenu-open"]/div/button['
+                               '@data-test="sub-menu-item-recent-playlist-{0}"]', 2),
+    # Probed once the submenu is open, which recent_playlist waits for
+    "named_playlist": Locator('//div[@data-type="contextmenu-open"]/div[@data-track--icon-clicked="{0}"]/button'),
+    "all_playlists": Locator('//div[@data-type="contextmenu-open"]/div/button['
+                             '@data-test="sub-menu-item-all-playlists"]'),
+    "modal_playlist": Locator('//div[@class="ReactModalPortal"]//*[@data-id="{0}"]', 2),
+    "sidebar_playlists": Locator('//nav[@data-test="sidebar"]//a[contains(@href,"/playlist/")]'),
+    "play_all": Locator('//main//button[@data-test="play-all"]', 2),
+    "page_rows": Locator('//main//div[@data-test="tracklist-row"]', 2),
+    "duplicate_modal_buttons": Locator('//div[@class="ReactModalPortal"]/div/div/div/div/button', 1),
+}
+
+
+class ElementCache:
+
+    def __init__(self, on_invalidate: Optional[callable] = None):
+        """
+        Holds the elements found for cacheable locators, so that they are not
+        looked up from the document root on every call. The cache is cleared
+        when the page route changes or when a cached element goes stale.
+        :param on_invalidate: Called with no arguments whenever the cache is dropped, e.g. to release the element
+        handles in the browser.
+        """
+        self._elements = {}
+        self._on_invalidate = on_invalidate
+        self.route = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key) -> Optional[list]:
+        """
+        :param key: The locator name and arguments.
+        :return: The cached list of elements, or None.
+        """
+        el = self._elements.get(key)
+        if el is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return el
+
+    def put(self, key, elements: list) -> None:
+        if elements:
+            self._elements[key] = elements
+
+    def invalidate(self) -> None:
+        """
+        Drop every cached element.
+        :return: Nothing
+        """
+        if self._elements:
+            self.invalidations += 1
+            self._elements.clear()
+        if self._on_invalidate is not None:
+            self._on_invalidate()
+
+    def set_route(self, route: str) -> None:
+        """
+        Record the current page route, dropping the cache if it changed.
+        :param route: The page path.
+        :return: Nothing
+        """
+        if route != self.route:
+            self.route = route
+            self.invalidate()
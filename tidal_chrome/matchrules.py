@@ -0,0 +1,111 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# Parses D-Bus match rules, as listed by the bus' Debug.Stats interface, to
+# tell whether a client subscribes to the bridge's signals. Kept free of
+# dbus imports, like launcher.py.
+
+from .__init__ import OPATH, BASE_IFACE, PLAYER_IFACE, TRACKLIST_IFACE, PLAYLISTS_IFACE
+
+PROPERTIES_IFACE = "org.freedesktop.DBus.Properties"
+# interface: members of the signals the bridge sends on it
+SIGNALS = {
+    PROPERTIES_IFACE: {"PropertiesChanged"},
+    PLAYER_IFACE: {"Seeked"},
+    TRACKLIST_IFACE: {"TrackListReplaced", "TrackAdded", "TrackRemoved", "TrackMetadataChanged"},
+    PLAYLISTS_IFACE: {"PlaylistChanged"},
+}
+# Interfaces the bridge sends PropertiesChanged for, i.e. the values of its first argument
+PROPERTIES_INTERFACES = {BASE_IFACE, PLAYER_IFACE, TRACKLIST_IFACE, PLAYLISTS_IFACE}
+
+
+def parse(rule: str) -> dict:
+    """
+    Split a match rule into its keys and values. Values may be quoted with
+    apostrophes, within which commas, spaces and backslashes are literal;
+    outside of quotes, \\' is an apostrophe and spaces around values are ignored.
+    :param rule: e.g. "type='signal',sender='org.mpris.MediaPlayer2.tidal-chrome'"
+    :return: {key: value}. Raises ValueError if the rule is malformed.
+    """
+    pairs = {}
+    i = 0
+    n = len(rule)
+    while i < n:
+        eq = rule.find("=", i)
+        if eq < 0:
+            if rule[i:].strip(" ,"):
+                raise ValueError("Match rule key without a value: " + rule[i:])
+            break
+        key = rule[i:eq].strip(" ,")
+        if not key:
+            raise ValueError("Match rule value without a key: " + rule)
+        value = []
+        # Length of the value without unquoted trailing spaces
+        kept = 0
+        quoted = False
+        i = eq + 1
+        while i < n:
+            c = rule[i]
+            if c == "'":
+                quoted = not quoted
+                kept = len(value)
+            elif not quoted and c == "\\" and rule.startswith("'", i + 1):
+                value.append("'")
+                kept = len(value)
+                i += 1
+            elif not quoted and c == ",":
+                break
+            elif quoted or not c.isspace():
+                value.append(c)
+                kept = len(value)
+            elif value:
+                value.append(c)
+            i += 1
+        if quoted:
+            raise ValueError("Unterminated quote in match rule: " + rule)
+        pairs[key] = "".join(value[:kept])
+        i += 1
+    return pairs
+
+
+def is_namespace(name: str, namespace: str) -> bool:
+    """
+    :return: Whether a dotted name is the namespace itself or within it, as with arg0namespace.
+    """
+    return name == namespace or name.startswith(namespace + ".")
+
+
+def matches_bridge(rule: str, own: set) -> bool:
+    """
+    Tell whether a match rule selects any of the bridge's signals.
+    :param rule: The match rule.
+    :param own: The bus names of the bridge, well-known and unique.
+    :return: True if the rule may match a signal sent by the bridge.
+    """
+    keys = parse(rule)
+    if keys.get("type", "signal") != "signal":
+        return False
+    if "sender" in keys and keys["sender"] not in own:
+        return False
+    if "path" in keys and keys["path"] != OPATH:
+        return False
+    if "path_namespace" in keys:
+        ns = keys["path_namespace"].rstrip("/")
+        if OPATH != ns and not OPATH.startswith(ns + "/"):
+            return False
+    ifaces = set(SIGNALS)
+    if "interface" in keys:
+        ifaces &= {keys["interface"]}
+    if "member" in keys:
+        ifaces = {i for i in ifaces if keys["member"] in SIGNALS[i]}
+    # String first arguments are only sent with PropertiesChanged, and name an interface
+    if "arg0" in keys or "arg0namespace" in keys:
+        if PROPERTIES_IFACE not in ifaces:
+            return False
+        if "arg0" in keys and keys["arg0"] not in PROPERTIES_INTERFACES:
+            return False
+        if "arg0namespace" in keys and \
+                not any(is_namespace(i, keys["arg0namespace"]) for i in PROPERTIES_INTERFACES):
+            return False
+    return len(ifaces) > 0
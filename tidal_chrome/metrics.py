@@ -0,0 +1,218 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# Prometheus text format:
+#   https://prometheus.io/docs/instrumenting/exposition_formats/
+
+import bisect
+import functools
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+# Upper bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+PREFIX = "tidal_chrome_"
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        # Not cumulative; the last entry counts values above every bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+
+    def __init__(self):
+        """
+        A registry of counters and latency histograms, keyed by metric name
+        and a tuple of label values. Collectors add values which are owned
+        elsewhere (e.g. cache counters) when the metrics are read.
+        """
+        self._lock = threading.Lock()
+        # (name, labels): value
+        self._counters = {}
+        # (name, labels): Histogram
+        self._histograms = {}
+        # name: label names
+        self._labels = {}
+        self._collectors = []
+
+    def inc(self, name: str, labels: dict = None, n: float = 1) -> None:
+        """
+        Increment a counter.
+        :param name: The metric name, without the tidal_chrome_ prefix.
+        :param labels: {label name: value}.
+        :param n: The amount to add.
+        :return: Nothing
+        """
+        key = self.__key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def observe(self, name: str, value: float, labels: dict = None) -> None:
+        """
+        Record a value, e.g. a duration in seconds, in a histogram.
+        :return: Nothing
+        """
+        key = self.__key(name, labels)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = Histogram()
+            h.observe(value)
+
+    def timer(self, name: str, labels: dict = None) -> "_Timer":
+        """
+        :return: A context manager recording its duration in a histogram.
+        """
+        return _Timer(self, name, labels)
+
+    def add_collector(self, fn: callable) -> None:
+        """
+        :param fn: Function returning a list of (name, labels, value) tuples, called whenever the metrics are read.
+        :return: Nothing
+        """
+        self._collectors.append(fn)
+
+    def remove_collector(self, fn: callable) -> None:
+        """
+        :param fn: A function passed to add_collector. Does nothing if it is not registered.
+        :return: Nothing
+        """
+        if fn in self._collectors:
+            self._collectors.remove(fn)
+
+    def __key(self, name: str, labels: Optional[dict]):
+        if not labels:
+            return name, ()
+        names = tuple(sorted(labels))
+        self._labels.setdefault(name, names)
+        return name, tuple(str(labels[k]) for k in names)
+
+    def __collect(self) -> dict:
+        values = {}
+        for fn in self._collectors:
+            try:
+                for name, labels, value in fn():
+                    values[self.__key(name, labels)] = value
+            except Exception as e:
+                print("Error collecting metrics: ", e)
+        return values
+
+    def __name(self, name: str, labels: tuple, suffix: str = "", extra: str = "") -> str:
+        parts = ['%s="%s"' % (k, v.replace("\\", "\\\\").replace('"', '\\"'))
+                 for k, v in zip(self._labels.get(name, ()), labels)]
+        if extra:
+            parts.append(extra)
+        return PREFIX + name + suffix + ("{%s}" % ",".join(parts) if parts else "")
+
+    def stats(self) -> dict:
+        """
+        Get every value as a flat dictionary, e.g. for D-Bus. Histograms are
+        reported as their _count, _sum and _max_bucket (the upper bound below
+        which all values fall).
+        :return: {metric name with labels: value}
+        """
+        collected = self.__collect()
+        out = {}
+        with self._lock:
+            for (name, labels), v in list(self._counters.items()) + list(collected.items()):
+                out[self.__name(name, labels)] = float(v)
+            for (name, labels), h in self._histograms.items():
+                out[self.__name(name, labels, "_count")] = float(h.count)
+                out[self.__name(name, labels, "_sum")] = h.sum
+                top = max((i for i, c in enumerate(h.counts) if c), default=0)
+                out[self.__name(name, labels, "_max_bucket")] = \
+                    h.buckets[top] if top < len(h.buckets) else float("inf")
+        return out
+
+    def prometheus(self) -> str:
+        """
+        :return: Every value in the Prometheus text format.
+        """
+        collected = self.__collect()
+        lines = []
+        with self._lock:
+            for (name, labels), v in sorted(list(self._counters.items()) + list(collected.items())):
+                lines.append("%s %s" % (self.__name(name, labels), repr(float(v))))
+            for (name, labels), h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, c in zip(h.buckets + (float("inf"),), h.counts):
+                    cumulative += c
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append("%s %d" % (self.__name(name, labels, "_bucket", 'le="%s"' % le), cumulative))
+                lines.append("%s %d" % (self.__name(name, labels, "_count"), h.count))
+                lines.append("%s %s" % (self.__name(name, labels, "_sum"), repr(h.sum)))
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """
+        Write the metrics for the node_exporter textfile collector. The file is
+        replaced atomically so that it is never read half written.
+        :param path: The .prom file to write.
+        :return: Nothing
+        """
+        path = os.path.expanduser(path)
+        tmp = path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(self.prometheus())
+            os.replace(tmp, path)
+        except OSError as e:
+            print("Error writing metrics file " + path, e)
+
+
+class _Timer:
+    __slots__ = ("_metrics", "_name", "_labels", "_start")
+
+    def __init__(self, metrics: Metrics, name: str, labels: Optional[dict]):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._name, time.perf_counter() - self._start, self._labels)
+        return False
+
+
+def _instrumented(name: str, fn: callable) -> callable:
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(self, *args, **kwargs)
+        except Exception as e:
+            self.metrics.inc("driver_exceptions_total", {"method": name, "exception": type(e).__name__})
+            raise
+        finally:
+            self.metrics.observe("driver_call_seconds", time.perf_counter() - start, {"method": name})
+
+    return wrapper
+
+
+def instrument(cls):
+    """
+    Class decorator recording the latency and exceptions of every public
+    method in the instance's "metrics" attribute.
+    """
+    for name, fn in list(vars(cls).items()):
+        if not name.startswith("_") and callable(fn):
+            setattr(cls, name, _instrumented(name, fn))
+    return cls
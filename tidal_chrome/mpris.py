@@ -2,17 +2,33 @@
 # Author: SERVCUBED 2018-
 # License: AGPL
 
+import os
+import re
+import signal
 import sys
 import threading
 import time
 import traceback
+from collections import OrderedDict
+from concurrent.futures import CancelledError
+from typing import Optional
 
 import dbus
 import dbus.service
+from gi.repository import GLib
 from selenium.common.exceptions import WebDriverException
 
 from .__init__ import *
-from . import tidal_chrome_driver
+from . import tidal_chrome_driver, position, scheduler, executor, coalesce, artcache, demand, propcache, tracklist, \
+    metrics, profiler, supervisor
+
+ASYNC_CALLBACKS = ("reply_handler", "error_handler")
+METADATA_CACHE_SIZE = 32
+# Maximum time in seconds to wait for the player to load after starting the browser
+STARTUP_TIMEOUT = 30
+NO_PLAYLIST = dbus.Struct((dbus.ObjectPath("/"), "", ""), signature="oss")
+# Player properties read from the browser by an update tick
+TICK_PROPERTIES = ("PlaybackStatus", "CanPlay", "Metadata", "Shuffle", "Volume", "Rate", "Position")
 
 
 def handle_driver_error(err: str):
@@ -20,7 +36,11 @@ def handle_driver_error(err: str):
 
 
 class MPRIS(dbus.service.Object):
-    def __init__(self, isdebug, bus, loop=None, prefs=None):
+    def __init__(self, isdebug, bus, loop=None, prefs=None, driver_factory: Optional[callable] = None):
+        """
+        :param driver_factory: Function taking the same arguments as
+        tidal_chrome_driver.Driver and returning the driver, e.g. a fake one for benchmarking.
+        """
         self.isdebug = isdebug
         self.loop = loop
         if not prefs:
@@ -28,13 +48,30 @@ class MPRIS(dbus.service.Object):
             prefs = preferences.Preferences(True)
         self.prefs = prefs
         self.quit = False
-        self.driver = tidal_chrome_driver.Driver(prefs, handle_driver_error)
+        self.metrics = metrics.Metrics()
+        self.executor = executor.DriverExecutor()
+        # The driver is used from the executor's worker thread, with one
+        # exception: with a backend which can wait beside other commands
+        # (driver.concurrent_wait), the tick thread calls wait_for_changes
+        # directly, and wake_observer, which ends that wait early, runs on the
+        # executor. The driver is created on the executor in the background, so
+        # the bus name is owned while the browser starts; commands received
+        # meanwhile queue behind it and run once the player has loaded.
+        self.driver = None
+        self._driver_factory = driver_factory or tidal_chrome_driver.Driver
+        self._ready = threading.Event()
+        # Restarts the browser if its session is lost
+        self.supervisor = None
+        if prefs.values["restart_browser"]:
+            self.supervisor = supervisor.Supervisor(self.executor, self.__new_driver, self.metrics,
+                                                    prefs.values["restart_max_attempts"], STARTUP_TIMEOUT)
+        self.executor.submit(self.__start_driver)
 
         self.baseproperties = {"CanQuit": True,
                                "Fullscreen": False,
                                "CanSetFullscreen": True,
                                "CanRaise": True,
-                               "HasTrackList": False,
+                               "HasTrackList": True,
                                "DesktopEntry": "tidal-google-chrome",
                                "Identity": "Tidal-Chrome API bridge",
                                "SupportedUriSchemes": ['tidal'],
@@ -56,51 +93,128 @@ class MPRIS(dbus.service.Object):
                                  }, signature="sv"),
                                  "Volume": 1.0,
                                  "Position": dbus.Int64(0),
-                                 "MinimumRate": 1.0,
-                                 "MaximumRate": 1.0,
+                                 "MinimumRate": 0.5,
+                                 "MaximumRate": 2.0,
                                  "CanGoNext": True,
                                  "CanGoPrevious": True,
                                  "CanPlay": True,
                                  "CanPause": True,
                                  "CanSeek": True,
                                  "CanControl": True}
-        self._last_track_name = ""
+        # Tracks can be added to the play queue but not removed, which MPRIS cannot express
+        self.trackproperties = {"CanEditTracks": False}
+        self.playlistproperties = {"PlaylistCount": dbus.UInt32(0),
+                                   "Orderings": dbus.Array(["UserDefined"], signature="s"),
+                                   "ActivePlaylist": dbus.Struct((False, NO_PLAYLIST), signature="b(oss)")}
+        self.tracklist = tracklist.TrackIndex()
+        # track id: Metadata of the tracks in the play queue
+        self._track_metadata = {}
+        self._last_track_id = ""
+        # track id: ((title, artists, image, duration), Metadata), least recently used first
+        self._metadata = OrderedDict()
+        self._state = tidal_chrome_driver.PlayerState()
+        self.position = position.PositionModel()
+        self.art_cache = None
+        if prefs.values["art_cache_max_bytes"] > 0:
+            self.art_cache = artcache.ArtCache(
+                os.path.join(os.path.expanduser(prefs.values["profile_path"]), "tidal-chrome-art"),
+                prefs.values["art_cache_max_bytes"])
 
         bus.request_name(BUS_NAME)
         bus_name = dbus.service.BusName(BUS_NAME, bus=bus)
         dbus.service.Object.__init__(self, bus_name, OPATH)
 
-        self._timer_i = 0
+        window = prefs.values["command_coalesce_window"]
+        self._skip = coalesce.Coalescer(self.executor, self.__skip, window, GLib.idle_add)
+        self._seek = coalesce.Coalescer(self.executor, self.__seek, window, GLib.idle_add)
+        self._signals = coalesce.SignalCoalescer(self.__emit_properties, prefs.values["signal_coalesce_window"],
+                                                 GLib.idle_add)
+        self._signals.seed(BASE_IFACE, self.baseproperties)
+        self._signals.seed(PLAYER_IFACE, self.playerproperties)
+
+        self.scheduler = scheduler.TickScheduler(prefs)
+        self._wake = threading.Event()
+        # True while the tick thread waits on the page observer outside the executor
+        self._observer_waiting = False
+        # Polling stops while no client is interested
+        self._demand = None
+        if prefs.values["demand_polling"]:
+            self._demand = demand.DemandTracker(bus, prefs.values["demand_caller_ttl"], self.__wake,
+                                                prefs.values["demand_recheck_interval"])
+        self._idle = False
+        # Reads of player properties older than their bound (e.g. while idle) wait for a fresh tick
+        self._cache = propcache.PropertyCache(prefs.values["property_max_age"], self.__wake, GLib.idle_add)
+        self.metrics.add_collector(self.__collect_metrics)
+        self.profiler = profiler.Profiler(prefs.values["profiler_output_dir"], prefs.values["profiler_sample_interval"])
+        # Calls to run at the top of the next tick loop iteration, e.g. to start the tick thread's profiler
+        self._tick_calls = []
+        GLib.unix_signal_add(GLib.PRIORITY_DEFAULT, signal.SIGUSR1, self.__profile_signal)
         self.tick_timer = threading.Thread(target=self.__timer_start)
         self.tick_timer.start()
 
     @dbus.service.method(dbus_interface=BASE_IFACE, in_signature="",
-                         out_signature="")
-    def Raise(self):
-        self.driver.raise_window()
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def Raise(self, reply_handler, error_handler):
+        self.__run_async(self.__raise, reply_handler, error_handler)
 
     @dbus.service.method(dbus_interface=BASE_IFACE, in_signature="",
                          out_signature="")
     def Quit(self):
-        self.driver.quit()
+        # Set first, so that the tick thread does not take the closing browser for a lost session
         self.quit = True
+        if self.driver is not None:
+            self.executor.call(self.driver.quit)
+        self.executor.stop()
+        self._wake.set()
         if self.loop:
             self.loop.quit()
         sys.exit(0)
 
     # Properties
     @dbus.service.method(dbus_interface=dbus.PROPERTIES_IFACE,
-                         in_signature='ss', out_signature='v')
-    def Get(self, interface_name, property_name):
-        return self.GetAll(interface_name)[property_name]
+                         in_signature='ss', out_signature='v', sender_keyword='sender',
+                         async_callbacks=ASYNC_CALLBACKS)
+    def Get(self, interface_name, property_name, sender, reply_handler, error_handler):
+        def reply():
+            try:
+                reply_handler(self.__properties(interface_name)[property_name])
+            except Exception as e:
+                error_handler(e)
+
+        self.__read(interface_name, sender, reply, property_name)
 
     @dbus.service.method(dbus_interface=dbus.PROPERTIES_IFACE,
-                         in_signature='s', out_signature='a{sv}')
-    def GetAll(self, interface_name):
+                         in_signature='s', out_signature='a{sv}', sender_keyword='sender',
+                         async_callbacks=ASYNC_CALLBACKS)
+    def GetAll(self, interface_name, sender, reply_handler, error_handler):
+        def reply():
+            try:
+                reply_handler(self.__properties(interface_name))
+            except Exception as e:
+                error_handler(e)
+
+        self.__read(interface_name, sender, reply)
+
+    def __read(self, interface_name, sender, reply: callable, property_name=None):
+        if self._demand is not None:
+            self._demand.note_caller(sender)
+        # There is nothing to refresh from until the player has loaded
+        if interface_name == PLAYER_IFACE and self._ready.is_set() and self.driver is not None:
+            self._cache.read(TICK_PROPERTIES if property_name is None else (property_name,), reply)
+        else:
+            reply()
+
+    def __properties(self, interface_name):
         if interface_name == BASE_IFACE:
             return self.baseproperties
         elif interface_name == PLAYER_IFACE:
+            self.playerproperties["Position"] = dbus.Int64(self.position.position())
             return self.playerproperties
+        elif interface_name == TRACKLIST_IFACE:
+            self.trackproperties["Tracks"] = dbus.Array(self.tracklist.paths, signature="o")
+            return self.trackproperties
+        elif interface_name == PLAYLISTS_IFACE:
+            return self.playlistproperties
         else:
             raise dbus.exceptions.DBusException(
                 'com.example.UnknownInterface',
@@ -108,12 +222,14 @@ class MPRIS(dbus.service.Object):
                 % interface_name)
 
     @dbus.service.method(dbus_interface=dbus.PROPERTIES_IFACE,
-                         in_signature='ssv')
-    def Set(self, interface_name, property_name, new_value):
+                         in_signature='ssv', async_callbacks=ASYNC_CALLBACKS)
+    def Set(self, interface_name, property_name, new_value, reply_handler, error_handler):
         if interface_name == BASE_IFACE:
-            self.__set_base_property(property_name, new_value)
+            self.__run_async(self.__set_base_property, reply_handler, error_handler, property_name, new_value)
         elif interface_name == PLAYER_IFACE:
-            self.__set_player_property(property_name, new_value)
+            self.__run_async(self.__set_player_property, reply_handler, error_handler, property_name, new_value)
+        else:
+            reply_handler()
 
     @dbus.service.signal(dbus_interface=dbus.PROPERTIES_IFACE,
                          signature='sa{sv}as')
@@ -121,6 +237,9 @@ class MPRIS(dbus.service.Object):
                           invalidated_properties):
         pass
 
+    def __emit_properties(self, interface_name, changed_properties):
+        self.PropertiesChanged(interface_name, changed_properties, [])
+
     @dbus.service.method(dbus_interface=dbus.INTROSPECTABLE_IFACE,
                          in_signature='', out_signature='s',
                          path_keyword='object_path',
@@ -197,78 +316,378 @@ class MPRIS(dbus.service.Object):
         <property type="b" name="CanSeek" access="read"/>
         <property type="b" name="CanControl" access="read"/>
     </interface>
+    <interface name="org.mpris.MediaPlayer2.TrackList">
+        <method name="GetTracksMetadata">
+            <arg type="ao" name="TrackIds" direction="in"/>
+            <arg type="aa{sv}" name="Metadata" direction="out"/>
+        </method>
+        <method name="AddTrack">
+            <arg type="s" name="Uri" direction="in"/>
+            <arg type="o" name="AfterTrack" direction="in"/>
+            <arg type="b" name="SetAsCurrent" direction="in"/>
+        </method>
+        <method name="RemoveTrack">
+            <arg type="o" name="TrackId" direction="in"/>
+        </method>
+        <method name="GoTo">
+            <arg type="o" name="TrackId" direction="in"/>
+        </method>
+        <signal name="TrackListReplaced">
+            <arg type="ao" name="Tracks"/>
+            <arg type="o" name="CurrentTrack"/>
+        </signal>
+        <signal name="TrackAdded">
+            <arg type="a{sv}" name="Metadata"/>
+            <arg type="o" name="AfterTrack"/>
+        </signal>
+        <signal name="TrackRemoved">
+            <arg type="o" name="TrackId"/>
+        </signal>
+        <signal name="TrackMetadataChanged">
+            <arg type="o" name="TrackId"/>
+            <arg type="a{sv}" name="Metadata"/>
+        </signal>
+        <property type="ao" name="Tracks" access="read"/>
+        <property type="b" name="CanEditTracks" access="read"/>
+    </interface>
+    <interface name="org.mpris.MediaPlayer2.Playlists">
+        <method name="ActivatePlaylist">
+            <arg type="o" name="PlaylistId" direction="in"/>
+        </method>
+        <method name="GetPlaylists">
+            <arg type="u" name="Index" direction="in"/>
+            <arg type="u" name="MaxCount" direction="in"/>
+            <arg type="s" name="Order" direction="in"/>
+            <arg type="b" name="ReverseOrder" direction="in"/>
+            <arg type="a(oss)" name="Playlists" direction="out"/>
+        </method>
+        <signal name="PlaylistChanged">
+            <arg type="(oss)" name="Playlist"/>
+        </signal>
+        <property type="u" name="PlaylistCount" access="read"/>
+        <property type="as" name="Orderings" access="read"/>
+        <property type="(b(oss))" name="ActivePlaylist" access="read"/>
+    </interface>
+    <interface name="org.tidalchrome.Debug">
+        <method name="GetStats">
+            <arg type="a{sd}" name="stats" direction="out"/>
+        </method>
+        <method name="GetMetrics">
+            <arg type="s" name="metrics" direction="out"/>
+        </method>
+        <method name="StartProfile">
+            <arg type="d" name="seconds" direction="in"/>
+            <arg type="s" name="path" direction="out"/>
+        </method>
+    </interface>
 </node>
     """
 
     # Player controls
+    # These reply asynchronously once the command has run on the executor, so
+    # that a slow browser never blocks the main loop.
 
     @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature="",
-                         out_signature="")
-    def Next(self):
-        self.driver.next()
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def Next(self, reply_handler, error_handler):
+        self._skip.add(1, reply_handler, error_handler)
 
     @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature="",
-                         out_signature="")
-    def Previous(self):
-        self.driver.previous()
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def Previous(self, reply_handler, error_handler):
+        self._skip.add(-1, reply_handler, error_handler)
 
     @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature="",
-                         out_signature="")
-    def Pause(self):
-        self.driver.pause()
-        self.PropertiesChanged(PLAYER_IFACE, {"PlaybackStatus": "Paused"}, [])
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def Pause(self, reply_handler, error_handler):
+        self.__run_async(self.__pause, reply_handler, error_handler)
 
     @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature="",
-                         out_signature="")
-    def PlayPause(self):
-        ps = self.driver.play_pause()
-        if ps is None:
-            return
-        self.PropertiesChanged(PLAYER_IFACE, {"PlaybackStatus": "Playing" if ps else "Paused"}, [])
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def PlayPause(self, reply_handler, error_handler):
+        self.__run_async(self.__play_pause, reply_handler, error_handler)
 
     @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature="",
-                         out_signature="")
-    def Stop(self):
-        self.Pause()
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def Stop(self, reply_handler, error_handler):
+        self.Pause(reply_handler, error_handler)
 
     @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature="",
-                         out_signature="")
-    def Play(self):
-        if not self.driver.can_play():
-            return
-
-        self.driver.play()
-        self.PropertiesChanged(PLAYER_IFACE, {"PlaybackStatus": "Playing"},
-                               [])
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def Play(self, reply_handler, error_handler):
+        self.__run_async(self.__play, reply_handler, error_handler)
 
     @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature='x',
-                         out_signature="")
-    def Seek(self, offset):
-        position = self.driver.current_track_progress() + offset
-        self.SetPosition("", position)
-        self.Seeked(position)
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def Seek(self, offset, reply_handler, error_handler):
+        self._seek.add(int(offset), reply_handler, error_handler)
 
     @dbus.service.signal(dbus_interface=PLAYER_IFACE, signature='x')
     def Seeked(self, position):
         pass
 
     @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature='ox',
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def SetPosition(self, trackid, position, reply_handler, error_handler):
+        self.__run_async(self.__set_position, reply_handler, error_handler, None, position)
+
+    @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature='s',
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def OpenUri(self, uri, reply_handler, error_handler):
+        self.__run_async(self.__open_uri, reply_handler, error_handler, uri)
+
+    # Track list
+
+    @dbus.service.method(dbus_interface=TRACKLIST_IFACE, in_signature='ao',
+                         out_signature='aa{sv}', async_callbacks=ASYNC_CALLBACKS)
+    def GetTracksMetadata(self, track_ids, reply_handler, error_handler):
+        self.__run_async(self.__get_tracks_metadata, reply_handler, error_handler, list(track_ids), returns=True)
+
+    @dbus.service.method(dbus_interface=TRACKLIST_IFACE, in_signature='sob',
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def AddTrack(self, uri, after_track, set_as_current, reply_handler, error_handler):
+        self.__run_async(self.__add_track, reply_handler, error_handler, uri, after_track, set_as_current)
+
+    @dbus.service.method(dbus_interface=TRACKLIST_IFACE, in_signature='o',
                          out_signature="")
-    def SetPosition(self, trackid, position):
+    def RemoveTrack(self, track_id):
+        raise dbus.exceptions.DBusException(
+            'org.mpris.MediaPlayer2.TrackList.NotSupported',
+            'Tracks cannot be removed from the TIDAL play queue')
+
+    @dbus.service.method(dbus_interface=TRACKLIST_IFACE, in_signature='o',
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def GoTo(self, track_id, reply_handler, error_handler):
+        self.__run_async(self.__go_to, reply_handler, error_handler, track_id)
+
+    @dbus.service.signal(dbus_interface=TRACKLIST_IFACE, signature='aoo')
+    def TrackListReplaced(self, tracks, current_track):
+        pass
+
+    @dbus.service.signal(dbus_interface=TRACKLIST_IFACE, signature='a{sv}o')
+    def TrackAdded(self, metadata, after_track):
+        pass
+
+    @dbus.service.signal(dbus_interface=TRACKLIST_IFACE, signature='o')
+    def TrackRemoved(self, track_id):
+        pass
+
+    @dbus.service.signal(dbus_interface=TRACKLIST_IFACE, signature='oa{sv}')
+    def TrackMetadataChanged(self, track_id, metadata):
+        pass
+
+    # Playlists
+
+    @dbus.service.method(dbus_interface=PLAYLISTS_IFACE, in_signature='uusb',
+                         out_signature='a(oss)', async_callbacks=ASYNC_CALLBACKS)
+    def GetPlaylists(self, index, max_count, order, reverse_order, reply_handler, error_handler):
+        self.__run_async(self.__get_playlists, reply_handler, error_handler, int(index), int(max_count),
+                         bool(reverse_order), returns=True)
+
+    @dbus.service.method(dbus_interface=PLAYLISTS_IFACE, in_signature='o',
+                         out_signature="", async_callbacks=ASYNC_CALLBACKS)
+    def ActivatePlaylist(self, playlist_id, reply_handler, error_handler):
+        self.__run_async(self.__activate_playlist, reply_handler, error_handler, playlist_id)
+
+    @dbus.service.signal(dbus_interface=PLAYLISTS_IFACE, signature='(oss)')
+    def PlaylistChanged(self, playlist):
+        pass
+
+    def __run_async(self, fn: callable, reply_handler: callable, error_handler: callable, *args,
+                    returns: bool = False):
+        def done(f):
+            if f.cancelled():
+                GLib.idle_add(error_handler, RuntimeError("Command cancelled"))
+            elif f.exception() is not None:
+                GLib.idle_add(error_handler, f.exception())
+            elif returns:
+                GLib.idle_add(reply_handler, f.result())
+            else:
+                GLib.idle_add(reply_handler)
+
+        self.executor.submit(fn, *args).add_done_callback(done)
+
+    # Debug interface
+    # Metrics are read without the executor, so they are available while the browser is busy.
+
+    @dbus.service.method(dbus_interface=DEBUG_IFACE, in_signature='', out_signature='a{sd}')
+    def GetStats(self):
+        return dbus.Dictionary(self.metrics.stats(), signature="sd")
+
+    @dbus.service.method(dbus_interface=DEBUG_IFACE, in_signature='', out_signature='s')
+    def GetMetrics(self):
+        return self.metrics.prometheus()
+
+    @dbus.service.method(dbus_interface=DEBUG_IFACE, in_signature='d', out_signature='s')
+    def StartProfile(self, seconds):
+        """
+        Profile the bridge for a number of seconds.
+        :return: The path of the .pstats and .folded files, without extension,
+        or an empty string if a capture is already running.
+        """
+        if seconds <= 0:
+            raise dbus.exceptions.DBusException("The duration must be positive",
+                                                name="org.freedesktop.DBus.Error.InvalidArgs")
+        return self.__start_profile(seconds) or ""
+
+    def __profile_signal(self):
+        self.__start_profile(self.prefs.values["profiler_duration"])
+        # Keep the handler installed
+        return True
+
+    def __start_profile(self, seconds: float) -> Optional[str]:
+        def on_tick_thread(fn):
+            self._tick_calls.append(fn)
+            self.__wake()
+
+        path = self.profiler.start(seconds, {
+            "main": GLib.idle_add,
+            "driver": self.executor.submit,
+            "tick": on_tick_thread,
+        })
+        if path is None:
+            print("A profile is already being captured")
+        else:
+            print("Profiling for %gs" % seconds)
+        return path
+
+    def __collect_metrics(self) -> list:
+        values = [
+            ("properties_changed_total", {"result": "emitted"}, self._signals.emitted),
+            ("properties_changed_total", {"result": "merged"}, self._signals.merged),
+            ("properties_changed_total", {"result": "suppressed"}, self._signals.suppressed),
+            ("property_reads_total", {"result": "hit"}, self._cache.hits),
+            ("property_reads_total", {"result": "refresh"}, self._cache.refreshes),
+            ("property_reads_total", {"result": "joined"}, self._cache.joined),
+            ("polling_idle", None, int(self._idle)),
+        ]
+        if self.art_cache is not None:
+            values.append(("art_cache_lookups_total", {"result": "hit"}, self.art_cache.hits))
+            values.append(("art_cache_lookups_total", {"result": "miss"}, self.art_cache.misses))
+        return values
+
+    # The following run on the executor
+
+    def __new_driver(self):
+        return self._driver_factory(self.prefs, handle_driver_error, metrics=self.metrics)
+
+    def __start_driver(self):
+        try:
+            self.driver = self.__new_driver()
+            if not self.driver.wait_until_ready(STARTUP_TIMEOUT):
+                print("The TIDAL player did not load within %d seconds" % STARTUP_TIMEOUT)
+        except Exception:
+            print("Could not start the browser: ", traceback.format_exc())
+        finally:
+            self._ready.set()
+
+    def __raise(self):
+        self.driver.raise_window()
+
+    def __open_uri(self, uri: str):
+        self.driver.open_uri(uri)
+
+    def __skip(self, count: int):
+        if count > 0:
+            self.driver.next(count)
+        elif count < 0:
+            self.driver.previous(-count)
+
+    def __set_playback_status(self, state: str):
+        # Apply a status change made by a command straight away, rather than
+        # waiting for the next tick to read it back: the position stops or
+        # resumes extrapolating and the cached value is fresh again.
+        if self.playerproperties["PlaybackStatus"] != state:
+            self.playerproperties["PlaybackStatus"] = state
+            self.position.set_playing(state == "Playing")
+            self._signals.update(PLAYER_IFACE, {"PlaybackStatus": state})
+        self._cache.mark(("PlaybackStatus",))
+
+    def __pause(self):
+        self.driver.pause()
+        self.__set_playback_status("Paused")
+
+    def __play_pause(self):
+        ps = self.driver.play_pause()
+        if ps is None:
+            return
+        self.__set_playback_status("Playing" if ps else "Paused")
+
+    def __play(self):
+        if not self.driver.snapshot().can_play:
+            return
+        self.driver.play()
+        self.__set_playback_status("Playing")
+
+    def __seek(self, offset: int):
+        self.__set_position(None, self.position.position() + offset)
+
+    def __set_position(self, state, position):
+        if state is None:
+            state = self.driver.snapshot()
         position = int(position)
-        if not self.driver.can_play() or position < 0 or \
-                position > self.driver.current_track_duration():
+        if not state.can_play or position < 0 or position > state.duration:
             return
-        self.driver.set_position(position)
-        self.PropertiesChanged(PLAYER_IFACE, {"Position": position}, [])
+        self.driver.set_position(position, state.duration)
+        self.position.set(position)
+        self._cache.mark(("Position",))
         self.Seeked(position)
 
-    @dbus.service.method(dbus_interface=PLAYER_IFACE, in_signature='s',
-                         out_signature="")
-    def OpenUri(self, uri):
-        self.driver.open_uri(uri)
+    def __get_tracks_metadata(self, paths: list) -> list:
+        entries = [e for e in map(self.tracklist.find, paths) if e is not None]
+        self.__fetch_track_metadata({track_id for track_id, _ in entries})
+        return [m for m in (self.__queue_metadata(track_id, n) for track_id, n in entries) if m is not None]
+
+    def __add_track(self, uri: str, after_track: str, set_as_current: bool):
+        m = re.search(r'track/(\d+)', uri)
+        if m is None:
+            raise dbus.exceptions.DBusException(
+                'org.mpris.MediaPlayer2.TrackList.InvalidUri', 'Not a TIDAL track URI: ' + uri)
+        # The queue can only be added to after the current track or at the end
+        play_next = set_as_current or after_track == self.playerproperties["Metadata"]['mpris:trackid']
+        if not self.driver.add_track(m.group(1), play_next):
+            raise dbus.exceptions.DBusException(
+                'org.freedesktop.DBus.Error.Failed', 'Could not add the track to the TIDAL play queue')
+        if set_as_current:
+            self.driver.next()
+
+    def __go_to(self, path: str):
+        entry = self.tracklist.find(path)
+        if entry is not None:
+            self.driver.go_to(*entry)
+
+    @staticmethod
+    def __playlist_struct(playlist) -> dbus.Struct:
+        return dbus.Struct((dbus.ObjectPath(playlist.path), playlist.name, playlist.icon), signature="oss")
+
+    def __get_playlists(self, index: int, max_count: int, reverse: bool) -> dbus.Array:
+        if not len(self.driver.playlists):
+            self.__update_playlists()
+        return dbus.Array([self.__playlist_struct(p) for p in self.driver.playlists.get(index, max_count, reverse)],
+                          signature="(oss)")
+
+    def __activate_playlist(self, path: str):
+        playlist = self.driver.playlists.find(path)
+        if playlist is None:
+            raise dbus.exceptions.DBusException(
+                'org.mpris.MediaPlayer2.Playlists.InvalidPlaylist', 'Unknown playlist ' + path)
+        self.driver.play_playlist(playlist)
+        self._signals.update(PLAYLISTS_IFACE, {
+            "ActivePlaylist": dbus.Struct((True, self.__playlist_struct(playlist)), signature="b(oss)")})
+
+    def __update_playlists(self):
+        changed = self.__poll(self.driver.update_playlists, priority=executor.PRIORITY_BACKGROUND)
+        if changed is None:
+            return
+        for p in changed:
+            GLib.idle_add(self.PlaylistChanged, self.__playlist_struct(p))
+        count = dbus.UInt32(len(self.driver.playlists))
+        if self.playlistproperties["PlaylistCount"] != count:
+            self.playlistproperties["PlaylistCount"] = count
+            self._signals.update(PLAYLISTS_IFACE, {"PlaylistCount": count})
 
     def __set_base_property(self, name, value):
+        # Runs on the executor
         if name not in ["Fullscreen"]:
             return
         if self.baseproperties[name] == value:
@@ -276,18 +695,17 @@ class MPRIS(dbus.service.Object):
         if name == "Fullscreen":
             self.driver.set_fullscreen(value)
         self.baseproperties[name] = value
-        self.PropertiesChanged(BASE_IFACE, {name: value}, [])
+        self._signals.update(BASE_IFACE, {name: value})
 
     def __set_player_property(self, name, value):
+        # Runs on the executor
         if name not in ["LoopStatus", "Rate", "Shuffle", "Volume"]:
             return
         if self.playerproperties[name] == value:
             return
         if name == "Shuffle":
-            isshuffle = self.driver.is_shuffle()
-            if isshuffle is None or value == isshuffle:
+            if not self.__set_shuffle(value):
                 return
-            self.driver.toggle_shuffle()
         if name == "LoopStatus":
             value = value.lower()
             if value not in ["track", "playlist"]:
@@ -300,58 +718,212 @@ class MPRIS(dbus.service.Object):
                 if o["action"] == "add_cur_to_playlist":
                     self.driver.add_cur_to_playlist(*o["args"])
             return
+        if name == "Volume":
+            value = min(max(float(value), 0.0), 1.0)
+            if not self.driver.set_volume(value):
+                return
+        if name == "Rate":
+            value = min(max(float(value), self.playerproperties["MinimumRate"]),
+                        self.playerproperties["MaximumRate"])
+            if not self.driver.set_rate(value):
+                return
+            self.position.set_playing(self.playerproperties["PlaybackStatus"] == "Playing", value)
 
         self.playerproperties[name] = value
-        self.PropertiesChanged(PLAYER_IFACE, {name: value}, [])
+        self._cache.mark((name,))
+        self._signals.update(PLAYER_IFACE, {name: value})
+
+    def __set_shuffle(self, value) -> bool:
+        isshuffle = self.driver.snapshot().shuffle
+        if isshuffle is None or value == isshuffle:
+            return False
+        self.driver.toggle_shuffle()
+        return True
+
+    def __poll(self, fn: callable, *args, priority: int = executor.PRIORITY_POLL, key=None):
+        # Background reads give way to user commands, and are dropped if
+        # they could not run within one playing tick interval. Reads which
+        # are not needed for the player state (art, queue, playlists) also
+        # give way to the player state reads, with PRIORITY_BACKGROUND.
+        # A queued read is replaced by a newer one with the same key, which
+        # defaults to the function name.
+        return self.executor.call(fn, *args, priority=priority, key=key or fn.__name__,
+                                  max_age=self.prefs.values["tick_interval_playing"])
+
+    def __fetch_art_from_browser(self, url: str):
+        try:
+            # Fetches of different images must not replace each other
+            return self.__poll(self.driver.fetch_resource, url, priority=executor.PRIORITY_BACKGROUND,
+                               key=("fetch_resource", url))
+        except (WebDriverException, CancelledError):
+            return None
+
+    def __art_url(self, url: str, track_id: str) -> str:
+        if self.art_cache is None or not url:
+            return url
+        local = self.art_cache.fetch(url, self.__fetch_art_from_browser)
+        if local == url:
+            # Not in the browser's cache, so download it and publish the
+            # local copy when it is ready
+            threading.Thread(target=self.__fetch_art_background, args=(url, track_id), daemon=True).start()
+        return local
+
+    def __fetch_art_background(self, url: str, track_id: str):
+        local = self.art_cache.fetch(url)
+        if local == url:
+            return
+
+        def apply():
+            # Runs on the tick thread, which owns the metadata. The track may
+            # have changed during the download.
+            if self._last_track_id != track_id:
+                return
+            metadata = self.playerproperties["Metadata"]
+            if metadata.get('mpris:artUrl') != url:
+                return
+            metadata = dbus.Dictionary(metadata, signature="sv")
+            metadata['mpris:artUrl'] = local
+            entry = self._metadata.get(track_id)
+            if entry is not None:
+                self._metadata[track_id] = (entry[0], metadata)
+            self.playerproperties["Metadata"] = metadata
+            self._signals.update(PLAYER_IFACE, {"Metadata": metadata})
+
+        self._tick_calls.append(apply)
+        self.__wake()
+
+    def __prefetch_art(self, url: str):
+        if self.art_cache.fetch(url, self.__fetch_art_from_browser) == url:
+            self.art_cache.fetch(url)
+
+    def __build_metadata(self, state, fetch_art: bool = True) -> dbus.Dictionary:
+        if fetch_art:
+            art = self.__art_url(state.image, state.track_id)
+        else:
+            # Queued tracks only use art which is already cached
+            art = self.art_cache.get(state.image) if self.art_cache is not None and state.image else None
+        return dbus.Dictionary({
+            'mpris:trackid': dbus.ObjectPath(
+                tracklist.track_path(state.track_id),
+                variant_level=0),
+            'mpris:length': dbus.Int64(state.duration),
+            'mpris:artUrl': art or state.image,
+            'xesam:title': state.title,
+            'xesam:album': "",
+            'xesam:artist': dbus.Array(state.artists, signature="s")
+        }, signature="sv")
+
+    def __metadata(self, snapshot) -> dbus.Dictionary:
+        # Returns the previous Metadata object unless a field has changed, so
+        # that unchanged metadata is never re-emitted
+        fields = (snapshot.title, snapshot.artists, snapshot.image, snapshot.duration)
+        entry = self._metadata.get(snapshot.track_id)
+        if entry is not None:
+            self._metadata.move_to_end(snapshot.track_id)
+            if entry[0] == fields:
+                return entry[1]
+
+        metadata = self.__build_metadata(snapshot)
+        self._metadata[snapshot.track_id] = (fields, metadata)
+        if len(self._metadata) > METADATA_CACHE_SIZE:
+            self._metadata.popitem(last=False)
+        return metadata
+
+    def __fetch_track_metadata(self, track_ids: set):
+        missing = [t for t in track_ids if t not in self._track_metadata]
+        if not missing:
+            return
+        for state in self.__poll(self.driver.queue_metadata, missing, priority=executor.PRIORITY_BACKGROUND):
+            self._track_metadata[state.track_id] = self.__build_metadata(state, False)
+
+    def __queue_metadata(self, track_id: str, occurrence: int) -> Optional[dbus.Dictionary]:
+        metadata = self._track_metadata.get(track_id)
+        if metadata is None or occurrence == 0:
+            return metadata
+        metadata = dbus.Dictionary(metadata, signature="sv")
+        metadata['mpris:trackid'] = dbus.ObjectPath(tracklist.track_path(track_id, occurrence), variant_level=0)
+        return metadata
+
+    def __update_tracklist(self):
+        ids = self.__poll(self.driver.queue, priority=executor.PRIORITY_BACKGROUND)
+        if ids is None:
+            # The play queue panel is not rendered, so only the current track is known
+            ids = [self._last_track_id] if self._last_track_id else []
+        changes = self.tracklist.update(ids)
+        for track_id in set(self._track_metadata) - set(ids):
+            del self._track_metadata[track_id]
+        if changes is None:
+            current = self.playerproperties["Metadata"]['mpris:trackid'] if self._last_track_id \
+                else tracklist.NO_TRACK
+            GLib.idle_add(self.TrackListReplaced, dbus.Array(self.tracklist.paths, signature="o"), current)
+            return
+        added = [self.tracklist.find(c[1]) for c in changes if c[0] == "added"]
+        self.__fetch_track_metadata({track_id for track_id, _ in added})
+        for c in changes:
+            if c[0] == "removed":
+                GLib.idle_add(self.TrackRemoved, c[1])
+                continue
+            metadata = self.__queue_metadata(*self.tracklist.find(c[1]))
+            if metadata is None:
+                metadata = dbus.Dictionary({'mpris:trackid': dbus.ObjectPath(c[1])}, signature="sv")
+            GLib.idle_add(self.TrackAdded, metadata, c[2])
 
     def __update_tick(self):
         if self.isdebug:
             print("Tick")
         changed = {}
 
-        canplay = self.driver.can_play()
+        self._state = snapshot = self.__poll(self.driver.snapshot)
+        if self.supervisor is not None:
+            self.supervisor.update(snapshot)
+        canplay = snapshot.can_play
         if self.playerproperties["CanPlay"] != canplay:
             self.playerproperties["CanPlay"] = canplay
             changed["CanPlay"] = canplay
 
-        state = ("Playing" if self.driver.is_playing() else "Paused") \
+        state = ("Playing" if snapshot.is_playing else "Paused") \
             if canplay else "Stopped"
         if self.playerproperties["PlaybackStatus"] != state:
             self.playerproperties["PlaybackStatus"] = state
             changed["PlaybackStatus"] = state
+            self.position.set_playing(snapshot.is_playing, snapshot.rate)
+
+        if snapshot.precise:
+            for name, value in (("Volume", snapshot.volume), ("Rate", snapshot.rate)):
+                if self.playerproperties[name] != value:
+                    self.playerproperties[name] = changed[name] = value
+                    if name == "Rate":
+                        self.position.set_playing(snapshot.is_playing, value)
 
         if canplay:
-            curr_title = self.driver.current_track_title()
-
-            if self._last_track_name != curr_title:
-                self._last_track_name = curr_title
-                duration = self.driver.current_track_duration()
-                self.playerproperties["Metadata"] = dbus.Dictionary({
-                    'mpris:trackid': dbus.ObjectPath(
-                        '/org/mpris/MediaPlayer2/TrackList/' + str(duration),
-                        variant_level=0),
-                    'mpris:length': dbus.Int64(duration),
-                    'mpris:artUrl': self.driver.current_track_image(),
-                    'xesam:title': curr_title,
-                    'xesam:album': "",
-                    'xesam:artist': dbus.Array(self.driver.current_track_artists(), signature="s")
-                }, signature="sv")
-                changed["Metadata"] = self.playerproperties["Metadata"]
+            metadata = self.__metadata(snapshot)
+            if metadata is not self.playerproperties["Metadata"]:
+                self.playerproperties["Metadata"] = changed["Metadata"] = metadata
+
+            if self._last_track_id != snapshot.track_id:
+                self._last_track_id = snapshot.track_id
                 changed["PlaybackStatus"] = state
+                self.position.set(snapshot.progress, snapshot.is_playing, snapshot.rate)
+                if self.art_cache is not None and snapshot.next_image:
+                    threading.Thread(target=self.__prefetch_art, args=(snapshot.next_image,), daemon=True).start()
+                self.__update_tracklist()
 
-            position = self.driver.current_track_progress()
-            if self.playerproperties["Position"] != position:
-                changed["Position"] = self.playerproperties["Position"] = dbus.Int64(position)
+            # Position is extrapolated by the model and never broadcast; the
+            # page is only sampled to detect seeks. The media element's time
+            # is exact, while the footer text is only accurate to a second.
+            elif self.position.resample(snapshot.progress, 1 if snapshot.precise else 1000000):
+                self.Seeked(self.position.position())
 
             # Update favourited state on track change
             if self.driver.useShuffleAsCurFavourite:
-                isshuffle = self.driver.is_shuffle()
+                isshuffle = snapshot.shuffle
                 if isshuffle is not None and self.playerproperties["Shuffle"] != isshuffle:
                     self.playerproperties["Shuffle"] = isshuffle
                     changed["Shuffle"] = isshuffle
 
-        elif self._last_track_name != "":
-            self._last_track_name = ""
+        elif self._last_track_id != "":
+            self._last_track_id = ""
+            self.__update_tracklist()
             self.playerproperties["Metadata"] = dbus.Dictionary({
                 'mpris:trackid': dbus.ObjectPath(
                     '/org/mpris/MediaPlayer2/TrackList/0',
@@ -363,50 +935,176 @@ class MPRIS(dbus.service.Object):
                 'xesam:artist': dbus.Array([], signature="s")
             }, signature="sv")
             changed["Metadata"] = self.playerproperties["Metadata"]
-            changed["Position"] = self.playerproperties["Position"] = dbus.Int64(0)
+            self.position.set(0, False)
             changed["PlaybackStatus"] = state
 
         if len(changed) > 0:
-            self.PropertiesChanged(PLAYER_IFACE, changed, [])
+            self._signals.update(PLAYER_IFACE, changed)
 
     def __update_reduced_tick(self):
         if self.isdebug:
             print("Reduced Tick")
         changed = {}
 
+        # Uses the snapshot taken by the preceding __update_tick
         if not self.playerproperties["CanPlay"] and self.playerproperties["Shuffle"]:
             self.playerproperties["Shuffle"] = changed["Shuffle"] = False
         else:
-            isshuffle = self.driver.is_shuffle()
+            isshuffle = self._state.shuffle
             if isshuffle is not None and self.playerproperties["Shuffle"] != isshuffle:
                 self.playerproperties["Shuffle"] = isshuffle
                 changed["Shuffle"] = isshuffle
 
         if len(changed) > 0:
-            self.PropertiesChanged(PLAYER_IFACE, changed, [])
+            self._signals.update(PLAYER_IFACE, changed)
+
+        # Picks up queue edits which did not change the current track
+        self.__update_tracklist()
+        self.__update_playlists()
+
+    def __observe(self) -> bool:
+        # chromedriver runs one command at a time, so a pending observer wait
+        # would hold back D-Bus commands; only backends which can wait beside
+        # commands use observer mode
+        if self.prefs.values["update_mode"] != "observer":
+            return False
+        if not self.driver.concurrent_wait:
+            print("Observer mode needs the cdp backend. Falling back to polling")
+            return False
+        return True
+
+    def __wake(self):
+        # Wakes the tick thread, including from a wait on the page observer
+        self._wake.set()
+        if self._observer_waiting:
+            self.executor.submit(self.__wake_observer, key="wake_observer")
+
+    def __wake_observer(self):
+        try:
+            self.driver.wake_observer()
+        except WebDriverException:
+            # The wait ends with its timeout instead
+            pass
+
+    def __session_lost(self, reason: str):
+        if self.supervisor is None:
+            print(reason.strip() + ". Quitting")
+            self.Quit()
+            return
+        print(reason.strip() + ". Restarting the browser")
+
+        def install(driver):
+            self.driver = driver
+
+        if self.supervisor.restart(self.driver, install) is None:
+            print("Could not restart the browser. Quitting")
+            self.Quit()
+
+    def __next_tick_delay(self) -> float:
+        status = self.playerproperties["PlaybackStatus"]
+        remaining = None
+        if status == "Playing" and self._state.duration:
+            remaining = self._state.duration - self.position.position()
+        return self.scheduler.next_delay(status, remaining, self.position.rate)
 
     def __timer_start(self):
-        time.sleep(10)
+        self._ready.wait()
+        if self.driver is None:
+            print("Quitting")
+            self.Quit()
+            return
+        observe = self.__observe()
+        last_tick = last_reduced_tick = 0
         while not self.quit:
+            while self._tick_calls:
+                try:
+                    self._tick_calls.pop(0)()
+                except Exception:
+                    print("Error in tick thread callback: ", traceback.format_exc())
+            if self._demand is not None and not self._cache.pending and not self._demand.interested():
+                if not self._idle and self.isdebug:
+                    print("No MPRIS client is listening. Polling paused")
+                self._idle = True
+                self._wake.wait(self.prefs.values["demand_recheck_interval"])
+                self._wake.clear()
+                self._demand.invalidate()
+                continue
+            self._idle = False
+
+            delay = None
             try:
-                self.__update_tick()
+                if observe and not self._cache.pending:
+                    # The wait runs beside commands, so it leaves the executor free
+                    self._observer_waiting = True
+                    try:
+                        # Checked after the flag is set, so that a wake made meanwhile is not missed
+                        if self._cache.pending:
+                            changes = True
+                        elif self._tick_calls:
+                            changes = []
+                        else:
+                            changes = self.driver.wait_for_changes(self.prefs.values["observer_wait_timeout"])
+                    finally:
+                        self._observer_waiting = False
+                    if changes is None:
+                        # The page was (re)loaded, so the observer must be injected again
+                        if not self.__poll(self.driver.install_observer):
+                            print("Could not install the page observer. Falling back to polling")
+                            observe = False
+                        changes = True
+                    if not changes and \
+                            time.monotonic() - last_tick < self.prefs.values["observer_resync_interval"]:
+                        # Nothing has changed since the last tick, so the cache is up to date
+                        self._cache.mark(TICK_PROPERTIES)
+                        self._cache.refreshed()
+                        self.scheduler.succeeded()
+                        continue
+                    if self.isdebug:
+                        print("Changes: ", changes)
+
+                with self.metrics.timer("tick_seconds"):
+                    self.__update_tick()
+                self._cache.mark(TICK_PROPERTIES)
+                self.scheduler.succeeded()
+                last_tick = time.monotonic()
 
-                self._timer_i += 1
-                if self._timer_i >= 5:
-                    self._timer_i = 0
-                    self.__update_reduced_tick()
+                if last_tick - last_reduced_tick >= self.prefs.values["reduced_tick_interval"]:
+                    last_reduced_tick = last_tick
+                    with self.metrics.timer("reduced_tick_seconds"):
+                        self.__update_reduced_tick()
+                    if self.prefs.values["metrics_textfile"]:
+                        self.metrics.write_textfile(self.prefs.values["metrics_textfile"])
+
+                if not observe:
+                    delay = self.__next_tick_delay()
 
             except WebDriverException as e:
-                if "chrome not reachable" in e.msg or "invalid session id" in e.msg or "window already closed" in e.msg:
+                if self.quit:
+                    break
+                if any(m in e.msg for m in supervisor.SESSION_LOST):
+                    self.__session_lost(e.msg)
+                    observe = self.__observe()
+                elif supervisor.WINDOW_CLOSED in e.msg:
                     print("Quitting")
                     self.Quit()
                 else:
                     print("WebDriverException: " + e.msg)
+                    delay = self.scheduler.error_delay()
+            except CancelledError:
+                # The poll was dropped in favour of user commands
+                pass
             except ConnectionRefusedError:
-                print("Chrome connection refused. Quitting")
-                self.Quit()
+                self.__session_lost("Chrome connection refused")
+                observe = self.__observe()
 
             except Exception:
                 print("Update error: ", traceback.format_exc())
+                delay = self.scheduler.error_delay()
+
+            self._cache.refreshed()
 
-            time.sleep(5)
+            if delay is not None:
+                if self.isdebug:
+                    print("Next tick in %.2fs" % delay)
+                self._wake.wait(delay)
+                self._wake.clear()
@@ -0,0 +1,87 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import re
+from typing import List, NamedTuple, Optional
+
+PLAYLIST_PATH = "/org/mpris/MediaPlayer2/Playlists/"
+
+
+class Playlist(NamedTuple):
+    """
+    A user playlist, as listed in the TIDAL sidebar.
+    """
+    id: str
+    name: str
+    icon: str = ''
+
+    @property
+    def path(self) -> str:
+        """
+        :return: The MPRIS playlist object path.
+        """
+        return PLAYLIST_PATH + re.sub(r'[^A-Za-z0-9_]', '_', self.id)
+
+
+class PlaylistIndex:
+
+    def __init__(self):
+        """
+        The user's playlists in sidebar order, indexed by id, object path and
+        name. Updates only report the playlists which changed.
+        """
+        self.playlists = []
+        self._by_id = {}
+        self._by_path = {}
+        self._by_name = {}
+
+    def __len__(self):
+        return len(self.playlists)
+
+    def update(self, playlists: List[Playlist]) -> List[Playlist]:
+        """
+        Replace the index with a newly read list of playlists.
+        :param playlists: The playlists, in sidebar order.
+        :return: The playlists which were already known but have been renamed
+        or given a new icon.
+        """
+        if playlists == self.playlists:
+            return []
+        changed = [p for p in playlists if p.id in self._by_id and self._by_id[p.id] != p]
+        self.playlists = list(playlists)
+        self._by_id = {p.id: p for p in playlists}
+        self._by_path = {p.path: p for p in playlists}
+        self._by_name = {}
+        # The first playlist with a name wins, exact matches before case-insensitive ones
+        for p in reversed(playlists):
+            self._by_name[p.name.casefold()] = p
+        for p in reversed(playlists):
+            self._by_name[p.name] = p
+        return changed
+
+    def resolve(self, name: str) -> Optional[Playlist]:
+        """
+        Find a playlist by name, exactly or else ignoring case.
+        :param name: The playlist name.
+        :return: The playlist, or None.
+        """
+        return self._by_name.get(name) or self._by_name.get(name.casefold())
+
+    def find(self, path: str) -> Optional[Playlist]:
+        """
+        :param path: An MPRIS playlist object path.
+        :return: The playlist, or None.
+        """
+        return self._by_path.get(path)
+
+    def get(self, index: int, max_count: int, reverse: bool = False) -> List[Playlist]:
+        """
+        Get a page of playlists in sidebar order.
+        :param index: The index of the first playlist.
+        :param max_count: The maximum number of playlists.
+        :param reverse: If True, page through the playlists in reverse order.
+        :return: The playlists.
+        """
+        playlists = self.playlists[::-1] if reverse else self.playlists
+        return playlists[index:index + max_count]
@@ -0,0 +1,100 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import threading
+import time
+from typing import Optional
+
+
+class PositionModel:
+
+    def __init__(self, tolerance: int = 2000000):
+        """
+        Extrapolates the playback position from the last known anchor, so that
+        the position can be read at any time without querying the browser.
+
+        The model stores the anchor position, the monotonic time at which it
+        was taken, the playback rate and whether playback is running.
+        :param tolerance: Maximum difference in microseconds between a sampled
+        position and the extrapolated one before the sample is treated as a
+        seek.
+        """
+        self.tolerance = tolerance
+        self.anchor = 0
+        self.timestamp = time.monotonic()
+        self.rate = 1.0
+        self.playing = False
+        self._lock = threading.Lock()
+
+    def __position(self, now: float) -> int:
+        if not self.playing:
+            return self.anchor
+        return self.anchor + int((now - self.timestamp) * self.rate * 1000000)
+
+    def position(self) -> int:
+        """
+        Gets the extrapolated playback position.
+        :return: The position in microseconds.
+        """
+        with self._lock:
+            return max(0, self.__position(time.monotonic()))
+
+    def set(self, position: int, playing: Optional[bool] = None, rate: Optional[float] = None) -> None:
+        """
+        Re-anchor the model at a known position, e.g. after a seek or a track
+        change.
+        :param position: The position in microseconds.
+        :param playing: Whether playback is running, or None to leave unchanged.
+        :param rate: The playback rate, or None to leave unchanged.
+        :return: Nothing
+        """
+        with self._lock:
+            self.anchor = position
+            self.timestamp = time.monotonic()
+            if playing is not None:
+                self.playing = playing
+            if rate is not None:
+                self.rate = rate
+
+    def set_playing(self, playing: bool, rate: Optional[float] = None) -> None:
+        """
+        Update the playing flag or rate, keeping the current position.
+        :param playing: Whether playback is running.
+        :param rate: The playback rate, or None to leave unchanged.
+        :return: Nothing
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.anchor = self.__position(now)
+            self.timestamp = now
+            self.playing = playing
+            if rate is not None:
+                self.rate = rate
+
+    def resample(self, position: int, resolution: int = 1000000) -> bool:
+        """
+        Compare a position read from the page against the model.
+
+        Sampled positions are truncated to the resolution of the page, so
+        the true position lies in [position, position + resolution). Within
+        the tolerance, the anchor is only nudged back into that interval;
+        beyond it, the model is re-anchored at the sample.
+        :param position: The sampled position in microseconds.
+        :param resolution: The resolution of the sample in microseconds.
+        :return: True if the sample is a discontinuity (i.e. a seek).
+        """
+        with self._lock:
+            now = time.monotonic()
+            expected = self.__position(now)
+            if abs(position - expected) > self.tolerance:
+                self.anchor = position
+                self.timestamp = now
+                return True
+            if expected < position:
+                self.anchor = position
+                self.timestamp = now
+            elif expected >= position + resolution:
+                self.anchor = position + resolution - 1
+                self.timestamp = now
+            return False
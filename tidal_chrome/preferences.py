@@ -18,6 +18,11 @@ class Preferences:
             "chrome_binary_path": None,
             "profile_path": "~/.config/tidal-google-chrome/",
             "chromedriver_binary_path": "chromedriver",
+            "backend": "selenium",
+            "remote_debugging_port": 9222,
+            "persistent_browser": False,
+            "restart_browser": True,
+            "restart_max_attempts": 3,
             "enable_kiosk_mode": False,
             "force_is_debug_if_stdin_isatty": False,
             "force_interactive_prompt_if_stdin_isatty": False,
@@ -25,12 +30,34 @@ class Preferences:
             "use_shuffle_as_cur_favourite": False,
             "use_loop_status_track_for": None,
             "use_loop_status_playlist_for": None,
+            "update_mode": "observer",
+            "observer_wait_timeout": 5.0,
+            "observer_resync_interval": 60,
+            "tick_interval_playing": 5,
+            "tick_interval_paused": 15,
+            "tick_interval_stopped": 30,
+            "tick_track_end_margin": 0.3,
+            "tick_error_backoff_max": 60,
+            "reduced_tick_interval": 25,
+            "demand_polling": True,
+            "demand_caller_ttl": 60,
+            "demand_recheck_interval": 30,
+            "property_max_age": {"PlaybackStatus": 5, "CanPlay": 5, "Metadata": 5,
+                                 "Shuffle": 30, "Volume": 30, "Rate": 30},
+            "command_coalesce_window": 0.15,
+            "signal_coalesce_window": 0.1,
+            "art_cache_max_bytes": 20000000,
+            "metrics_textfile": None,
+            "profiler_output_dir": "~/.cache/tidal-chrome",
+            "profiler_duration": 30,
+            "profiler_sample_interval": 0.005,
             # TODO "scrensaver_inhibitor": None
         }
         # Sample entry for playlist setting preferences:
         # "use_loop_status_track_for": {"action": "add_cur_to_playlist", "args": ("Favourites", False)},
         # "use_loop_status_playlist_for": {"action": "add_cur_to_playlist", "args": (0, None)},
         # See the documentation for Driver.add_cur_to_playlist for details about the args.
+        # The other preferences are described in the Preferences section of README.md.
 
         if default_only:
             return
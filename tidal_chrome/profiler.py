@@ -0,0 +1,146 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+# Collapsed stacks are the input format of flamegraph.pl and speedscope:
+#   https://github.com/brendangregg/FlameGraph
+
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+# Maximum time in seconds to wait for a thread to stop its profiler
+STOP_TIMEOUT = 5
+# From Python 3.12, cProfile is built on sys.monitoring: a profiler sees every
+# thread, and only one may be enabled at a time.
+GLOBAL_PROFILER = sys.version_info >= (3, 12)
+
+
+class Profiler:
+
+    def __init__(self, directory: str, interval: float = 0.005):
+        """
+        Captures a profile of the running bridge for a fixed time, on demand.
+        Before Python 3.12, each thread given to start() runs its own cProfile
+        profiler, as cProfile only sees the thread which enabled it; from 3.12
+        a single profiler covers every thread. Every thread is also sampled
+        for a collapsed-stack file. Nothing runs between captures. If another
+        profiler is already active, only the samples are captured.
+        :param directory: Folder the .pstats and .folded files are written to.
+        :param interval: Time in seconds between stack samples.
+        """
+        self.directory = directory
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def active(self) -> bool:
+        """
+        :return: True while a capture is running.
+        """
+        return self._thread is not None
+
+    def start(self, seconds: float, runners: Dict[str, callable]) -> Optional[str]:
+        """
+        Start a capture in the background.
+        :param seconds: Duration of the capture.
+        :param runners: {thread name: function which runs a callable on that thread}, e.g.
+        {"main": GLib.idle_add}. The threads are profiled with cProfile.
+        :return: The path of the output files, without extension, or None if a capture is already running.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return None
+            base = os.path.join(os.path.expanduser(self.directory),
+                                time.strftime("tidal-chrome-%Y%m%d-%H%M%S"))
+            self._thread = threading.Thread(target=self.__capture, args=(seconds, runners, base),
+                                            name="profiler", daemon=True)
+            self._thread.start()
+        return base
+
+    def __capture(self, seconds: float, runners: Dict[str, callable], base: str):
+        try:
+            if GLOBAL_PROFILER:
+                runners = {"all": _run_here}
+            profiles = {}
+            for name, run in runners.items():
+                p = cProfile.Profile()
+                try:
+                    run(p.enable)
+                except ValueError as e:
+                    # e.g. "Another profiling tool is already active"
+                    print("Profiler: cannot profile the %s thread, so only stack samples are captured: %s" % (name, e))
+                    continue
+                profiles[name] = p
+
+            stacks = self.__sample(seconds)
+
+            stopped = []
+            for name, p in profiles.items():
+                done = threading.Event()
+
+                def stop(p=p, done=done):
+                    try:
+                        p.disable()
+                    finally:
+                        done.set()
+
+                runners[name](stop)
+                stopped.append((name, p, done))
+
+            stats = None
+            for name, p, done in stopped:
+                if not done.wait(STOP_TIMEOUT):
+                    print("Profiler: the %s thread did not respond, so it is left out" % name)
+                    continue
+                try:
+                    if stats is None:
+                        stats = pstats.Stats(p)
+                    else:
+                        stats.add(p)
+                except TypeError:
+                    # The profiler was never enabled, e.g. its thread failed to start it
+                    print("Profiler: no profile from the %s thread" % name)
+
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            if stats is not None:
+                stats.dump_stats(base + ".pstats")
+            with open(base + ".folded", "w") as f:
+                for stack, n in sorted(stacks.items()):
+                    f.write("%s %d\n" % (stack, n))
+            print("Profile written to %s.pstats and %s.folded" % (base, base))
+        except Exception as e:
+            print("Error capturing profile: ", e)
+        finally:
+            with self._lock:
+                self._thread = None
+
+    def __sample(self, seconds: float) -> Counter:
+        own = threading.get_ident()
+        stacks = Counter()
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append("%s:%s:%d" % (os.path.basename(code.co_filename), code.co_name,
+                                                code.co_firstlineno))
+                    frame = frame.f_back
+                frames.append(names.get(ident, str(ident)))
+                stacks[";".join(reversed(frames))] += 1
+            time.sleep(self.interval)
+        return stacks
+
+
+def _run_here(fn: callable) -> None:
+    fn()
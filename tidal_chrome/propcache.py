@@ -0,0 +1,100 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import threading
+import time
+from typing import Iterable, Optional
+
+
+class PropertyCache:
+
+    def __init__(self, max_age: dict, refresh: callable, dispatch: callable):
+        """
+        Tracks when each cached property was last read from the browser, so
+        that Get and GetAll are answered from the cache while it is fresh and
+        wait for a refresh once a value is older than its bound. A single
+        refresh is shared by every read made while it is pending.
+        :param max_age: {property name: maximum age in seconds}. Properties
+        which are not listed never go stale.
+        :param refresh: Called to start a refresh, e.g. to wake the tick thread.
+        The owner calls refreshed() once it has finished.
+        :param dispatch: Function used to run the waiting replies on the main loop, e.g. GLib.idle_add.
+        """
+        self.max_age = max_age
+        self._refresh = refresh
+        self._dispatch = dispatch
+        self._lock = threading.Lock()
+        # name: monotonic time of the last refresh
+        self._stamps = {}
+        self._waiters = []
+        # Reads served from the cache, reads which started a refresh and reads which waited for a pending one
+        self.hits = 0
+        self.refreshes = 0
+        self.joined = 0
+
+    @property
+    def pending(self) -> bool:
+        """
+        :return: True if reads are waiting for a refresh.
+        """
+        return len(self._waiters) > 0
+
+    def mark(self, names: Iterable[str]) -> None:
+        """
+        Record that properties have just been read from the browser.
+        :param names: The property names.
+        :return: Nothing
+        """
+        now = time.monotonic()
+        with self._lock:
+            for name in names:
+                self._stamps[name] = now
+
+    def stale(self, names: Iterable[str], now: Optional[float] = None) -> bool:
+        """
+        :param names: The property names.
+        :return: True if any of the properties is older than its bound.
+        """
+        if now is None:
+            now = time.monotonic()
+        for name in names:
+            bound = self.max_age.get(name)
+            if bound is not None and now - self._stamps.get(name, float("-inf")) > bound:
+                return True
+        return False
+
+    def read(self, names: Iterable[str], reply: callable) -> None:
+        """
+        Call reply once the properties are fresh: immediately if they already
+        are, otherwise after the next refresh.
+        :param names: The property names to be read.
+        :param reply: Function taking no arguments which reads and returns the properties.
+        :return: Nothing
+        """
+        with self._lock:
+            if not self.stale(names):
+                self.hits += 1
+                start = None
+            else:
+                start = not self._waiters
+                self._waiters.append(reply)
+                if start:
+                    self.refreshes += 1
+                else:
+                    self.joined += 1
+        if start is None:
+            reply()
+        elif start:
+            self._refresh()
+
+    def refreshed(self) -> None:
+        """
+        Reply to the reads waiting for the refresh, whether or not it
+        succeeded; on failure they are answered from the cache.
+        :return: Nothing
+        """
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for reply in waiters:
+            self._dispatch(reply)
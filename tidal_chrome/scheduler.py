@@ -0,0 +1,62 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+from typing import Optional
+
+
+class TickScheduler:
+
+    def __init__(self, prefs=None):
+        """
+        Decides how long the update thread sleeps between ticks, based on the
+        playback state, the predicted end of the current track and recent
+        errors.
+        """
+        if not prefs:
+            from . import preferences
+            prefs = preferences.Preferences(True)
+        self.prefs = prefs
+        self.errors = 0
+
+    def next_delay(self, playback_status: str, remaining: Optional[int] = None, rate: float = 1.0) -> float:
+        """
+        Gets the delay before the next tick after a successful tick.
+        :param playback_status: The MPRIS PlaybackStatus ("Playing", "Paused" or "Stopped").
+        :param remaining: Time left in the current track in microseconds, if known.
+        :param rate: The playback rate.
+        :return: The delay in seconds.
+        """
+        self.succeeded()
+        v = self.prefs.values
+        if playback_status == "Playing":
+            delay = v["tick_interval_playing"]
+            if remaining is not None and remaining >= 0 and rate > 0:
+                # Wake just after the track should end, so that the new
+                # metadata is picked up at the boundary
+                delay = min(delay, remaining / 1000000 / rate + v["tick_track_end_margin"])
+            return delay
+        if playback_status == "Paused":
+            return v["tick_interval_paused"]
+        return v["tick_interval_stopped"]
+
+    def succeeded(self) -> None:
+        """
+        Record a successful tick, so that the next error starts the backoff
+        again from the shortest delay.
+        :return: Nothing
+        """
+        self.errors = 0
+
+    def error_delay(self) -> float:
+        """
+        Gets the delay before the next tick after a failed tick. The delay
+        doubles with each consecutive error, up to tick_error_backoff_max.
+        :return: The delay in seconds.
+        """
+        v = self.prefs.values
+        delay = v["tick_interval_playing"] * 2 ** self.errors
+        if delay >= v["tick_error_backoff_max"]:
+            return v["tick_error_backoff_max"]
+        self.errors += 1
+        return delay
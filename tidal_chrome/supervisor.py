@@ -0,0 +1,129 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+import re
+import time
+import traceback
+from typing import NamedTuple, Optional
+
+from .executor import DriverExecutor, PRIORITY_USER
+from .metrics import Metrics
+
+# Parts of WebDriver error messages meaning that the browser session is lost. A
+# window closed by the user (WINDOW_CLOSED) quits the bridge instead.
+SESSION_LOST = ("chrome not reachable", "invalid session id")
+WINDOW_CLOSED = "window already closed"
+
+
+class Checkpoint(NamedTuple):
+    """
+    The playback state to restore after the browser is restarted.
+    """
+    href: str
+    track_id: str
+    # Microseconds
+    position: int
+    shuffle: Optional[bool]
+    playing: bool
+
+
+class Supervisor:
+
+    def __init__(self, executor: DriverExecutor, factory: callable, metrics: Metrics, max_attempts: int = 3,
+                 startup_timeout: float = 30):
+        """
+        Restarts the browser when its session is lost, and restores the last
+        checkpoint of the playback state. The MPRIS object, and so the bus
+        name, stay in place; commands received meanwhile queue on the executor
+        and run on the new browser.
+        :param executor: The executor owning the driver.
+        :param factory: Function taking no arguments and returning a new driver.
+        :param metrics: Registry for the restart count and recovery time.
+        :param max_attempts: Number of times to try starting the browser before giving up.
+        :param startup_timeout: Maximum time in seconds to wait for the player to load.
+        """
+        self._executor = executor
+        self._factory = factory
+        self._metrics = metrics
+        self.max_attempts = max_attempts
+        self.startup_timeout = startup_timeout
+        self.checkpoint = None
+
+    def update(self, state) -> None:
+        """
+        Record a checkpoint from a player snapshot.
+        :param state: A tidal_chrome_driver.PlayerState.
+        :return: Nothing
+        """
+        if state.can_play and state.href:
+            self.checkpoint = Checkpoint(state.href, state.track_id, state.progress, state.shuffle, state.is_playing)
+
+    def restart(self, driver, install: callable):
+        """
+        Start a new browser in place of one whose session was lost. Blocks
+        until the player has loaded and the checkpoint is restored, so must
+        not be called from the main loop or the executor.
+        :param driver: The old driver, which is quit.
+        :param install: Called on the executor with the new driver, before any command queued meanwhile runs.
+        :return: The new driver, or None if the browser could not be started.
+        """
+        start = time.monotonic()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                new = self._executor.call(self.__start, driver, install, priority=PRIORITY_USER)
+            except Exception:
+                print("Could not restart the browser: ", traceback.format_exc())
+                new = None
+            driver = None
+            if new is not None:
+                self._metrics.inc("browser_restarts_total", {"result": "ok"})
+                self._metrics.observe("browser_recovery_seconds", time.monotonic() - start)
+                print("Browser restarted in %.1fs" % (time.monotonic() - start))
+                return new
+            self._metrics.inc("browser_restarts_total", {"result": "failed"})
+            if attempt < self.max_attempts:
+                time.sleep(min(2 ** attempt, 30))
+        return None
+
+    def __start(self, old, install: callable):
+        # Runs on the executor
+        if old is not None:
+            try:
+                old.quit()
+            except Exception as e:
+                # The browser is already gone
+                print("Error quitting the lost browser: ", e)
+        driver = self._factory()
+        if not driver.wait_until_ready(self.startup_timeout):
+            print("The TIDAL player did not load within %d seconds" % self.startup_timeout)
+            try:
+                driver.quit()
+            except Exception:
+                pass
+            return None
+        install(driver)
+        if self.checkpoint is not None:
+            self.__restore(driver, self.checkpoint)
+        return driver
+
+    @staticmethod
+    def __restore(driver, checkpoint: Checkpoint) -> None:
+        # The footer link is e.g. "/album/1/track/2". The play queue panel is
+        # not rendered after a restart, so the track is started from its row
+        # in the album or playlist page.
+        m = re.match(r'(/(?:album|playlist|mix)/[^/]+)', checkpoint.href)
+        if m is None or not driver.play_page(m.group(1), checkpoint.track_id):
+            print("Could not restore playback of " + checkpoint.href)
+            return
+        if checkpoint.shuffle is not None and driver.snapshot().shuffle != checkpoint.shuffle:
+            driver.toggle_shuffle()
+        state = driver.snapshot()
+        if state.track_id != checkpoint.track_id:
+            # e.g. the track is not in the part of a long playlist rendered in the page
+            print("Restored %s from track %s instead of %s, so the position is not restored" % (
+                m.group(1), state.track_id, checkpoint.track_id))
+        elif state.duration:
+            driver.set_position(checkpoint.position, state.duration)
+        if not checkpoint.playing:
+            driver.pause()
@@ -2,291 +2,947 @@
 # Author: SERVCUBED 2018-
 # License: AGPL
 
-import os
-from typing import Optional, Union
-
-from selenium.webdriver import Chrome, ChromeOptions, ActionChains
-from selenium.webdriver.common.keys import Keys
-
-
+import base64
+import functools
+import hashlib
+import re
+import time
+from typing import List, NamedTuple, Optional, Tuple, Union
+
+from selenium.common.exceptions import StaleElementReferenceException, WebDriverException
+
+from .backends import create_backend
+from .locators import LOCATORS, ElementCache
+from .metrics import Metrics, instrument
+from .playlists import Playlist, PlaylistIndex
+
+# Number of lookups of uncached elements after which every element handle is
+# released, so that the browser can free them
+RELEASE_AFTER_LOOKUPS = 50
+
+# Finds TIDAL's underlying HTMLMediaElement, which has the precise playback
+# state. Prepended to the scripts which use it.
+MEDIA_FUNCTION = """
+function media() {
+    var a = document.querySelectorAll('video, audio');
+    for (var i = 0; i < a.length; i++) if (a[i].currentSrc || a[i].src) return a[i];
+    return null;
+}
+"""
+
+# Collects every value needed by an MPRIS update tick in a single script
+# execution, rather than one find_elements/get_property exchange per value.
+SNAPSHOT_SCRIPT = MEDIA_FUNCTION + """
+function x(p) {
+    return document.evaluate(p, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+var p = x(arguments[0]);
+if (!p) return null;
+var r = {can_play: p.className.indexOf('hasPlayer') >= 0, artists: []};
+var e = x(arguments[1]);
+r.playing = !!e && e.title === 'Pause';
+e = x(arguments[2]);
+r.shuffle = e ? e.getAttribute('aria-checked') === 'true' : null;
+e = x(arguments[3]);
+r.title = e ? e.innerHTML : '';
+r.href = e && e.parentNode.getAttribute('href') || '';
+var a = document.evaluate(arguments[4], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+for (var i = 0; i < a.snapshotLength; i++) r.artists.push(a.snapshotItem(i).title);
+e = x(arguments[5]);
+r.image = e && e.srcset ? e.srcset : '';
+e = x(arguments[6]);
+r.progress = e ? e.innerHTML : '';
+e = x(arguments[7]);
+r.duration = e ? e.innerHTML : '';
+e = x(arguments[8]);
+r.next_image = e && e.srcset ? e.srcset : '';
+r.route = location.pathname;
+var m = media();
+if (m && isFinite(m.duration)) {
+    r.media = {time: m.currentTime, duration: m.duration, paused: m.paused, volume: m.volume, rate: m.playbackRate};
+}
+return r;
+"""
+
+# Each completes with false if there is no media element.
+SEEK_SCRIPT = MEDIA_FUNCTION + """
+var m = media();
+if (!m) return false;
+m.currentTime = arguments[0];
+return true;
+"""
+
+SET_MEDIA_PROPERTY_SCRIPT = MEDIA_FUNCTION + """
+var m = media();
+if (!m) return false;
+m[arguments[0]] = arguments[1];
+return true;
+"""
+
+
+# Completes with true once the page has loaded and the player footer
+# (arguments[0]) has been rendered, or with false after arguments[1] ms.
+READY_SCRIPT = """
+var xp = arguments[0], limit = arguments[1], done = arguments[arguments.length - 1], start = Date.now();
+function ready() {
+    return document.readyState === 'complete' &&
+        !!document.evaluate(xp, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+(function check() {
+    if (ready()) done(true);
+    else if (Date.now() - start > limit) done(false);
+    else setTimeout(check, 100);
+})();
+"""
+
+# Installs a MutationObserver on the player footer plus media element event
+# listeners. Relevant changes are queued in window.__tidalChrome.queue and wake
+# any pending OBSERVER_WAIT_SCRIPT. Ticking of the progress bar and current time
+# is ignored so that nothing is queued while the state is otherwise unchanged.
+OBSERVER_SCRIPT = """
+if (window.__tidalChrome) return true;
+var p = document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+if (!p) return false;
+var o = window.__tidalChrome = {queue: [], wake: null};
+function push(d) {
+    // Bounded, as nothing may read the queue while no MPRIS client is listening
+    if (o.queue.length < 100) o.queue.push(d);
+    if (o.wake) o.wake();
+}
+new MutationObserver(function (ms) {
+    for (var i = 0; i < ms.length; i++) {
+        var t = ms[i].target;
+        if (t.nodeType !== 1) t = t.parentNode;
+        if (t && t.closest && t.closest('time, [class*="progressBar"]')) continue;
+        push(ms[i].type);
+        return;
+    }
+}).observe(p.parentNode, {subtree: true, childList: true, attributes: true, characterData: true});
+['play', 'pause', 'ended', 'seeked', 'ratechange', 'volumechange', 'durationchange', 'emptied'].forEach(function (n) {
+    document.addEventListener(n, function () { push('media:' + n); }, true);
+});
+return true;
+"""
+
+# Asynchronous script which completes with the queued changes as soon as there
+# are any, with an empty list after the timeout, or with null if the observer
+# is not installed (e.g. after a page reload).
+OBSERVER_WAIT_SCRIPT = """
+var cb = arguments[arguments.length - 1];
+var o = window.__tidalChrome;
+if (!o) return cb(null);
+var timer = null;
+function done() {
+    clearTimeout(timer);
+    // A wait which has been superseded by a newer one must leave the queue
+    // to that waiter
+    if (o.wake !== done) return cb([]);
+    o.wake = null;
+    cb(o.queue.splice(0, o.queue.length));
+}
+o.wake = done;
+if (o.queue.length) return done();
+timer = setTimeout(done, arguments[0]);
+"""
+
+# Completes a pending OBSERVER_WAIT_SCRIPT early, with the changes queued so far.
+OBSERVER_WAKE_SCRIPT = """
+var o = window.__tidalChrome;
+if (o && o.wake) o.wake();
+"""
+
+
+# Reads a resource through the page, so that it is served from the browser's
+# HTTP cache if it has already been loaded. Completes with base64 data or null.
+FETCH_SCRIPT = """
+var cb = arguments[arguments.length - 1];
+fetch(arguments[0], {cache: 'force-cache'}).then(function (r) {
+    if (!r.ok) throw r.status;
+    return r.blob();
+}).then(function (b) {
+    var f = new FileReader();
+    f.onload = function () { cb(f.result.substring(f.result.indexOf(',') + 1)); };
+    f.onerror = function () { cb(null); };
+    f.readAsDataURL(b);
+}).catch(function () { cb(null); });
+"""
+
+# Helpers for the play queue panel, whose rows are found with the XPath
+# passed to rows(). Prepended to the scripts which use them.
+QUEUE_FUNCTIONS = """
+function rows(p) {
+    var a = document.evaluate(p, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null), r = [];
+    for (var i = 0; i < a.snapshotLength; i++) r.push(a.snapshotItem(i));
+    return r;
+}
+function rowId(r) {
+    var id = r.getAttribute('data-track-id');
+    if (id) return id;
+    var a = r.querySelector('a[href*="/track/"]'), m = a && /track\\/(\\d+)/.exec(a.getAttribute('href'));
+    return m ? m[1] : null;
+}
+"""
+
+# Gets the track ids of the play queue rows, in order, or null if the queue
+# panel (arguments[0]) is not rendered.
+QUEUE_SCRIPT = QUEUE_FUNCTIONS + """
+if (!document.evaluate(arguments[0], document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue)
+    return null;
+var r = rows(arguments[1]), ids = [];
+for (var i = 0; i < r.length; i++) {
+    var id = rowId(r[i]);
+    if (id) ids.push(id);
+}
+return ids;
+"""
+
+# Reads the metadata of the queue rows with the given track ids (arguments[1])
+# in a single execution. Tracks which are not in the queue are left out.
+QUEUE_METADATA_SCRIPT = QUEUE_FUNCTIONS + """
+var want = {}, r = rows(arguments[0]), out = [];
+for (var i = 0; i < arguments[1].length; i++) want[arguments[1][i]] = true;
+for (var i = 0; i < r.length; i++) {
+    var id = rowId(r[i]);
+    if (!id || !want[id]) continue;
+    delete want[id];
+    var t = r[i].querySelector('a[href*="/track/"]'), img = r[i].querySelector('img'),
+        d = r[i].querySelector('time, [data-test="duration"]'), artists = [];
+    var a = r[i].querySelectorAll('a[href*="/artist/"]');
+    for (var j = 0; j < a.length; j++) artists.push(a[j].textContent);
+    out.push({id: id, title: t ? t.textContent : '', artists: artists,
+              image: img ? img.srcset || img.src : '', duration: d ? d.textContent : ''});
+}
+return out;
+"""
+
+# Plays the given occurrence (arguments[2]) of a track id (arguments[1]) in the
+# play queue by double-clicking its row. Returns false if it is not found.
+GOTO_SCRIPT = QUEUE_FUNCTIONS + """
+var r = rows(arguments[0]), n = arguments[2];
+for (var i = 0; i < r.length; i++) {
+    if (rowId(r[i]) !== arguments[1] || n-- > 0) continue;
+    r[i].dispatchEvent(new MouseEvent('dblclick', {bubbles: true, cancelable: true, view: window}));
+    return true;
+}
+return false;
+"""
+
+# Asynchronous script which opens the context menu of a track shown anywhere in
+# the page (arguments[0]) and clicks a menu item (arguments[1], e.g.
+# "play-next"). Waits up to arguments[2] ms for the track to be shown, e.g.
+# while its page loads. Completes with false if the track or item is not found.
+ADD_TRACK_SCRIPT = """
+var id = arguments[0], item = arguments[1], wait = arguments[2], done = arguments[arguments.length - 1];
+var start = Date.now(), menu = 0;
+(function check() {
+    if (!menu) {
+        var a = document.querySelector('a[href$="/track/' + id + '"]');
+        if (a) {
+            (a.closest('[data-test="tracklist-row"]') || a).dispatchEvent(
+                new MouseEvent('contextmenu', {bubbles: true, cancelable: true, view: window}));
+            menu = Date.now();
+        } else if (Date.now() - start > wait) return done(false);
+    } else {
+        var b = document.querySelector('[data-test="contextmenu"] [data-test="' + item + '"]');
+        if (b) {
+            b.click();
+            return done(true);
+        }
+        if (Date.now() - menu > 2000) return done(false);
+    }
+    setTimeout(check, 50);
+})();
+"""
+
+# Lists the playlists linked from the sidebar (arguments[0]) as
+# [id, name, image] in order.
+PLAYLISTS_SCRIPT = """
+var a = document.evaluate(arguments[0], document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null),
+    r = [], seen = {};
+for (var i = 0; i < a.snapshotLength; i++) {
+    var e = a.snapshotItem(i), m = /playlist\\/([0-9a-fA-F-]+)/.exec(e.getAttribute('href'));
+    if (!m || seen[m[1]]) continue;
+    seen[m[1]] = true;
+    var img = e.querySelector('img');
+    r.push([m[1], (e.getAttribute('title') || e.textContent).trim(), img ? img.src : '']);
+}
+return r;
+"""
+
+# Whether an element is laid out and has finished fading in.
+VISIBLE_SCRIPT = """
+var r = arguments[0].getBoundingClientRect();
+return r.width > 0 && r.height > 0 && getComputedStyle(arguments[0]).opacity === '1';
+"""
+
+
+class PlayerState(NamedTuple):
+    """
+    State of the TIDAL player at the time of a Driver.snapshot() call.
+    Times are in microseconds. If precise is True, the times, is_playing,
+    volume and rate were read from the media element; otherwise the times
+    come from the one-second resolution text of the player footer.
+    """
+    can_play: bool = False
+    is_playing: bool = False
+    title: str = ''
+    artists: Tuple[str, ...] = ()
+    image: str = ''
+    progress: int = 0
+    duration: int = 0
+    shuffle: Optional[bool] = None
+    next_image: str = ''
+    track_id: str = ''
+    precise: bool = False
+    volume: float = 1.0
+    rate: float = 1.0
+    href: str = ''
+
+
+def _parse_time(t: str) -> int:
+    """
+    Converts a "m:ss" or "h:mm:ss" time string to microseconds.
+    :param t: The time string.
+    :return: The time in microseconds, or 0 if the string cannot be parsed.
+    """
+    parts = t.strip().split(":")
+    # int() would also take signs, e.g. a "-0:42" remaining time
+    if len(parts) > 3 or not all(p.isdigit() for p in parts):
+        return 0
+    s = 0
+    for part in parts:
+        s = s * 60 + int(part)
+    return s * 1000000  # Microseconds
+
+
+def _parse_srcset(t: str) -> str:
+    """
+    Gets the URL of the largest image in a srcset attribute.
+    :param t: The srcset string.
+    :return: The image URL, or an empty string.
+    """
+    return t.split(',')[-1].split()[0] if t else ''
+
+
+def _parse_track_id(href: str, title: str, artists: list) -> str:
+    """
+    Gets a stable identifier for the current track, usable in a D-Bus object
+    path. This is the TIDAL track id from the footer link (e.g.
+    "/album/1/track/2"), or a hash of the title and artists if there is none.
+    :param href: The footer track link.
+    :param title: The track title.
+    :param artists: The track artists.
+    :return: The track identifier.
+    """
+    m = re.search(r'track/(\d+)', href)
+    if m:
+        return m.group(1)
+    return "h" + hashlib.sha1("\n".join([title] + list(artists)).encode("UTF-8")).hexdigest()
+
+
+def _revalidate(f: callable) -> callable:
+    """
+    Decorator for Driver methods using cached elements. If an element has gone
+    stale, the element cache is dropped and the method is retried once.
+    """
+    @functools.wraps(f)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return f(self, *args, **kwargs)
+        except StaleElementReferenceException:
+            self.element_cache.invalidate()
+            return f(self, *args, **kwargs)
+    return wrapper
+
+
+@instrument
 class Driver:
 
-    def __init__(self, prefs=None, errorhandler: Optional[callable] = None):
+    def __init__(self, prefs=None, errorhandler: Optional[callable] = None, backend=None,
+                 metrics: Optional[Metrics] = None):
         """
         Creates a new instance of the TIDAL-Chrome driver, opens a browser
         window and navigates to TIDAL.
 
         The browser's data directory is (by default) set to:
             ~/.config/tidal-google-chrome/
+
+        :param backend: A connected backends.Backend to use instead of
+        starting the one selected in the preferences.
+        :param metrics: The Metrics to record the latency of every public
+        method and element lookup failures in.
         """
 
-        self.__errorhandler = errorhandler
+        self.metrics = metrics if metrics is not None else Metrics()
+
+        def on_error(err: str):
+            self.metrics.inc("driver_not_found_total", {"call": err.split(":")[0]})
+            if errorhandler is not None:
+                errorhandler(err)
+
+        self.__errorhandler = on_error
 
         if not prefs:
             from . import preferences
             prefs = preferences.Preferences(True)
 
-        chrome_options = ChromeOptions()
-        chrome_options.add_argument("--disable-sync")
-        chrome_options.add_argument("--no-first-run")
-        chrome_options.add_argument("--disable-default-apps")
-        chrome_options.add_argument("--user-data-dir=" +
-                                    os.path.expanduser(
-                                        prefs.values["profile_path"]))
-        chrome_options.add_argument("--disable-features=MediaSessionService")
-        chrome_options.add_argument("--app=https://listen.tidal.com/")
-        if prefs.values["enable_kiosk_mode"]:
-            chrome_options.add_argument("--kiosk")
-
-        if prefs.values["chrome_binary_path"] is not None:
-            chrome_options.binary_location = prefs.values["chrome_binary_path"]
-
-        print("Starting webdriver")
-        self._driver = Chrome(prefs.values["chromedriver_binary_path"], options=chrome_options)
+        self._backend = backend if backend is not None else create_backend(prefs)
+        self._persistent = prefs.values["persistent_browser"]
 
         self.useShuffleAsCurFavourite = prefs.values["use_shuffle_as_cur_favourite"]
-        self._shuffleXPath = '//button[@data-test="footer-favorite-button"]' \
-            if self.useShuffleAsCurFavourite else \
-            '//div[@data-test="play-controls"]/button[@title="Shuffle"]'
-
-        print("Waiting for load")
-        self._driver.implicitly_wait(10)
+        self._shuffleLocator = "favourite" if self.useShuffleAsCurFavourite else "shuffle"
+        # name: [calls, total seconds, maximum seconds]
+        self.wait_stats = {}
+        self.element_cache = ElementCache(self.__release_elements)
+        # Lookups of uncached elements since the handles were last released
+        self._lookups = 0
+        self.playlists = PlaylistIndex()
+        self.metrics.add_collector(self.__collect_metrics)
 
         print("Started")
 
     def __del__(self):
-        self.quit()
+        if self._persistent:
+            self.detach()
+        else:
+            self.quit()
+
+    def __collect_metrics(self) -> list:
+        c = self.element_cache
+        values = [("element_cache_hits_total", None, c.hits),
+                  ("element_cache_misses_total", None, c.misses),
+                  ("element_cache_invalidations_total", None, c.invalidations)]
+        for name, (calls, total, longest) in list(self.wait_stats.items()):
+            values += [("locator_waits_total", {"locator": name}, calls),
+                       ("locator_wait_seconds_total", {"locator": name}, total),
+                       ("locator_wait_seconds_max", {"locator": name}, longest)]
+        return values
+
+    def _find(self, name: str, *args) -> list:
+        """
+        Find the elements matching a registered locator, waiting for at most
+        the locator's wait time for them to appear. The time spent is recorded
+        in wait_stats.
+        :param name: The LOCATORS key.
+        :param args: Arguments for a parameterised locator.
+        :return: A list of the matching elements, which may be empty.
+        """
+        loc = LOCATORS[name]
+        if args:
+            loc = loc.format(*args)
+        if loc.cache:
+            el = self.element_cache.get((name,) + args)
+            if el is not None:
+                return el
+        start = time.monotonic()
+        el = self._backend.find_elements(loc.xpath)
+        while not el and time.monotonic() - start < loc.wait:
+            time.sleep(0.05)
+            el = self._backend.find_elements(loc.xpath)
+        t = time.monotonic() - start
+        s = self.wait_stats.setdefault(name, [0, 0.0, 0.0])
+        s[0] += 1
+        s[1] += t
+        s[2] = max(s[2], t)
+        if loc.cache:
+            self.element_cache.put((name,) + args, el)
+        else:
+            self._lookups += 1
+        return el
+
+    def __release_elements(self):
+        self._lookups = 0
+        self._backend.release_elements()
+
+    def snapshot(self) -> PlayerState:
+        """
+        Gets the full player state needed by an MPRIS update in a single
+        script execution.
+        :return: A PlayerState. All fields are defaults if the player is not loaded.
+        """
+        if self._lookups >= RELEASE_AFTER_LOOKUPS:
+            # No element handle is in use between Driver calls
+            self.element_cache.invalidate()
+        r = self._backend.execute(SNAPSHOT_SCRIPT, *[LOCATORS[x].xpath for x in (
+            "player", "play_button", self._shuffleLocator, "track_title", "track_artists", "track_image",
+            "current_time", "duration_time", "queue_next_image")])
+        if not r:
+            self.__errorhandler('snapshot')
+            return PlayerState()
+        self.element_cache.set_route(r["route"])
+        state = PlayerState(can_play=r["can_play"],
+                            is_playing=r["playing"],
+                            title=r["title"],
+                            artists=tuple(r["artists"]),
+                            image=_parse_srcset(r["image"]),
+                            progress=_parse_time(r["progress"]),
+                            duration=_parse_time(r["duration"]),
+                            shuffle=r["shuffle"],
+                            next_image=_parse_srcset(r["next_image"]),
+                            track_id=_parse_track_id(r["href"], r["title"], r["artists"]),
+                            href=r["href"])
+        m = r.get("media")
+        if m:
+            state = state._replace(is_playing=not m["paused"],
+                                   progress=int(m["time"] * 1000000),
+                                   duration=int(m["duration"] * 1000000),
+                                   precise=True,
+                                   volume=m["volume"],
+                                   rate=m["rate"])
+        return state
+
+    def wait_until_ready(self, timeout: float = 30) -> bool:
+        """
+        Wait for the TIDAL player to be loaded in the page.
+        :param timeout: Maximum time to wait in seconds.
+        :return: True if the player is ready, False if it did not load in time.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                return bool(self._backend.execute_async(READY_SCRIPT, LOCATORS["player"].xpath,
+                                                        int(remaining * 1000), timeout=remaining + 1))
+            except WebDriverException:
+                # The page navigated while the script was waiting
+                time.sleep(0.1)
+
+    def install_observer(self) -> bool:
+        """
+        Inject the page observer used by wait_for_changes(). Does nothing if it
+        is already installed.
+        :return: True if the observer is installed, False if the player could not be found.
+        """
+        return bool(self._backend.execute(OBSERVER_SCRIPT, LOCATORS["player"].xpath))
+
+    def wait_for_changes(self, timeout: float) -> Optional[list]:
+        """
+        Block until the page observer reports a change to the player state, or
+        until the timeout expires.
+        :param timeout: Maximum time to wait in seconds.
+        :return: A list of the queued changes, which is empty if the timeout expired, or None if the observer is
+        not installed.
+        """
+        return self._backend.execute_async(OBSERVER_WAIT_SCRIPT, int(timeout * 1000), timeout=timeout + 5)
+
+    @property
+    def concurrent_wait(self) -> bool:
+        """
+        :return: True if wait_for_changes() may run on another thread while commands are sent, as with the cdp
+        backend. Otherwise the wait holds the browser session, as chromedriver runs one command at a time.
+        """
+        return self._backend.concurrent
+
+    def wake_observer(self) -> None:
+        """
+        Make a pending wait_for_changes() return now.
+        :return: Nothing
+        """
+        self._backend.execute(OBSERVER_WAKE_SCRIPT)
 
+    def fetch_resource(self, url: str) -> Optional[bytes]:
+        """
+        Fetch a resource through the browser, using its HTTP cache where possible.
+        :param url: The URL to fetch.
+        :return: The resource contents, or None on failure.
+        """
+        r = self._backend.execute_async(FETCH_SCRIPT, url, timeout=10)
+        return base64.b64decode(r) if r else None
+
+    def queue(self) -> Optional[List[str]]:
+        """
+        Get the track ids of the play queue.
+        :return: The track ids in queue order, or None if the play queue panel is not rendered.
+        """
+        return self._backend.execute(QUEUE_SCRIPT, LOCATORS["play_queue"].xpath, LOCATORS["queue_rows"].xpath)
+
+    def queue_metadata(self, track_ids: List[str]) -> List[PlayerState]:
+        """
+        Get the metadata of tracks in the play queue in a single script execution.
+        :param track_ids: The track ids.
+        :return: A PlayerState with the track_id, title, artists, image and
+        duration of each track found in the queue.
+        """
+        r = self._backend.execute(QUEUE_METADATA_SCRIPT, LOCATORS["queue_rows"].xpath, list(track_ids)) or []
+        return [PlayerState(track_id=t["id"],
+                            title=t["title"],
+                            artists=tuple(t["artists"]),
+                            image=_parse_srcset(t["image"]),
+                            duration=_parse_time(t["duration"])) for t in r]
+
+    def go_to(self, track_id: str, occurrence: int = 0) -> bool:
+        """
+        Play a track in the play queue.
+        :param track_id: The track id.
+        :param occurrence: Which occurrence of the track to play, if it is queued more than once.
+        :return: True if the track was found.
+        """
+        if self._backend.execute(GOTO_SCRIPT, LOCATORS["queue_rows"].xpath, track_id, occurrence):
+            return True
+        self.__errorhandler('go_to: ' + track_id)
+        return False
+
+    def add_track(self, track_id: str, play_next: bool = False) -> bool:
+        """
+        Add a track to the play queue, through its context menu. TIDAL only
+        offers the menu on tracks shown in the page, so if the track is not
+        shown, its page is opened first.
+        :param track_id: The track id.
+        :param play_next: If True, queue the track after the current one rather than at the end.
+        :return: True if the track was added.
+        """
+        item = "play-next" if play_next else "add-to-queue"
+        if self._backend.execute_async(ADD_TRACK_SCRIPT, track_id, item, 0, timeout=5):
+            return True
+        if self.__open_page("/track/" + track_id) and \
+                self._backend.execute_async(ADD_TRACK_SCRIPT, track_id, item, 3000, timeout=8):
+            return True
+        self.__errorhandler('add_track: ' + track_id)
+        return False
+
+    @_revalidate
     def can_play(self) -> bool:
         """
         Get whether the player can play, pause, seek.
         :return: True if the player can play, pause, seek
         """
-        t = self._driver.find_elements_by_xpath('//div[@id="wimp"]/div/div/div/div[2]')
+        t = self._find("player")
         if not t:
             self.__errorhandler('can_play')
             return False
-        return "hasPlayer" in ''.join(t[0].get_property("classList"))
+        return "hasPlayer" in (self._backend.get_attribute(t[0], "class") or "")
 
     def play(self) -> None:
         """
         Play the current track.
         :return: Nothing
         """
-        t = self._driver.find_elements_by_xpath('//div[@data-test="play-controls"]/div/button[@title="Play"]')
+        t = self._find("play")
         if not t:
             self.__errorhandler('play')
             return
-        self._driver.execute_script("arguments[0].click();", t[0])
+        self._backend.execute("arguments[0].click();", t[0])
 
     def pause(self) -> None:
         """
         Pause the current track.
         :return: Nothing
         """
-        t = self._driver.find_elements_by_xpath('//div[@data-test="play-controls"]/div/button[@title="Pause"]')
+        t = self._find("pause")
         if not t:
             self.__errorhandler('pause')
             return
-        self._driver.execute_script("arguments[0].click();", t[0])
+        self._backend.execute("arguments[0].click();", t[0])
 
+    @_revalidate
     def play_pause(self) -> Optional[bool]:
         """
         Toggle the playing state for the current track.
         :return: True if track is now playing, false otherwise
         """
-        el = self._driver.find_elements_by_xpath('//div[@data-test="play-controls"]/div/button')
+        el = self._find("play_button")
         if not el:
             self.__errorhandler('play_pause')
             return None
-        el = el[0]
-        self._driver.execute_script("arguments[0].click();", el)
-        return el.get_property("title") == "Pause"
+        # The title only changes once the page has handled the click, so it is read before
+        return self._backend.execute("var playing = arguments[0].title === 'Pause'; arguments[0].click(); "
+                                     "return !playing;", el[0])
 
-    def next(self) -> None:
+    @_revalidate
+    def next(self, count: int = 1) -> None:
         """
         Play the next track, if available.
+        :param count: Number of tracks to skip forward.
         :return: Nothing
         """
-        t = self._driver.find_elements_by_xpath('//div[@data-test="play-controls"]/button[@title="Next"]')
+        t = self._find("next")
         if not t:
-            self.__errorhandler(__name__)
+            self.__errorhandler('next')
             return
-        self._driver.execute_script("arguments[0].click();", t[0])
+        self._backend.execute("for (var i = 0; i < arguments[1]; i++) arguments[0].click();", t[0], count)
 
-    def previous(self) -> None:
+    @_revalidate
+    def previous(self, count: int = 1) -> None:
         """
         Play the previous track, if available.
+        :param count: Number of tracks to skip back.
         :return: Nothing
         """
-        t = self._driver.find_elements_by_xpath('//div[@data-test="play-controls"]/button[@title="Previous"]')
+        t = self._find("previous")
         if not t:
             self.__errorhandler('previous')
             return
-        self._driver.execute_script("arguments[0].click();", t[0])
+        self._backend.execute("for (var i = 0; i < arguments[1]; i++) arguments[0].click();", t[0], count)
 
+    @_revalidate
     def is_playing(self) -> bool:
         """
         Gets whether the player is currently playing.
         :return: True if the player is currently playing.
         """
-        t = self._driver.find_elements_by_xpath('//div[@data-test="play-controls"]/div/button')
-        return t[0].get_property("title") == "Pause" if t else False
+        t = self._find("play_button")
+        return self._backend.get_property(t[0], "title") == "Pause" if t else False
 
+    @_revalidate
     def is_shuffle(self) -> Optional[bool]:
         """
         Gets whether shuffle is currently enabled.
         :return: True if shuffle is currently enabled.
         """
-        t = self._driver.find_elements_by_xpath(self._shuffleXPath)
-        return t[0].get_attribute('aria-checked') == 'true' if t else None
+        t = self._find(self._shuffleLocator)
+        return self._backend.get_attribute(t[0], 'aria-checked') == 'true' if t else None
 
     def is_now_playing_maximised(self) -> bool:
         """
         Gets whether the "Now Playing" section is fullscreen
         :return True if the "Now Playing" section is fullscreen
         """
-        return len(self._driver.find_elements_by_xpath('//section[@id="nowPlaying"]/div/div')) > 1
+        return len(self._find("now_playing")) > 1
 
+    @_revalidate
     def toggle_shuffle(self) -> None:
         """
         Toggle the shuffle status.
         :return: Nothing
         """
 
-        t = self._driver.find_elements_by_xpath(self._shuffleXPath)
+        t = self._find(self._shuffleLocator)
         if not t:
             self.__errorhandler('toggle_shuffle')
             return
-        self._driver.execute_script("arguments[0].click();", t[0])
+        self._backend.execute("arguments[0].click();", t[0])
 
     def current_track_title(self) -> str:
         """
         Gets the current track title.
         :return: String of the current track title.
         """
-        t = self._driver.find_elements_by_xpath('//div[@data-test="footer-track-title"]/a/span')
+        t = self._find("track_title")
         if not t:
             self.__errorhandler('current_track_title')
             return ''
-        return t[0].get_property("innerHTML")
+        return self._backend.get_property(t[0], "innerHTML")
 
     def current_track_artists(self) -> list:
         """
         Gets a list of the current track artists, separated by ", ".
         :return: A string of the current track artists.
         """
-        return [x.get_property("title") for x in
-                self._driver.find_elements_by_xpath('//span[contains(@class,"artist-link")]/a')
-                ]
+        return [self._backend.get_property(x, "title") for x in self._find("track_artists")]
 
     def current_track_image(self) -> str:
         """
         Gets the URL of the album art for the current track.
         :return: A string containing the album art URL.
         """
-        t = self._driver.find_elements_by_xpath('//figure[@data-test="current-media-imagery"]/div/div/div/img')
+        t = self._find("track_image")
         if not t:
             self.__errorhandler('current_track_image')
             return ''
-        t = t[0].get_property("srcset")
+        t = self._backend.get_property(t[0], "srcset")
         if not t:
             self.__errorhandler('current_track_image_srcset')
             return ''
-        return t.split(',')[-1].split()[0]
+        return _parse_srcset(t)
 
     def current_track_progress(self) -> int:
         """
         Gets the progress of the current track in microseconds.
         :return: The current track progress in microseconds.
         """
-        t = self._driver.find_elements_by_xpath('//time[@data-test="current-time"]')
+        t = self._find("current_time")
         if not t:
             self.__errorhandler('current_track_progress')
             return 0
-        t = t[0].get_property("innerHTML").split(":")
-        return (int(t[0]) * 60 + int(t[1])) * 1000000  # Microseconds
+        return _parse_time(self._backend.get_property(t[0], "innerHTML"))
 
     def current_track_duration(self) -> int:
         """
         Gets the duration of the current track in microseconds.
         :return: The current track duration in microseconds.
         """
-        t = self._driver.find_elements_by_xpath('//time[@data-test="duration-time"]')
+        t = self._find("duration_time")
         if not t:
             self.__errorhandler('current_track_duration')
             return 0
-        t = t[0].get_property("innerHTML").split(":")
-        return (int(t[0]) * 60 + int(t[1])) * 1000000  # Microseconds
+        return _parse_time(self._backend.get_property(t[0], "innerHTML"))
 
-    def set_position(self, position) -> None:
+    @_revalidate
+    def set_position(self, position, duration: Optional[int] = None) -> None:
         """
-        Set the current playback position.
+        Set the current playback position. This is done by setting the media
+        element's currentTime, or by clicking the progress bar if there is none.
         :param position: Position to skip to in microseconds. Must be less than
         current_track_duration().
+        :param duration: The current track duration in microseconds, if already known.
         :return: Nothing
         """
-        el = self._driver.find_elements_by_xpath('//div[contains(@class,"progressBarWrapper")]/div/div[contains('
-                                                 '@class,"interactionLayer")]')
+        if self._backend.execute(SEEK_SCRIPT, position / 1000000):
+            return
+
+        el = self._find("progress_bar")
         if not el:
             self.__errorhandler('set_position')
             return
-        clickxpos = position * el[0].size["width"] / self.current_track_duration()
+        if duration is None:
+            duration = self.current_track_duration()
+        if not duration:
+            return
+        clickxpos = position * self._backend.get_size(el[0])["width"] / duration
+        self._backend.click(el[0], clickxpos, 5)
+
+    def set_volume(self, volume: float) -> bool:
+        """
+        Set the playback volume.
+        :param volume: The volume, from 0.0 to 1.0.
+        :return: True if set, False if there is no media element.
+        """
+        return bool(self._backend.execute(SET_MEDIA_PROPERTY_SCRIPT, "volume", volume))
 
-        action = ActionChains(self._driver)
-        action.move_to_element_with_offset(el[0], clickxpos, 5)
-        action.click()
-        action.perform()
+    def set_rate(self, rate: float) -> bool:
+        """
+        Set the playback rate.
+        :param rate: The rate, where 1.0 is normal speed.
+        :return: True if set, False if there is no media element.
+        """
+        return bool(self._backend.execute(SET_MEDIA_PROPERTY_SCRIPT, "playbackRate", rate))
 
+    def update_playlists(self) -> Optional[List[Playlist]]:
+        """
+        Re-read the user's playlists from the sidebar into the playlists index.
+        :return: The known playlists which changed, or None if the sidebar was not found.
+        """
+        r = self._backend.execute(PLAYLISTS_SCRIPT, LOCATORS["sidebar_playlists"].xpath)
+        if not r:
+            return None
+        return self.playlists.update([Playlist(*p) for p in r])
+
+    def _wait_visible(self, element, timeout: float = 1) -> bool:
+        """
+        Wait for an element to be shown, e.g. at the end of an animation.
+        :param timeout: Maximum time to wait in seconds.
+        :return: True if the element is visible.
+        """
+        deadline = time.monotonic() + timeout
+        while not self._backend.execute(VISIBLE_SCRIPT, element):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    @_revalidate
     def add_cur_to_playlist(self, playlist: Union[int, str], duplicateactionadd: Optional[bool] = None) -> None:
         """
-        Adds the currently playing track to the first playlist
-        :param playlist: Set to a string of the exact playlist name to match, or the zero-based index of the playlist
-        in the recent playlists entry. The string name must be exact and an integer index is only advised if you wish 
-        to add to the 0th playlist (the most recent one).
+        Adds the currently playing track to a playlist
+        :param playlist: Set to a playlist name, or the zero-based index of the playlist in the recent playlists
+        entry. Names are resolved through the playlists index, so they may differ in case, and playlists which are
+        not among the recent ones are chosen from the full playlist list. An integer index is only advised if you
+        wish to add to the 0th playlist (the most recent one).
         :param duplicateactionadd: Set to None to do no action when prompted about a duplicate playlist entry. Set
         True to add the track to the playlist anyways, or False to always decline the popup.
         :return: Nothing
         """
-        el = self._driver.find_elements_by_xpath('//button[@data-test="footer-context-menu"]')
+        target = None
+        if isinstance(playlist, str):
+            target = self.playlists.resolve(playlist)
+            if target is None and self.update_playlists() is not None:
+                target = self.playlists.resolve(playlist)
+
+        el = self._find("context_menu_button")
         if not el:
             self.__errorhandler('add_cur_to_playlist: ' + str(playlist))
             return
-        ActionChains(self._driver).click(el[0]).perform()
+        self._backend.click(el[0])
 
-        el = self._driver.find_elements_by_xpath('//div[@data-test="contextmenu"]/ul/li[1]')
+        el = self._find("context_menu_add")
         if not el:
             self.__errorhandler('add_cur_to_playlist_2: ' + str(playlist))
             return
-        ActionChains(self._driver).move_to_element_with_offset(el[0], 2, 2).pause(0.3).perform()
-
-        if isinstance(playlist, int):
-            el = self._driver.find_elements_by_xpath('//div[@data-type="contextmenu-open"]/div/button['
-                                                     '@data-test="sub-menu-item-recent-playlist-'+str(playlist)+'"]')
-        else:
-            el = self._driver.find_elements_by_xpath('//div[@data-type="contextmenu-open"]/div['
-                                                     '@data-track--icon-clicked="'+str(playlist)+'"]/button')
+        self._backend.hover(el[0], 2, 2)
+
+        # The submenu is open once its first entry is shown
+        el = self._find("recent_playlist", 0)
+        if el and isinstance(playlist, int):
+            el = self._find("recent_playlist", playlist)
+        elif el:
+            el = self._find("named_playlist", target.name if target is not None else playlist)
+            if not el and target is not None:
+                # Not one of the recent playlists
+                el = self._find("all_playlists")
+                if el:
+                    self._backend.click(el[0])
+                    el = self._find("modal_playlist", target.id)
         if not el:
             self.__errorhandler('add_cur_to_playlist_3: ' + str(playlist))
+            self._backend.press_escape()
             return
-        ActionChains(self._driver).click(el[0]).perform()
+        self._backend.click(el[0])
 
         if duplicateactionadd is None:
             return
 
-        el = self._driver.find_elements_by_xpath('//div[@class="ReactModalPortal"]/div/div/div/div/button')
+        el = self._find("duplicate_modal_buttons")
         if not el or len(el) < 2:
             # No duplicate entry modal, ignore
             return
-        ActionChains(self._driver).pause(0.3).click(el[int(duplicateactionadd)]).perform()
+        el = el[int(duplicateactionadd)]
+        self._wait_visible(el)
+        self._backend.click(el)
+
+    def play_playlist(self, playlist: Playlist) -> None:
+        """
+        Open a playlist and play it from the start.
+        :param playlist: The playlist.
+        :return: Nothing
+        """
+        if not self.play_page("/playlist/" + playlist.id):
+            self.__errorhandler('play_playlist: ' + playlist.name)
+
+    @_revalidate
+    def play_page(self, path: str, track_id: Optional[str] = None) -> bool:
+        """
+        Open an album or playlist page and play it, from a given track if it is listed.
+        :param path: The page path, e.g. "/album/1".
+        :param track_id: The track to start from, or None to play the page from the start. If the track is not
+        listed (e.g. it is further down a long playlist), the page is played from the start.
+        :return: True if playback was started.
+        """
+        # Wait for the route to change, so that the previous page's rows or button are not clicked
+        self.__open_page(path)
+        if track_id is not None and self._find("page_rows") and \
+                self._backend.execute(GOTO_SCRIPT, LOCATORS["page_rows"].xpath, track_id, 0):
+            return True
+        el = self._find("play_all")
+        if not el:
+            return False
+        self._backend.click(el[0])
+        return True
+
+    def __open_page(self, path: str, timeout: float = 2) -> bool:
+        """
+        Open a page of the web player and wait for its route to change.
+        :param path: The page path, e.g. "/track/1".
+        :param timeout: Maximum time to wait in seconds.
+        :return: True if the route changed in time.
+        """
+        self.open_uri("tidal:/" + path)
+        deadline = time.monotonic() + timeout
+        while path not in self._backend.execute("return location.pathname;"):
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
 
     def raise_window(self) -> None:
         """
         Sets focus to the browser window.
         :return: Nothing
         """
-        self._driver.switch_to.window(self._driver.current_window_handle)
+        self._backend.raise_window()
 
+    @_revalidate
     def set_fullscreen(self, value) -> None:
         """
         Set the window to fullscreen and maximise the player.
@@ -297,15 +953,16 @@ class Driver:
         if value:
             # self._driver.fullscreen_window()
             self.set_now_playing_maximised(True)
-            t = self._driver.find_elements_by_xpath('//button[@data-test="fullscreen"]')
+            t = self._find("fullscreen")
             if not t:
                 self.__errorhandler('set_fullscreen')
                 return
-            self._driver.execute_script("arguments[0].click();", t[0])
+            self._backend.execute("arguments[0].click();", t[0])
         else:
             # self._driver.maximize_window()
-            ActionChains(self._driver).send_keys(Keys.ESCAPE).perform()
+            self._backend.press_escape()
 
+    @_revalidate
     def set_now_playing_maximised(self, value) -> None:
         """
         Set the window to fullscreen and maximise the player.
@@ -313,11 +970,11 @@ class Driver:
         :return: Nothing
         """
         if value is not self.is_now_playing_maximised():
-            t = self._driver.find_elements_by_xpath('//button[@data-test="toggle-now-playing"]')
+            t = self._find("toggle_now_playing")
             if not t:
                 self.__errorhandler('set_now_playing_maximised')
                 return
-            self._driver.execute_script("arguments[0].click();", t[0])
+            self._backend.execute("arguments[0].click();", t[0])
 
     def open_uri(self, uri) -> None:
         """
@@ -330,18 +987,36 @@ class Driver:
             self.__errorhandler("open_uri: Incorrect URI format")
             return
 
-        el = self._driver.find_elements_by_xpath("//*[@id=\"main\"]//a[1]")
+        el = self._find("main_link")
         if not el:
             self.__errorhandler('open_uri')
             return
         el = el[-1]
-        self._driver.execute_script(
+        self._backend.execute(
             "arguments[0].href=arguments[1];arguments[0].click();", el,
             uri.replace("tidal:/", ""))
+        self.element_cache.invalidate()
+
+    def get(self, url: str) -> None:
+        """
+        Navigate to a URL, reloading the page.
+        :param url: The URL to open.
+        :return: Nothing
+        """
+        self._backend.get(url)
+        self.element_cache.invalidate()
 
     def quit(self) -> None:
         """
         Quit the browser.
         :return: Nothing
         """
-        self._driver.quit()
+        self.metrics.remove_collector(self.__collect_metrics)
+        self._backend.quit()
+
+    def detach(self) -> None:
+        """
+        Disconnect from the browser, leaving it running.
+        :return: Nothing
+        """
+        self._backend.detach()
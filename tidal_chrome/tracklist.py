@@ -0,0 +1,92 @@
+# Part of the Tidal-Chrome MPRIS bridge
+# Author: SERVCUBED 2018-
+# License: AGPL
+
+from typing import List, Optional, Tuple
+
+TRACK_PATH = "/org/mpris/MediaPlayer2/TrackList/"
+NO_TRACK = TRACK_PATH + "NoTrack"
+
+
+def track_path(track_id: str, occurrence: int = 0) -> str:
+    """
+    Gets the MPRIS track id object path of a queue entry. The first
+    occurrence of a track has the same path as in the player Metadata.
+    :param track_id: The TIDAL track id.
+    :param occurrence: The number of earlier entries of the same track in the queue.
+    :return: The object path.
+    """
+    if occurrence == 0:
+        return TRACK_PATH + track_id
+    return "%s%s_%d" % (TRACK_PATH, track_id, occurrence)
+
+
+class TrackIndex:
+
+    def __init__(self, max_changes: int = 20):
+        """
+        The play queue as an ordered list of MPRIS track paths, with a reverse
+        index. Updates are diffed against the previous queue, so that clients
+        are sent the entries which were added and removed rather than the
+        whole list.
+        :param max_changes: Maximum number of added and removed entries to
+        signal individually. Larger changes replace the whole list.
+        """
+        self.max_changes = max_changes
+        self.paths = []
+        # path: (track id, occurrence)
+        self._index = {}
+
+    def __len__(self):
+        return len(self.paths)
+
+    def find(self, path: str) -> Optional[Tuple[str, int]]:
+        """
+        :param path: An MPRIS track path.
+        :return: The track id and its occurrence number, or None if the path is not in the queue.
+        """
+        return self._index.get(path)
+
+    def update(self, track_ids: List[str]) -> Optional[List[tuple]]:
+        """
+        Replace the queue, computing the changes from the previous one.
+
+        The diff is linear in the queue length: if the entries present in both
+        queues are in the same order, the changes are the removed entries and
+        the added ones (each with the entry it follows); otherwise, or if
+        there are more than max_changes, the list is replaced.
+        :param track_ids: The track ids of the new queue, in order.
+        :return: None if the whole list was replaced, otherwise a list of
+        ("removed", path) and ("added", path, after path) changes, in the
+        order in which they must be signalled.
+        """
+        seen = {}
+        paths = []
+        index = {}
+        for track_id in track_ids:
+            n = seen.get(track_id, 0)
+            seen[track_id] = n + 1
+            p = track_path(track_id, n)
+            paths.append(p)
+            index[p] = (track_id, n)
+
+        old = self.paths
+        old_set = set(old)
+        new_set = set(paths)
+        removed = [p for p in old if p not in new_set]
+        added = len(paths) - (len(old) - len(removed))
+
+        self.paths = paths
+        self._index = index
+
+        if len(removed) + added > self.max_changes or \
+                [p for p in old if p in new_set] != [p for p in paths if p in old_set]:
+            return None
+
+        changes = [("removed", p) for p in removed]
+        after = NO_TRACK
+        for p in paths:
+            if p not in old_set:
+                changes.append(("added", p, after))
+            after = p
+        return changes